@@ -0,0 +1,13 @@
+"""
+ASGI配置文件
+用于异步部署（实时座位推送等长连接接口需要ASGI）
+例如：uvicorn backend.asgi:application --workers 4
+"""
+import os
+from django.core.asgi import get_asgi_application
+
+# 设置Django配置模块
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+# 获取ASGI应用
+application = get_asgi_application()
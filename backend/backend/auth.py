@@ -0,0 +1,54 @@
+"""
+接口登录校验
+
+每个接口开头都要从session里取 user_id / user_role。
+login_required(role) 统一做这件事：每个请求只解析一次，结果挂在
+request.user_id / request.user_role 上，视图直接使用。
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+
+
+def get_identity(request):
+    """返回 (user_id, user_role)，未登录返回 (None, None)；同一请求只读一次session"""
+    identity = getattr(request, '_identity', None)
+    if identity is None:
+        identity = request._identity = (
+            request.session.get('user_id'),
+            request.session.get('user_role'),
+        )
+    return identity
+
+
+def _check(request, user_id, user_role, role):
+    if not user_id or user_role != role:
+        return False
+    request.user_id = user_id
+    request.user_role = user_role
+    return True
+
+
+def login_required(role):
+    """要求以指定角色登录，否则返回401（同步、异步视图都可以用）"""
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # session后端可能要访问数据库或缓存，放到线程里读
+                user_id, user_role = await sync_to_async(get_identity)(request)
+                if not _check(request, user_id, user_role, role):
+                    return JsonResponse({'error': '请先登录'}, status=401)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user_id, user_role = get_identity(request)
+            if not _check(request, user_id, user_role, role):
+                return JsonResponse({'error': '请先登录'}, status=401)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
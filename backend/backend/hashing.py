@@ -0,0 +1,93 @@
+"""
+密码哈希
+
+bcrypt 故意很慢，登录高峰时直接在请求线程里算会占满worker的CPU，
+其他请求都排在后面。这里把哈希和校验放到独立的进程池里：
+
+- PASSWORD_HASH_WORKERS     进程池大小，0 表示在当前线程里直接计算（测试用）
+- PASSWORD_HASH_MAX_PENDING 除正在计算的以外最多排队多少个请求
+- PASSWORD_HASH_QUEUE_TIMEOUT 排队等待超时（秒），超时抛出 HashPoolBusy，接口返回503
+- BCRYPT_ROUNDS             bcrypt 工作因子；修改后已有用户在下次登录时自动按新因子重新哈希
+"""
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from django.conf import settings
+
+from .metrics import record_hash
+
+
+class HashPoolBusy(Exception):
+    """哈希进程池排队已满"""
+
+
+def _hash(raw_password, rounds):
+    return bcrypt.hashpw(raw_password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(raw_password, hashed):
+    try:
+        return bcrypt.checkpw(raw_password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # 库里存的不是bcrypt格式的哈希
+        return False
+
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = settings.PASSWORD_HASH_WORKERS
+                _slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASH_MAX_PENDING)
+                _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool, _slots
+
+
+def _run(fn, *args):
+    """执行哈希/校验，耗时（含排队）记入当前请求的统计"""
+    start = time.perf_counter()
+    try:
+        return _submit(fn, *args)
+    finally:
+        record_hash(time.perf_counter() - start)
+
+
+def _submit(fn, *args):
+    if not settings.PASSWORD_HASH_WORKERS:
+        return fn(*args)
+
+    pool, slots = _get_pool()
+    if not slots.acquire(timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT):
+        raise HashPoolBusy('密码校验繁忙，请稍后重试')
+    try:
+        return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(raw_password):
+    """按当前工作因子计算bcrypt哈希"""
+    return _run(_hash, raw_password, settings.BCRYPT_ROUNDS)
+
+
+def check_password(raw_password, hashed):
+    """校验密码"""
+    if not raw_password or not hashed:
+        return False
+    return _run(_check, raw_password, hashed)
+
+
+def needs_rehash(hashed):
+    """已存哈希的工作因子和当前配置不一致时返回True（格式：$2b$12$...）"""
+    try:
+        return int(hashed.split('$')[2]) != settings.BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return True
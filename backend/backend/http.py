@@ -0,0 +1,62 @@
+"""
+异步视图用的HTTP装饰器
+
+Django 4.2 的 require_http_methods / cache_control / condition 只支持同步视图，
+这里是行为相同的异步版本，供 async_views 使用。
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.log import log_response
+
+
+def require_http_methods(methods):
+    """只允许指定的请求方法，否则返回405"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = HttpResponseNotAllowed(methods)
+                log_response('Method Not Allowed (%s): %s', request.method, request.path,
+                             response=response, request=request)
+                return response
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_control(**kwargs):
+    """给响应加 Cache-Control 头"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **view_kwargs):
+            response = await view(request, *args, **view_kwargs)
+            patch_cache_control(response, **kwargs)
+            return response
+        return wrapper
+    return decorator
+
+
+def condition(etag_func):
+    """
+    ETag 条件请求：If-None-Match 命中时直接返回304，不执行视图
+    etag_func 是同步函数（要读版本号缓存），放到线程里执行
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+"""
+幂等键（Idempotency-Key）
+
+移动网络不稳定，客户端收不到响应就会重发POST：选课/退课白白再跑一遍校验和写库，
+创建课程则会建出两门一样的课。带 Idempotency-Key 请求头的请求由 @idempotent 处理：
+
+- 第一次请求用 cache.add 原子地占住这个键（状态 pending），执行视图后把响应
+  （状态码、响应体、Content-Type）写回缓存，保留 TTL 秒；5xx 不保存，删掉占位让客户端重试
+- 重发的请求直接返回保存的响应（带 Idempotent-Replayed: true），不访问课程和选课表
+- 第一次请求还在执行时到达的重发请求等它完成后返回同一个响应：同一进程内用 Event 唤醒，
+  其他进程轮询缓存；等待超过 WAIT 秒或第一次请求失败时返回409，客户端稍后重试
+- 键按用户和接口区分；同一个键换了请求体返回422
+
+多进程部署时 IDEMPOTENCY['CACHE'] 要指向所有进程共享的缓存（Redis/Memcached）。
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TTL': 24 * 3600,       # 响应保留时间（秒）
+    'PENDING_TTL': 30,      # 占位的过期时间，处理请求的进程崩溃后键不会一直被占着
+    'WAIT': 5,              # 重发请求等待第一次请求完成的最长时间（秒）
+    'POLL': 0.05,           # 等待其他进程时轮询缓存的间隔（秒）
+}
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+PENDING = 'pending'
+
+# 本进程内正在执行的键 {缓存键: Event}
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def _cache_key(request, view, key):
+    owner = f'{getattr(request, "user_role", "")}:{getattr(request, "user_id", "")}'
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{owner}:{view.__name__}:{digest}'
+
+
+def _fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _replay(entry):
+    response = HttpResponse(entry['body'], status=entry['status'], content_type=entry['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _busy():
+    response = JsonResponse({'error': '相同的请求正在处理中，请稍后重试'}, status=409)
+    response['Retry-After'] = '1'
+    return response
+
+
+def _wait(cache, cache_key, config):
+    """等待正在执行的同一请求完成，返回保存的记录；超时或对方失败返回None"""
+    deadline = time.monotonic() + config['WAIT']
+    event = _inflight.get(cache_key)
+    if event is not None:
+        event.wait(config['WAIT'])
+    while True:
+        entry = cache.get(cache_key)
+        if entry is None or entry['state'] != PENDING:
+            return entry
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(config['POLL'])
+
+
+def idempotent(view):
+    """放在 login_required 之后：带 Idempotency-Key 的请求只执行一次"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'Idempotency-Key 不能超过 {MAX_KEY_LENGTH} 个字符'}, status=400)
+
+        config = get_config()
+        cache = caches[config['CACHE']]
+        cache_key = _cache_key(request, view, key)
+        fingerprint = _fingerprint(request)
+
+        pending = {'state': PENDING, 'fingerprint': fingerprint}
+        for _ in range(2):
+            if cache.add(cache_key, pending, config['PENDING_TTL']):
+                break
+            entry = cache.get(cache_key)
+            if entry is None:
+                continue  # 记录刚好过期，重新占位
+            if entry['fingerprint'] != fingerprint:
+                return JsonResponse({'error': '同一个 Idempotency-Key 不能用于不同的请求'}, status=422)
+            if entry['state'] == PENDING:
+                entry = _wait(cache, cache_key, config)
+            if entry is not None:
+                return _replay(entry)
+            return _busy()
+        else:
+            return _busy()
+
+        event = threading.Event()
+        with _inflight_lock:
+            _inflight[cache_key] = event
+        try:
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 500 or response.streaming:
+                cache.delete(cache_key)
+            else:
+                cache.set(cache_key, {
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'body': response.content,
+                    'content_type': response['Content-Type'],
+                }, config['TTL'])
+            return response
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+            event.set()
+    return wrapper
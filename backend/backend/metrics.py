@@ -0,0 +1,358 @@
+"""
+接口耗时和SQL统计
+
+MetricsMiddleware 按URL名（student-courses、student-enroll ...）记录：
+请求耗时直方图、SQL条数和耗时、密码哈希次数和耗时，/api/metrics 以Prometheus文本格式输出。
+
+- 计数器按线程分片，每个线程只写自己的分片，记录时不加锁；读取时把所有分片相加
+- SQL通过每个数据库连接上的 execute_wrapper 统计，当前请求的统计对象放在contextvar里，
+  同步视图和异步视图（sync_to_async 里执行的ORM）都能记到同一个请求上
+- 多进程部署时配置 METRICS['DIR']，每个进程定期把自己的计数写到 <DIR>/<pid>.json，
+  /api/metrics 汇总目录里所有进程的数据（目录在每次部署启动前清空）
+- /api/metrics 只对 METRICS['ALLOWED_IPS'] 里的地址开放，或者带 Authorization: Bearer <METRICS['TOKEN']>；
+  客户端IP和限流用同一个规则（RATE_LIMIT['IP_HEADER']）
+- METRICS['SERVER_TIMING'] 打开后在响应头里加 Server-Timing，浏览器开发者工具里可以直接看
+- 同时维护本进程SQL耗时的指数滑动平均 db_latency()，backend.ratelimit 据此在数据库变慢时拒绝新的选课
+"""
+import atexit
+import ipaddress
+import json
+import math
+import os
+import threading
+import secrets
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': None,            # 多进程汇总目录，None 表示只统计本进程
+    'FLUSH_INTERVAL': 5,    # 写快照文件的最小间隔（秒）
+    'SERVER_TIMING': False,
+    'LATENCY_WINDOW': 5,    # SQL耗时滑动平均的时间常数（秒）
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),  # 允许抓取的地址或网段
+    'TOKEN': None,          # 设置后带 Authorization: Bearer <TOKEN> 的请求从任意地址都可以抓取
+}
+
+# 请求耗时直方图的桶（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 每个URL名一行：[请求数, 耗时, SQL条数, SQL耗时, 哈希次数, 哈希耗时, 各桶计数..., 超出最大桶的计数]
+COUNT, DURATION, SQL_COUNT, SQL_TIME, HASH_COUNT, HASH_TIME = range(6)
+ROW_SIZE = 6 + len(BUCKETS) + 1
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class RequestStats:
+    """单个请求的SQL和哈希统计"""
+    __slots__ = ('sql_count', 'sql_time', 'hash_count', 'hash_time')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.hash_count = 0
+        self.hash_time = 0.0
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+# ==================== 计数器 ====================
+
+# {线程ident: {URL名: 行}}；线程结束后ident可能被新线程复用，复用时接着累加
+_shards = {}
+_flushed_at = 0.0
+
+
+def _row(view):
+    shard = _shards.get(threading.get_ident())
+    if shard is None:
+        shard = _shards.setdefault(threading.get_ident(), {})
+    row = shard.get(view)
+    if row is None:
+        row = shard[view] = [0] * ROW_SIZE
+    return row
+
+
+def record(view, duration, stats):
+    """记录一个请求（只写当前线程的分片）"""
+    row = _row(view)
+    row[COUNT] += 1
+    row[DURATION] += duration
+    row[SQL_COUNT] += stats.sql_count
+    row[SQL_TIME] += stats.sql_time
+    row[HASH_COUNT] += stats.hash_count
+    row[HASH_TIME] += stats.hash_time
+    row[6 + bisect_left(BUCKETS, duration)] += 1
+
+
+def record_hash(seconds):
+    """密码哈希/校验耗时（由 backend.hashing 调用）"""
+    stats = _current.get()
+    if stats is not None:
+        stats.hash_count += 1
+        stats.hash_time += seconds
+
+
+def _merge(into, rows):
+    for view, row in rows:
+        total = into.get(view)
+        if total is None:
+            total = into[view] = [0] * ROW_SIZE
+        for i, value in enumerate(row):
+            total[i] += value
+    return into
+
+
+def snapshot():
+    """本进程所有线程分片之和 {URL名: 行}"""
+    totals = {}
+    for shard in list(_shards.values()):
+        _merge(totals, list(shard.items()))
+    return totals
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f'{pid}.json')
+
+
+def flush(force=False):
+    """把本进程的快照写到 METRICS['DIR']（原子替换）"""
+    global _flushed_at
+    config = get_config()
+    directory = config['DIR']
+    now = time.monotonic()
+    if not directory or (not force and now - _flushed_at < config['FLUSH_INTERVAL']):
+        return
+    _flushed_at = now
+
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, os.getpid())
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def collect():
+    """所有进程的汇总：目录里其他进程的快照 + 本进程的实时数据"""
+    totals = snapshot()
+    directory = get_config()['DIR']
+    if not directory or not os.path.isdir(directory):
+        return totals
+
+    own = f'{os.getpid()}.json'
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                _merge(totals, json.load(f).items())
+        except (OSError, ValueError):
+            continue
+    return totals
+
+
+# ==================== SQL统计 ====================
+
+class LatencyEWMA:
+    """
+    按时间加权的SQL耗时滑动平均（秒）：每条SQL的权重是距上一条的时间间隔，
+    和这段时间里执行了多少条无关；没有新的SQL时按空闲时间向0衰减，不会一直停在高位。
+    多线程更新不加锁，偶尔丢一次更新不影响平均值
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.value = 0.0
+        self.updated = time.monotonic()
+
+    def observe(self, seconds, now=None):
+        now = time.monotonic() if now is None else now
+        weight = math.exp(-max(0.0, now - self.updated) / self.window)
+        self.value = self.value * weight + seconds * (1 - weight)
+        self.updated = now
+
+    def get(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.value * math.exp(-max(0.0, now - self.updated) / self.window)
+
+
+_latency = LatencyEWMA(DEFAULTS['LATENCY_WINDOW'])
+
+
+def db_latency():
+    """本进程最近的SQL平均耗时（秒，只统计请求内执行的SQL）"""
+    return _latency.get()
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        _latency.observe(elapsed)
+
+
+def _install(connection):
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_wrapper)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_on_connection_created)
+atexit.register(flush, True)
+
+
+# ==================== 中间件 ====================
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name
+
+
+def _server_timing(duration, stats):
+    return (f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.sql_count} queries", '
+            f'hash;dur={stats.hash_time * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}')
+
+
+class MetricsMiddleware:
+    """按URL名统计耗时、SQL和密码哈希（同步、异步请求都支持）"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_config()
+        self.enabled = config['ENABLED']
+        self.server_timing = config['SERVER_TIMING']
+        self.multiprocess = bool(config['DIR'])
+        _latency.window = config['LATENCY_WINDOW']
+        # 中间件加载前就已经打开的连接
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, start, stats):
+        duration = time.perf_counter() - start
+        record(_view_name(request), duration, stats)
+        if self.server_timing:
+            response['Server-Timing'] = _server_timing(duration, stats)
+        if self.multiprocess:
+            flush()
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, start, stats)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, start, stats)
+
+
+# ==================== 输出 ====================
+
+def _label(view):
+    return view.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render(totals):
+    """Prometheus文本格式"""
+    lines = [
+        '# HELP course_request_duration_seconds Request latency by URL name.',
+        '# TYPE course_request_duration_seconds histogram',
+    ]
+    for view, row in sorted(totals.items()):
+        label = _label(view)
+        cumulative = 0
+        for i, bound in enumerate(BUCKETS):
+            cumulative += row[6 + i]
+            lines.append(f'course_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'course_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {row[COUNT]}')
+        lines.append(f'course_request_duration_seconds_sum{{view="{label}"}} {row[DURATION]:.6f}')
+        lines.append(f'course_request_duration_seconds_count{{view="{label}"}} {row[COUNT]}')
+
+    counters = (
+        ('course_sql_queries_total', SQL_COUNT, 'SQL queries executed, by URL name.', '{}'),
+        ('course_sql_seconds_total', SQL_TIME, 'Time spent in SQL, by URL name.', '{:.6f}'),
+        ('course_password_hash_total', HASH_COUNT, 'bcrypt hash/check calls, by URL name.', '{}'),
+        ('course_password_hash_seconds_total', HASH_TIME, 'Time spent in bcrypt, by URL name.', '{:.6f}'),
+    )
+    for name, index, help_text, fmt in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for view, row in sorted(totals.items()):
+            lines.append(f'{name}{{view="{_label(view)}"}} {fmt.format(row[index])}')
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    config = get_config()
+    token = config['TOKEN']
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer ') and secrets.compare_digest(header[7:].encode(), token.encode()):
+            return True
+
+    from .ratelimit import client_ip, get_config as ratelimit_config  # ratelimit 导入了本模块
+    try:
+        ip = ipaddress.ip_address(client_ip(request, ratelimit_config()))
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(network, strict=False) for network in config['ALLOWED_IPS'])
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Prometheus抓取接口
+    本进程的计数直接读内存，其他进程读各自写好的快照文件，抓取时不写文件
+    """
+    if not _allowed(request):
+        return JsonResponse({'error': '无权访问'}, status=403)
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,239 @@
+"""
+写接口限流和过载保护
+
+几个脚本客户端循环请求选课/退课接口，就能把MySQL压满，所有人都选不上课。
+RateLimitMiddleware 在视图执行之前（不查数据库）拦下这些请求：
+
+- 令牌桶：RULES 按URL名配置 (每秒补充的令牌数, 桶容量)，每个请求同时消耗
+  登录学生/教师的桶和来源IP的桶（IP的桶按 IP_FACTOR 放大，照顾同一出口的多个学生），
+  任何一个桶空了就返回429和 Retry-After，两个桶都不扣令牌
+- 存储：memory 是进程内的字典（单进程部署和测试）；多进程部署用 redis，
+  一段Lua脚本原子地检查、扣减所有桶，时间取Redis服务器的时钟
+- 过载保护：SHED['VIEWS'] 里的接口在本进程SQL平均耗时（backend.metrics.db_latency）
+  超过 SHED['LATENCY'] 时直接返回503，数据库恢复后自动放行；退课不在其中，它会释放座位
+
+只检查 POST/PUT/DELETE 等写请求，GET请求不解析URL、不读session。
+"""
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .auth import get_identity
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BACKEND': 'memory',        # memory | redis
+    'URL': 'redis://localhost:6379/0',
+    'PREFIX': 'ratelimit',
+    'IP_FACTOR': 10,            # IP的桶是用户的桶的多少倍
+    'IP_HEADER': None,          # 反向代理传递客户端IP的请求头，如 'HTTP_X_REAL_IP'；None 用 REMOTE_ADDR
+    'RULES': {},                # {URL名: (每秒补充的令牌数, 桶容量)}
+    'SHED': {
+        'VIEWS': [],            # 数据库变慢时拒绝的接口
+        'LATENCY': None,        # SQL平均耗时阈值（秒），None 表示不启用
+        'RETRY_AFTER': 2,
+    },
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'RATE_LIMIT', {})}
+    config['SHED'] = {**DEFAULTS['SHED'], **config['SHED']}
+    return config
+
+
+# ==================== 存储后端 ====================
+
+class MemoryBucketStore:
+    """进程内令牌桶，单进程部署和测试用"""
+
+    # 桶的数量超过这个值时清理已经补满的桶
+    MAX_BUCKETS = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # {key: [令牌数, 更新时间, 补满的时间]}
+
+    def take(self, buckets, now=None):
+        """
+        buckets: [(key, 每秒补充的令牌数, 桶容量)]
+        所有桶都有令牌时各扣一个，返回0；否则不扣，返回需要等待的秒数
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append(tokens)
+            if wait:
+                return wait
+
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                tokens -= 1
+                self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+            return 0.0
+
+
+# KEYS是各个桶，ARGV依次是每个桶的 (每秒补充的令牌数, 桶容量)
+# 返回需要等待的秒数（字符串，Lua的数字返回给客户端会被截成整数）
+_TAKE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then wait = math.max(wait, (1 - tokens) / rate) end
+    levels[i] = tokens
+end
+if wait > 0 then return tostring(wait) end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return '0'
+"""
+
+
+class RedisBucketStore:
+    """Redis令牌桶，多进程/多机部署用；client 可以是任何兼容redis-py的客户端"""
+
+    def __init__(self, client, prefix='ratelimit'):
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_LUA)
+
+    def take(self, buckets, now=None):
+        keys = [f'{self.prefix}:{key}' for key, _, _ in buckets]
+        args = [value for _, rate, burst in buckets for value in (rate, burst)]
+        return float(self._take(keys=keys, args=args))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """按配置创建（并缓存）存储后端"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = get_config()
+                if config['BACKEND'] == 'redis':
+                    import redis
+                    client = redis.Redis.from_url(config['URL'])
+                    _store = RedisBucketStore(client, prefix=config['PREFIX'])
+                else:
+                    _store = MemoryBucketStore()
+    return _store
+
+
+def reset_store(store=None):
+    """替换存储后端（测试用）"""
+    global _store
+    _store = store
+
+
+# ==================== 中间件 ====================
+
+def client_ip(request, config):
+    header = config['IP_HEADER']
+    if header and request.META.get(header):
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _view_name(request):
+    try:
+        return resolve(request.path_info).url_name
+    except Resolver404:
+        return None
+
+
+def _reject(status, message, retry_after):
+    response = JsonResponse({'error': message}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class RateLimitMiddleware:
+    """写接口的令牌桶限流和过载保护（同步、异步请求都支持），放在 SessionMiddleware 之后"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _rule(self, request):
+        """返回 (URL名, 限流规则或None)；不需要检查的请求返回 (None, None)"""
+        if not self.config['ENABLED'] or request.method in SAFE_METHODS:
+            return None, None
+        view = _view_name(request)
+        if view is None:
+            return None, None
+        return view, self.config['RULES'].get(view)
+
+    def _check(self, request, view, rule):
+        """返回拒绝的响应，放行返回None"""
+        shed = self.config['SHED']
+        if shed['LATENCY'] is not None and view in shed['VIEWS'] and metrics.db_latency() > shed['LATENCY']:
+            return _reject(503, '系统繁忙，请稍后再试', shed['RETRY_AFTER'])
+        if rule is None:
+            return None
+
+        rate, burst = rule
+        factor = self.config['IP_FACTOR']
+        buckets = [(f'{view}:ip:{client_ip(request, self.config)}', rate * factor, burst * factor)]
+        user_id, user_role = get_identity(request)
+        if user_id:
+            buckets.append((f'{view}:{user_role}:{user_id}', rate, burst))
+        wait = get_store().take(buckets)
+        if wait:
+            return _reject(429, '请求过于频繁，请稍后再试', wait)
+        return None
+
+    def _watched(self, view, rule):
+        return rule is not None or view in self.config['SHED']['VIEWS']
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        view, rule = self._rule(request)
+        if view is not None and self._watched(view, rule):
+            response = self._check(request, view, rule)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        view, rule = self._rule(request)
+        if view is not None and self._watched(view, rule):
+            # 读session、访问Redis都是阻塞调用，放到线程里执行（和 login_required 一样）
+            response = await sync_to_async(self._check)(request, view, rule)
+            if response is not None:
+                return response
+        return await self.get_response(request)
@@ -0,0 +1,117 @@
+"""
+只读副本路由
+
+READ_REPLICAS['DATABASES'] 列出 DATABASES 里的副本别名后，ReplicaMiddleware 为每个
+GET/HEAD 请求随机选一个副本，请求内的所有读查询都走这个副本（ReplicaRouter）；
+其他情况一律走主库：写请求、管理命令、后台线程、primary() 包住的代码。
+
+读己之写：写请求成功后响应里带一个 Cookie（值是到期时间戳），PIN_SECONDS 内
+该客户端的读请求也走主库，刚选课/退课的学生在“我的课程”里不会看到副本上的旧数据。
+Cookie 被篡改最多让这个客户端多读几秒主库，所以不签名；时间戳超过 PIN_SECONDS 的按过期处理。
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'DATABASES': [],         # 副本别名，空表示不启用
+    'PIN_SECONDS': 5,        # 写操作后读主库的时间，应大于副本的复制延迟
+    'COOKIE': 'pin_primary',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 当前请求读查询使用的库；None 表示主库
+_read_db = ContextVar('read_db', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+@contextmanager
+def primary():
+    """代码块内的读查询走主库（结果要写进缓存、或紧接着要据此写库时使用）"""
+    token = _read_db.set(None)
+    try:
+        yield
+    finally:
+        _read_db.reset(token)
+
+
+class ReplicaRouter:
+    """读查询走中间件为当前请求选定的副本，写查询走主库"""
+
+    def db_for_read(self, model, **hints):
+        return _read_db.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本是主库的拷贝，两边的对象可以互相关联
+        return True
+
+
+def _pinned(request, config):
+    try:
+        until = float(request.COOKIES.get(config['COOKIE'], 0))
+    except ValueError:
+        return False
+    now = time.time()
+    return now < until <= now + config['PIN_SECONDS']
+
+
+class ReplicaMiddleware:
+    """选择当前请求的读库，写请求成功后把客户端固定到主库一段时间（同步、异步请求都支持）"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _choose(self, request, config):
+        """返回 (读库别名, 是否写请求)"""
+        if request.method not in SAFE_METHODS:
+            return None, True
+        if not config['DATABASES'] or _pinned(request, config):
+            return None, False
+        return random.choice(config['DATABASES']), False
+
+    def _finish(self, response, config, write):
+        if write and response.status_code < 400 and config['DATABASES']:
+            seconds = config['PIN_SECONDS']
+            # 截断到毫秒：四舍五入可能超出 PIN_SECONDS，被 _pinned() 当成伪造的时间戳
+            until = int((time.time() + seconds) * 1000) / 1000
+            response.set_cookie(config['COOKIE'], f'{until:.3f}',
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        db, write = self._choose(request, config)
+        token = _read_db.set(db)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_db.reset(token)
+        return self._finish(response, config, write)
+
+    async def __acall__(self, request):
+        config = get_config()
+        db, write = self._choose(request, config)
+        token = _read_db.set(db)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_db.reset(token)
+        return self._finish(response, config, write)
@@ -3,13 +3,18 @@ Django 项目配置文件
 包含数据库、应用、中间件等基本配置
 """
 import os
+import tempfile
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
+
 # 项目根目录
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# 密钥（生产环境需要更改）
-SECRET_KEY = 'django-insecure-key-for-development-only'
+# 密钥：生产环境通过环境变量 SECRET_KEY 设置，下面的默认值只用于本地开发
+INSECURE_SECRET_KEY = 'django-insecure-key-for-development-only'
+SECRET_KEY = os.environ.get('SECRET_KEY', INSECURE_SECRET_KEY)
 
 # 调试模式（生产环境需要设为False）
 DEBUG = True
@@ -33,10 +38,13 @@ INSTALLED_APPS = [
 
 # 中间件
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',                  # 接口耗时/SQL统计（放在最外层，统计完整耗时）
+    'backend.replicas.ReplicaMiddleware',                 # 选择本次请求的读库（只读副本/主库）
     'django.middleware.security.SecurityMiddleware',      # 安全中间件
     'corsheaders.middleware.CorsMiddleware',              # CORS中间件（必须在CommonMiddleware之前）
     'django.middleware.common.CommonMiddleware',          # 通用中间件
     'django.contrib.sessions.middleware.SessionMiddleware',  # Session中间件
+    'backend.ratelimit.RateLimitMiddleware',              # 写接口限流/过载保护（需要读session，放在其后）
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # 认证中间件
     'django.contrib.messages.middleware.MessageMiddleware',  # 消息中间件
     'django.middleware.clickjacking.XFrameOptionsMiddleware',  # 点击劫持保护
@@ -65,6 +73,13 @@ TEMPLATES = [
 # WSGI应用
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# ASGI应用（实时座位推送需要ASGI部署）
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# 只读接口使用异步视图（students/async_views.py、teachers/async_views.py），
+# 只在ASGI部署时打开；WSGI下异步视图每个请求都要单独起事件循环，反而更慢
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
+
 # 数据库配置（使用MySQL）
 DATABASES = {
     'default': {
@@ -78,9 +93,72 @@ DATABASES = {
             'charset': 'utf8mb4',
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         }
-    }
+    },
+    # 只读副本：按 default 的格式添加，并把别名加到下面的 READ_REPLICAS['DATABASES']
+    # 'replica1': {..., 'HOST': '192.168.233.137'},
+    # 选课记录分片：按 default 的格式添加，并把别名加到下面的 ENROLLMENT_SHARDS['DATABASES']
+    # 'enrollments0': {..., 'HOST': '192.168.233.140'},
 }
 
+# 只读副本路由（见 backend/replicas.py）：GET请求的读查询分给副本，
+# 写请求后 PIN_SECONDS 秒内该客户端仍读主库（应大于副本的复制延迟）
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+READ_REPLICAS = {
+    'DATABASES': [],
+    'PIN_SECONDS': 5,
+    'COOKIE': 'pin_primary',
+}
+
+# 选课记录分库（见 courses/sharding.py）：enrollments 按 course_id % 分片数 分到各库，
+# 课程、学生、教师表仍在 default；按学生的查询由 WORKERS 个线程并行查询所有分片
+# 空列表表示不分库。分片数确定后不能随意修改
+ENROLLMENT_SHARDS = {
+    'DATABASES': [],
+    'WORKERS': 4,
+}
+
+# 密码哈希（见 backend/hashing.py）
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))  # 修改后用户下次登录时自动重新哈希
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 哈希进程池大小，0表示不用进程池
+PASSWORD_HASH_MAX_PENDING = 64      # 进程池忙时最多排队的请求数
+PASSWORD_HASH_QUEUE_TIMEOUT = 2     # 排队等待超时（秒），超时返回503
+
+# 部署的worker进程数（gunicorn/uvicorn 也读这个环境变量），多机部署时设置 MULTI_HOST=1。
+# 多进程/多机部署时数据版本号（courses/versions.py）必须放在共享缓存里，
+# CACHES['default'] 仍是本地内存时启动失败
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+MULTI_HOST = os.environ.get('MULTI_HOST', '0') == '1'
+
+# 缓存配置（开发环境用本地内存；多进程部署必须换成共享缓存，如
+# 'django.core.cache.backends.redis.RedisCache'，否则各进程的课程目录缓存互不失效）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'course-system',
+        # 课程目录里每门课有人数、容量两个键，默认的300条上限太小
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Session缓存（SESSION_ENGINE 选 cache 后端时使用），本机多进程共享文件，生产环境换成Redis
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'course-system-sessions'),
+    },
+}
+
+# Session存储：默认放在上面的 sessions 缓存里，每个请求不再查询/更新 django_session 表
+# 也可以设为 'django.contrib.sessions.backends.signed_cookies'（session数据在客户端），
+# 但任何知道 SECRET_KEY 的人都能伪造登录态，必须同时通过环境变量设置 SECRET_KEY
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cache')
+SESSION_CACHE_ALIAS = 'sessions'
+
+if SESSION_ENGINE == 'django.contrib.sessions.backends.signed_cookies' and SECRET_KEY == INSECURE_SECRET_KEY:
+    raise ImproperlyConfigured('使用签名Cookie存储session时必须通过环境变量 SECRET_KEY 设置密钥')
+
+# 课程目录缓存过期时间（秒），写操作会主动换版本，这里只是兜底
+CATALOG_CACHE_TIMEOUT = 300
+# 目录里每门课的已选人数缓存过期时间（秒），选课/退课提交后直接改写，这里限制并发写入乱序时旧值的寿命
+CATALOG_SEATS_TIMEOUT = 30
+
 # 语言配置
 LANGUAGE_CODE = 'zh-hans'  # 中文
 
@@ -109,3 +187,87 @@ CORS_ALLOW_METHODS = [
     'POST',
     'PUT',
 ]
+# 前端重发写请求时带上幂等键（见 backend/idempotency.py）
+CORS_ALLOW_HEADERS = [*default_headers, 'idempotency-key']
+
+# 幂等键：第一次请求的响应保存在缓存里，带同一个 Idempotency-Key 的重发请求直接返回它
+# 多进程部署时 CACHE 要指向共享缓存（Redis/Memcached）
+IDEMPOTENCY = {
+    'CACHE': 'default',
+    'TTL': 24 * 3600,
+    'WAIT': 5,
+}
+
+# 座位分配器（可选）：选课/退课先在内存或Redis中原子判定，再批量写回数据库
+# 启用后需要运行 python manage.py flush_seats --loop 持续写回；日志积压到 FLUSH_BATCH 时本进程的后台线程也会写回
+SEAT_ALLOCATOR = {
+    'ENABLED': False,
+    'BACKEND': 'memory',  # memory（单进程）| redis（多进程部署）
+    'URL': 'redis://localhost:6379/0',
+    'FLUSH_BATCH': 500,
+    'FLUSH_THREAD': True,
+}
+
+# 志愿抽签选课（可选）：打开后选课窗口内学生只提交志愿，选课接口拒绝实时选课，
+# 窗口结束后运行 python manage.py allocate_lottery 一次性分配座位，再关闭该模式开放补退选
+LOTTERY = {
+    'ENABLED': os.environ.get('LOTTERY', '0') == '1',
+    'MAX_PREFERENCES': 10,
+}
+
+# 写接口限流和过载保护（见 backend/ratelimit.py）
+# RULES: {URL名: (每秒补充的令牌数, 桶容量)}，按登录用户和来源IP（乘以 IP_FACTOR）各一个令牌桶
+# SHED: 本进程SQL平均耗时超过 LATENCY 秒时，VIEWS 里的接口直接返回503
+RATE_LIMIT = {
+    'ENABLED': os.environ.get('RATE_LIMIT', '1') == '1',
+    'BACKEND': 'memory',  # memory（单进程）| redis（多进程部署）
+    'URL': 'redis://localhost:6379/0',
+    'IP_FACTOR': 10,
+    'IP_HEADER': None,    # nginx后面部署时改为 'HTTP_X_REAL_IP'
+    'RULES': {
+        'student-enroll': (2, 10),
+        'student-drop': (2, 10),
+        'student-enroll-batch': (0.5, 5),
+        'student-drop-batch': (0.5, 5),
+        'student-preferences': (0.5, 5),
+        'student-waitlist-leave': (1, 5),
+        'student-login': (0.2, 10),
+        'student-register': (0.1, 5),
+        'teacher-login': (0.2, 10),
+        'teacher-register': (0.1, 5),
+        'teacher-create-course': (0.5, 5),
+    },
+    'SHED': {
+        'VIEWS': ['student-enroll', 'student-enroll-batch'],
+        'LATENCY': 0.2,
+        'RETRY_AFTER': 2,
+    },
+}
+
+# 已删除课程的后台清理：每批删除的选课记录数、批间最少休息（秒）
+# 进程重启时没清理完的课程由 python manage.py purge_courses 兜底
+COURSE_PURGE = {
+    'THREAD': True,
+    'BATCH_SIZE': 500,
+    'SLEEP': 0.05,
+}
+
+# 实时座位推送：选课/退课/课程增删提交后广播座位变化
+# memory 只在本进程内广播（单进程部署）；多进程部署用 redis
+SEAT_EVENTS = {
+    'BACKEND': 'memory',  # memory | redis
+    'URL': 'redis://localhost:6379/0',
+    'CHANNEL': 'seat-events',
+}
+
+# 接口耗时/SQL统计（/api/metrics，Prometheus文本格式）
+# 多进程部署时设置 METRICS_DIR，各进程把计数写到该目录下汇总；每次部署启动前清空目录
+# 只允许 METRICS_ALLOWED_IPS（逗号分隔的地址/网段）抓取，或者带 Authorization: Bearer $METRICS_TOKEN
+METRICS = {
+    'ENABLED': True,
+    'DIR': os.environ.get('METRICS_DIR') or None,
+    'FLUSH_INTERVAL': 5,
+    'SERVER_TIMING': os.environ.get('METRICS_SERVER_TIMING', '0') == '1',
+    'ALLOWED_IPS': os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+}
@@ -0,0 +1,42 @@
+"""
+测试配置：SQLite内存数据库，不需要MySQL
+
+python manage.py test --settings=backend.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    # 目录里每门课两个键（人数、容量），1000门课的用例超过默认的300条上限会被淘汰
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-default',
+                'OPTIONS': {'MAX_ENTRIES': 10000}},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-sessions'},
+}
+
+# 测试里直接在当前线程计算哈希，工作因子取最小值
+PASSWORD_HASH_WORKERS = 0
+BCRYPT_ROUNDS = 4
+
+# 异步只读接口由 tests/test_async_views.py 用自己的URL配置单独测试
+ASYNC_READ_VIEWS = False
+METRICS = {**METRICS, 'DIR': None, 'SERVER_TIMING': False}  # noqa: F405
+
+# 测试客户端都来自同一个IP、反复登录，默认不限流（tests/test_ratelimit.py 单独打开）
+RATE_LIMIT = {**RATE_LIMIT, 'ENABLED': False}  # noqa: F405
+
+# 删除课程后不起后台清理线程（测试里直接调用 courses.purge）
+COURSE_PURGE = {'THREAD': False}
+
+# 只读副本测试（tests/test_replicas.py）用的第二个库；默认不启用路由
+DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+# 选课记录分库测试（tests/test_sharding.py）用的两个分片；默认不分库，跨分片查询不用线程池
+DATABASES['shard0'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+DATABASES['shard1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+ENROLLMENT_SHARDS = {'DATABASES': [], 'WORKERS': 0}
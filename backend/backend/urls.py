@@ -4,12 +4,16 @@ Django URL配置
 """
 from django.contrib import admin
 from django.urls import path, include
+from . import metrics
 
 # URL路由配置
 urlpatterns = [
     # Django Admin后台
     path('admin/', admin.site.urls),
 
+    # 接口耗时/SQL统计（Prometheus抓取）
+    path('api/metrics', metrics.metrics_view, name='metrics'),
+
     # 学生相关API
     path('', include('students.urls')),
 
@@ -0,0 +1,455 @@
+"""
+座位令牌分配器（可选模式）
+
+选课开放的第一分钟，所有请求都落在少数几门热门课程的同一行上。
+打开 SEAT_ALLOCATOR['ENABLED'] 后，选课/退课不再直接写MySQL：
+
+1. 每门课第一次被访问时，把剩余座位数和已选学生集合预加载到共享存储
+   （Redis，测试和单进程部署用进程内的内存存储代替）；
+2. 接受/拒绝在存储里用一个原子操作完成（Redis里是一段Lua脚本），
+   成功的操作追加到待写日志；
+3. 待写日志由 flush() 批量写回 enrollments 表（bulk_create / 批量删除），
+   然后按选课记录重算计数器。flush() 由 python manage.py flush_seats --loop 持续调用；
+   日志积压到 FLUSH_BATCH 条时还会唤醒本进程的后台写回线程，请求线程本身不写库。
+
+写回时日志先被移到 inflight 列表，写库成功后才删除，进程中途崩溃后
+下一次 flush() 会重放 inflight 里的操作（操作是幂等的）。
+存储本身丢失（比如Redis重启且没有持久化）时运行 reconcile() 按数据库重建。
+"""
+import logging
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import events, schedules, seats, sharding, versions
+from .models import Course, Enrollment
+
+logger = logging.getLogger(__name__)
+
+# 选课结果（与 courses.seats 保持一致）
+ENROLLED = seats.ENROLLED
+ALREADY_ENROLLED = seats.ALREADY_ENROLLED
+FULL = seats.FULL
+NOT_LOADED = 'not_loaded'
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BACKEND': 'memory',        # memory | redis
+    'URL': 'redis://localhost:6379/0',
+    'PREFIX': 'seats',
+    'FLUSH_BATCH': 500,         # 每批写回的操作数；待写日志达到这个长度时唤醒后台写回线程
+    'FLUSH_THREAD': True,       # 是否在本进程起后台写回线程（关闭后只靠 flush_seats 命令）
+    'FLUSH_LOCK_TTL': 60,       # 写回锁的过期时间（秒），每写回一批续期一次
+}
+
+
+def get_config():
+    """读取分配器配置"""
+    return {**DEFAULTS, **getattr(settings, 'SEAT_ALLOCATOR', {})}
+
+
+def enabled():
+    """是否启用分配器模式"""
+    return bool(get_config()['ENABLED'])
+
+
+# ==================== 存储后端 ====================
+
+class MemorySeatStore:
+    """进程内存储，单进程部署和测试用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._remaining = {}
+        self._members = {}
+        self._journal = deque()
+        self._inflight = []
+
+    def load(self, course_id, remaining, members, replace=False):
+        """预加载一门课的状态（已加载且 replace=False 时不覆盖）"""
+        with self._lock:
+            if replace or course_id not in self._remaining:
+                self._remaining[course_id] = remaining
+                self._members[course_id] = set(members)
+
+    def forget(self, course_id):
+        with self._lock:
+            self._remaining.pop(course_id, None)
+            self._members.pop(course_id, None)
+
+    def enroll(self, student_id, course_id):
+        with self._lock:
+            if course_id not in self._remaining:
+                return NOT_LOADED
+            members = self._members[course_id]
+            if student_id in members:
+                return ALREADY_ENROLLED
+            if self._remaining[course_id] <= 0:
+                return FULL
+            self._remaining[course_id] -= 1
+            members.add(student_id)
+            self._journal.append(('enroll', student_id, course_id))
+            return ENROLLED
+
+    def release(self, student_id, course_id):
+        with self._lock:
+            if course_id not in self._remaining:
+                return NOT_LOADED
+            members = self._members[course_id]
+            if student_id not in members:
+                return False
+            members.discard(student_id)
+            self._remaining[course_id] += 1
+            self._journal.append(('drop', student_id, course_id))
+            return True
+
+    def pending(self):
+        return len(self._journal)
+
+    def acquire_flush(self, ttl):
+        """拿到写回锁返回令牌，已被占用返回None（进程内的锁不会过期，ttl不用）"""
+        return True if self._flush_lock.acquire(blocking=False) else None
+
+    def extend_flush(self, token, ttl):
+        return True
+
+    def release_flush(self, token):
+        self._flush_lock.release()
+
+    def claim(self, n):
+        """把最多n条日志移到inflight，返回全部inflight（含上次崩溃遗留的）"""
+        with self._lock:
+            while self._journal and n > 0:
+                self._inflight.append(self._journal.popleft())
+                n -= 1
+            return list(self._inflight)
+
+    def ack(self):
+        with self._lock:
+            self._inflight.clear()
+
+
+# 选课：返回 1成功 0已选 -1未加载 -2已满
+_ENROLL_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then return 0 end
+if tonumber(redis.call('GET', KEYS[1])) <= 0 then return -2 end
+redis.call('DECR', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('RPUSH', KEYS[3], 'enroll:' .. ARGV[1] .. ':' .. ARGV[2])
+return 1
+"""
+
+# 退课：返回 1成功 0未选 -1未加载
+_RELEASE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if redis.call('SREM', KEYS[2], ARGV[1]) == 0 then return 0 end
+redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[3], 'drop:' .. ARGV[1] .. ':' .. ARGV[2])
+return 1
+"""
+
+# 预加载：ARGV[1]是否覆盖，ARGV[2]剩余座位，其余是已选学生
+_LOAD_LUA = """
+if ARGV[1] == '0' and redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('DEL', KEYS[2])
+for i = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[2], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('SET', KEYS[1], ARGV[2])
+return 1
+"""
+
+# 认领日志：把最多ARGV[1]条从journal移到inflight
+_CLAIM_LUA = """
+local n = tonumber(ARGV[1])
+local items = redis.call('LRANGE', KEYS[1], 0, n - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    for i = 1, #items, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 999, #items)))
+    end
+end
+return redis.call('LRANGE', KEYS[2], 0, -1)
+"""
+
+
+# 写回锁：只有令牌相同（还是自己的锁）时才续期/释放，返回 1成功 0锁已不属于自己
+_EXTEND_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('DEL', KEYS[1])
+"""
+
+
+class RedisSeatStore:
+    """Redis存储，多进程/多机部署用；client 可以是任何兼容redis-py的客户端"""
+
+    def __init__(self, client, prefix='seats'):
+        self.client = client
+        self.prefix = prefix
+        self._enroll = client.register_script(_ENROLL_LUA)
+        self._release = client.register_script(_RELEASE_LUA)
+        self._load = client.register_script(_LOAD_LUA)
+        self._claim = client.register_script(_CLAIM_LUA)
+        self._extend_lock = client.register_script(_EXTEND_LOCK_LUA)
+        self._release_lock = client.register_script(_RELEASE_LOCK_LUA)
+
+    def _keys(self, course_id):
+        return [f'{self.prefix}:{course_id}:remaining', f'{self.prefix}:{course_id}:members']
+
+    @property
+    def _journal_key(self):
+        return f'{self.prefix}:journal'
+
+    @property
+    def _inflight_key(self):
+        return f'{self.prefix}:inflight'
+
+    @property
+    def _flush_lock_key(self):
+        return f'{self.prefix}:flush_lock'
+
+    def load(self, course_id, remaining, members, replace=False):
+        self._load(keys=self._keys(course_id),
+                   args=['1' if replace else '0', remaining, *members])
+
+    def forget(self, course_id):
+        self.client.delete(*self._keys(course_id))
+
+    def enroll(self, student_id, course_id):
+        code = self._enroll(keys=[*self._keys(course_id), self._journal_key],
+                            args=[student_id, course_id])
+        return {1: ENROLLED, 0: ALREADY_ENROLLED, -1: NOT_LOADED, -2: FULL}[code]
+
+    def release(self, student_id, course_id):
+        code = self._release(keys=[*self._keys(course_id), self._journal_key],
+                             args=[student_id, course_id])
+        return NOT_LOADED if code == -1 else bool(code)
+
+    def pending(self):
+        return self.client.llen(self._journal_key)
+
+    def acquire_flush(self, ttl):
+        """拿到写回锁返回随机令牌，已被其他进程占用返回None"""
+        token = uuid.uuid4().hex
+        if self.client.set(self._flush_lock_key, token, nx=True, ex=ttl):
+            return token
+        return None
+
+    def extend_flush(self, token, ttl):
+        """续期写回锁；锁已过期并被其他进程拿走时返回False"""
+        return bool(self._extend_lock(keys=[self._flush_lock_key], args=[token, ttl]))
+
+    def release_flush(self, token):
+        """只删除自己的锁：写回太慢、锁过期后被其他进程拿走时不能删掉别人的锁"""
+        self._release_lock(keys=[self._flush_lock_key], args=[token])
+
+    def claim(self, n):
+        items = self._claim(keys=[self._journal_key, self._inflight_key], args=[n])
+        ops = []
+        for item in items:
+            op, student_id, course_id = (item.decode() if isinstance(item, bytes) else item).split(':')
+            ops.append((op, int(student_id), int(course_id)))
+        return ops
+
+    def ack(self):
+        self.client.delete(self._inflight_key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def check_shared_store():
+    """启用分配器的多进程或多机部署不能用进程内存储：每个进程各有一份剩余座位，会超卖"""
+    config = get_config()
+    if config['ENABLED'] and config['BACKEND'] == 'memory' and versions.multi_process():
+        raise ImproperlyConfigured(
+            "多进程部署启用座位分配器时 SEAT_ALLOCATOR['BACKEND'] 不能是 memory："
+            "各进程各自判定剩余座位，最多超卖进程数倍。请改用 redis"
+        )
+
+
+def get_store():
+    """按配置创建（并缓存）存储后端"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = get_config()
+                if config['BACKEND'] == 'redis':
+                    import redis
+                    client = redis.Redis.from_url(config['URL'])
+                    _store = RedisSeatStore(client, prefix=config['PREFIX'])
+                else:
+                    _store = MemorySeatStore()
+    return _store
+
+
+def reset_store(store=None):
+    """替换存储后端（测试用）"""
+    global _store
+    _store = store
+
+
+# ==================== 选课/退课 ====================
+
+def _load_course(store, course_id, replace=False):
+    """从数据库预加载一门课，课程不存在返回False"""
+    course = Course.objects.filter(id=course_id).values('capacity', 'enrolled_count').first()
+    if course is None:
+        return False
+    members = sharding.for_course(course_id).filter(course_id=course_id).values_list('student_id', flat=True)
+    store.load(course_id, course['capacity'] - course['enrolled_count'], list(members), replace=replace)
+    return True
+
+
+def enroll(student_id, course_id):
+    """在存储中占座，成功的操作稍后写回数据库；返回选课结果"""
+    store = get_store()
+    result = store.enroll(student_id, course_id)
+    if result == NOT_LOADED:
+        if not _load_course(store, course_id):
+            return FULL
+        result = store.enroll(student_id, course_id)
+
+    if result == ENROLLED and store.pending() >= get_config()['FLUSH_BATCH']:
+        _wake_flusher()
+    return result
+
+
+def release(student_id, course_id):
+    """在存储中退课，返回是否真的退掉了"""
+    try:
+        course_id = int(course_id)
+    except (TypeError, ValueError):
+        return False
+
+    store = get_store()
+    result = store.release(student_id, course_id)
+    if result == NOT_LOADED:
+        if not _load_course(store, course_id):
+            return False
+        result = store.release(student_id, course_id)
+    return result
+
+
+def forget(course_id):
+    """课程被删除时清掉存储里的状态"""
+    get_store().forget(course_id)
+
+
+# ==================== 写回与对账 ====================
+
+def _apply(ops):
+    """把一批日志写入数据库，同一学生同一课程只看最后一次操作"""
+    final = {}
+    for op, student_id, course_id in ops:
+        final[(student_id, course_id)] = op
+
+    course_ids = {course_id for _, course_id in final}
+    live = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+
+    adds = {}
+    drops = {}
+    for (s, c), op in final.items():
+        if op == 'enroll' and c in live:
+            adds.setdefault(sharding.shard_for(c), []).append(Enrollment(student_id=s, course_id=c))
+        elif op == 'drop':
+            drops.setdefault(c, []).append(s)
+
+    # 分库时各库分别提交，中途失败由 reconcile_seats 按选课记录修复计数器
+    with sharding.atomic(*sharding.group(course_ids), DEFAULT_DB_ALIAS):
+        for shard, rows in adds.items():
+            Enrollment.objects.using(shard).bulk_create(rows, ignore_conflicts=True)
+        for course_id, student_ids in drops.items():
+            sharding.for_course(course_id).filter(course_id=course_id, student_id__in=student_ids).delete()
+        students = {student_id for student_id, _ in final}
+        schedules.invalidate(*students)
+        seats.recount(live)
+        versions.bump_seats(*students)
+        events.seats_changed(*live)
+
+
+def flush(batch_size=None):
+    """把待写日志分批写回数据库，返回写回的操作数；已有其他进程在写回时返回0"""
+    store = get_store()
+    config = get_config()
+    batch_size = batch_size or config['FLUSH_BATCH']
+    ttl = config['FLUSH_LOCK_TTL']
+    token = store.acquire_flush(ttl)
+    if token is None:
+        return 0
+
+    written = 0
+    try:
+        while True:
+            ops = store.claim(batch_size)
+            if not ops:
+                break
+            _apply(ops)
+            store.ack()
+            written += len(ops)
+            # 每批之后续期；锁已经丢了（这一批超过了TTL）就停下，剩下的交给拿到锁的进程
+            if not store.extend_flush(token, ttl):
+                logger.warning('座位分配器写回锁已过期，停止本次写回')
+                return written
+    finally:
+        store.release_flush(token)
+    return written
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+_flush_wanted = threading.Event()
+
+
+def _flush_loop():
+    while True:
+        _flush_wanted.wait()
+        _flush_wanted.clear()
+        try:
+            flush()
+        except Exception:
+            # 日志还在存储里，下次唤醒或 flush_seats 命令会重试
+            logger.exception('座位分配器写回失败')
+        finally:
+            connections.close_all()
+
+
+def _wake_flusher():
+    """唤醒本进程的后台写回线程（第一次调用时启动）；请求线程立即返回"""
+    global _flusher
+    if not get_config()['FLUSH_THREAD']:
+        return
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, daemon=True, name='seat-flush')
+                _flusher.start()
+    _flush_wanted.set()
+
+
+def reconcile(course_ids=None):
+    """
+    崩溃恢复：写回所有待写日志，按选课记录重算计数器，再用数据库状态覆盖存储
+    在没有选课流量时运行（比如服务启动时、开放选课之前）
+    """
+    flush()
+    seats.recount(course_ids)
+    if course_ids is None:
+        course_ids = Course.objects.values_list('id', flat=True)
+
+    store = get_store()
+    for course_id in list(course_ids):
+        _load_course(store, course_id, replace=True)
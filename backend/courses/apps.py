@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoursesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "courses"
+
+    def ready(self):
+        # 多进程部署却用进程内缓存保存版本号、或用进程内存储分配座位时，启动即失败
+        from . import allocator, versions
+        versions.check_shared_cache()
+        allocator.check_shared_store()
@@ -0,0 +1,190 @@
+"""
+课程目录缓存
+
+可选课程列表里，课程/教师部分对所有学生都一样，已选人数变化得也远比被读取得少。
+这里把目录拆成两块放进缓存：
+
+- 课程条目，按目录版本号缓存，创建/删除课程时 versions.bump_catalog() 换新版本。
+  缓存的是已经编码好的JSON片段（每门课 {"id":..,"name":..,"description":..,"teacher":..,"capacity":..
+  去掉结尾的 }），读取时不需要反序列化成字典再重新编码，直接拼上人数和选课状态；
+- 每门课一个已选人数键（和容量键），选课/退课提交后由 events.publish_moved() 按变化量 incr
+  那几门课的人数，不查库，其他课程的缓存不受影响。缺失的键用一条 id IN (...) 查询补齐。
+
+每个请求只需要再查一次该学生的已选课程ID集合，和缓存里的目录合并即可。
+重建缓存时读主库：副本上的旧数据一旦按新版本号缓存，要到下次换版本才会更新。
+"""
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.replicas import primary
+from backend.responses import dumps, loads
+from . import versions
+from .loaders import Loader
+from .models import Course
+
+# 可选课程接口支持 fields= 裁剪的字段
+FIELDS = ('id', 'name', 'description', 'teacher', 'capacity', 'enrolled', 'is_full', 'is_enrolled')
+
+_BOOL = {True: b'true', False: b'false'}
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _seats_timeout():
+    # 人数键由提交后的回调直接改写，过期时间只是并发写入顺序颠倒时旧值最多保留多久
+    return getattr(settings, 'CATALOG_SEATS_TIMEOUT', 30)
+
+
+def _build_entries(catalog_version):
+    """从数据库构建课程条目"""
+    courses = list(Course.objects.order_by('id').only(
+        'id', 'name', 'description', 'teacher_id', 'capacity'
+    ))
+    teacher_names = Loader().teacher_names(courses)
+    return (
+        catalog_version,
+        [c.id for c in courses],
+        [c.teacher_id for c in courses],
+        [c.capacity for c in courses],
+        [dumps({
+            'id': c.id,
+            'name': c.name,
+            'description': c.description,
+            'teacher': teacher_names.get(c.teacher_id, '未知'),
+            'capacity': c.capacity,
+        })[:-1] for c in courses],
+    )
+
+
+def get_catalog():
+    """
+    返回课程条目 (目录版本, id列表, 教师id列表, 容量列表, JSON片段列表)，按id排序
+    来自缓存，未命中时用一次查询重建
+    """
+    catalog_version, = versions.get(versions.CATALOG)
+
+    entries_key = f'catalog:entries:{catalog_version}'
+    entries = cache.get(entries_key)
+    if entries is None:
+        with primary():
+            entries = _build_entries(catalog_version)
+        cache.set(entries_key, entries, _timeout())
+    return entries
+
+
+def _seat_key(catalog_version, course_id):
+    return f'catalog:seat:{catalog_version}:{course_id}'
+
+
+def _capacity_key(catalog_version, course_id):
+    return f'catalog:capacity:{catalog_version}:{course_id}'
+
+
+def _store(catalog_version, rows):
+    """写入 (course_id, enrolled_count, capacity) 行的人数和容量"""
+    data = {}
+    for course_id, enrolled, capacity in rows:
+        data[_seat_key(catalog_version, course_id)] = enrolled
+        data[_capacity_key(catalog_version, course_id)] = capacity
+    cache.set_many(data, _seats_timeout())
+
+
+def seat_counts(catalog_version, course_ids):
+    """这些课程的已选人数 {course_id: enrolled_count}，缓存里没有的查一次库补上"""
+    keys = {_seat_key(catalog_version, course_id): course_id for course_id in course_ids}
+    counts = {keys[key]: n for key, n in cache.get_many(keys).items()}
+    missing = [course_id for course_id in course_ids if course_id not in counts]
+    if missing:
+        with primary():
+            rows = list(Course.objects.filter(id__in=missing).values_list('id', 'enrolled_count', 'capacity'))
+        _store(catalog_version, rows)
+        counts.update({course_id: 0 for course_id in missing})
+        counts.update({course_id: enrolled for course_id, enrolled, _ in rows})
+    return counts
+
+
+def store_seats(rows):
+    """提交后写入变化课程的最新人数，rows 是 (course_id, enrolled_count, capacity)"""
+    if rows:
+        catalog_version, = versions.get(versions.CATALOG)
+        _store(catalog_version, rows)
+
+
+def add_seats(deltas):
+    """
+    按人数变化量 {course_id: +n/-n} 原子地改写缓存里的人数（不查库）
+    返回缓存里有的课程 {course_id: (新人数, 容量)}，没有的由调用方查库
+    """
+    catalog_version, = versions.get(versions.CATALOG)
+    capacities = cache.get_many([_capacity_key(catalog_version, course_id) for course_id in deltas])
+    moved = {}
+    for course_id, delta in deltas.items():
+        capacity = capacities.get(_capacity_key(catalog_version, course_id))
+        if capacity is None:
+            continue
+        try:
+            moved[course_id] = (cache.incr(_seat_key(catalog_version, course_id), delta), capacity)
+        except ValueError:
+            continue  # 人数键已过期
+    return moved
+
+
+def query(entries, enrolled_ids, after=0, limit=None,
+          teacher_id=None, has_seats=False, not_enrolled=False):
+    """
+    在缓存的目录上按游标和过滤条件取一页，已合并学生自己的选课状态
+    返回 (行列表, next_cursor)，行是 (条目下标, 已选人数, 是否已选)
+
+    先按不依赖人数的条件挑出候选，只读取候选课程的人数；
+    has_seats 过滤掉已满的课程后不够一页时再往后取一批。
+    """
+    catalog_version, ids, teacher_ids, capacities, _ = entries
+    # 多取一条用来判断是否还有下一页
+    want = len(ids) if limit is None else limit + 1
+    rows = []
+    i = bisect_right(ids, after)
+    while i < len(ids) and len(rows) < want:
+        candidates = []
+        while i < len(ids) and len(candidates) < want - len(rows):
+            if teacher_id is None or teacher_ids[i] == teacher_id:
+                if not (not_enrolled and ids[i] in enrolled_ids):
+                    candidates.append(i)
+            i += 1
+        counts = seat_counts(catalog_version, [ids[j] for j in candidates])
+        for j in candidates:
+            enrolled_count = counts[ids[j]]
+            if has_seats and enrolled_count >= capacities[j]:
+                continue
+            rows.append((j, enrolled_count, ids[j] in enrolled_ids))
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, ids[rows[-1][0]]
+    return rows, None
+
+
+def render(entries, rows, next_cursor, fields=None):
+    """
+    拼成响应体 {"courses":[...],"next_cursor":...}
+    不裁剪字段时直接拼接缓存的JSON片段，裁剪字段时才解析片段
+    """
+    _, _, _, capacities, fragments = entries
+    if fields is not None:
+        courses = []
+        for j, enrolled_count, is_enrolled in rows:
+            item = loads(fragments[j] + b'}')
+            item.update(enrolled=enrolled_count, is_full=enrolled_count >= capacities[j], is_enrolled=is_enrolled)
+            courses.append({f: item[f] for f in fields})
+        return dumps({'courses': courses, 'next_cursor': next_cursor})
+
+    parts = [
+        b'%s,"enrolled":%d,"is_full":%s,"is_enrolled":%s}' % (
+            fragments[j], enrolled_count, _BOOL[enrolled_count >= capacities[j]], _BOOL[is_enrolled]
+        )
+        for j, enrolled_count, is_enrolled in rows
+    ]
+    return b'{"courses":[' + b','.join(parts) + b'],"next_cursor":' + dumps(next_cursor) + b'}'
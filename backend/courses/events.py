@@ -0,0 +1,221 @@
+"""
+座位变化实时推送
+
+选课/退课/创建/删除课程提交后，把变化的课程 (course_id, enrolled, is_full)
+发布到消息代理，SSE接口把消息推给所有正在看课程列表的客户端，
+客户端不用再反复拉取整个课程列表。
+
+- InProcessBroker 进程内广播，单进程部署和测试用
+- RedisBroker     通过Redis pub/sub跨进程广播；每个进程只订阅一次Redis，
+                  再在进程内分发给本进程的所有连接
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from . import catalog
+from .models import Course
+
+DEFAULTS = {
+    'BACKEND': 'memory',        # memory | redis
+    'URL': 'redis://localhost:6379/0',
+    'CHANNEL': 'seat-events',
+    'QUEUE_SIZE': 256,          # 每个连接最多积压的消息数，满了丢弃最旧的
+    'HEARTBEAT': 15,            # 心跳间隔（秒）
+    'MAX_AGE': 300,             # 单个连接最长保持时间（秒），到期后客户端自动重连
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SEAT_EVENTS', {})}
+
+
+def _offer(queue, message):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class InProcessBroker:
+    """进程内广播"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def _fanout(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for entry in subscribers:
+            loop, queue = entry
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # 事件循环已关闭
+                with self._lock:
+                    self._subscribers.discard(entry)
+
+    def publish(self, message):
+        """发布一条消息（可以在任意线程调用）"""
+        self._fanout(message)
+
+    def subscribe(self):
+        """订阅（需要在事件循环里调用），返回 Subscription"""
+        subscription = Subscription(self, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription.entry)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription.entry)
+
+
+class Subscription:
+    """一个连接的消息队列"""
+
+    def __init__(self, broker, loop, queue_size):
+        self.broker = broker
+        self.entry = (loop, asyncio.Queue(maxsize=queue_size))
+
+    async def get(self):
+        return await self.entry[1].get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class RedisBroker(InProcessBroker):
+    """Redis pub/sub 广播"""
+
+    def __init__(self, url, channel, queue_size=256):
+        super().__init__(queue_size)
+        import redis
+        self.url = url
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        self._relays = {}
+
+    def publish(self, message):
+        self._client.publish(self.channel, message)
+
+    async def _relay(self):
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel)
+        async for item in pubsub.listen():
+            if item['type'] == 'message':
+                data = item['data']
+                self._fanout(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+    def subscribe(self):
+        # 每个事件循环只起一个转发任务
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._relays.get(loop)
+            if task is None or task.done():
+                self._relays[loop] = loop.create_task(self._relay())
+        return super().subscribe()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """按配置创建（并缓存）消息代理"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = get_config()
+                if config['BACKEND'] == 'redis':
+                    _broker = RedisBroker(config['URL'], config['CHANNEL'], config['QUEUE_SIZE'])
+                else:
+                    _broker = InProcessBroker(config['QUEUE_SIZE'])
+    return _broker
+
+
+def reset_broker(broker=None):
+    """替换消息代理（测试用）"""
+    global _broker
+    _broker = broker
+
+
+def _publish(broker, course_id, enrolled, capacity):
+    broker.publish(json.dumps({
+        'course_id': course_id,
+        'enrolled': enrolled,
+        'capacity': capacity,
+        'is_full': enrolled >= capacity,
+    }))
+
+
+def publish_seats(course_ids):
+    """立即查询这些课程的最新人数，写入目录缓存并发布；课程已不存在的发布删除消息"""
+    course_ids = set(course_ids)
+    if not course_ids:
+        return
+    broker = get_broker()
+    rows = list(Course.objects.filter(id__in=course_ids).values_list('id', 'enrolled_count', 'capacity'))
+    # 目录缓存里只更新这几门课的人数
+    catalog.store_seats(rows)
+    for course_id, enrolled, capacity in rows:
+        course_ids.discard(course_id)
+        _publish(broker, course_id, enrolled, capacity)
+    for course_id in course_ids:
+        broker.publish(json.dumps({'course_id': course_id, 'deleted': True}))
+
+
+def publish_moved(deltas):
+    """
+    按人数变化量 {course_id: +n/-n} 改写目录缓存里的人数并发布，新人数由缓存的 incr 返回，不查库；
+    缓存里没有这门课时退回 publish_seats() 查一次
+    """
+    broker = get_broker()
+    moved = catalog.add_seats(deltas)
+    for course_id, (enrolled, capacity) in moved.items():
+        _publish(broker, course_id, enrolled, capacity)
+    publish_seats(course_id for course_id in deltas if course_id not in moved)
+
+
+def seats_changed(*course_ids):
+    """课程增删、人数重算后调用（在事务中调用时，提交后才发布）"""
+    transaction.on_commit(lambda: publish_seats(course_ids), robust=True)
+
+
+def seats_moved(deltas):
+    """
+    选课/退课占用或归还座位后调用，deltas 是 {course_id: 人数变化量}（提交后才发布）
+    发布失败不影响已经提交的选课，只记日志
+    """
+    transaction.on_commit(lambda: publish_moved(deltas), robust=True)
+
+
+async def sse_stream(broker=None):
+    """把广播消息格式化成 Server-Sent Events，空闲时发心跳，到期后结束让客户端重连"""
+    config = get_config()
+    broker = broker or get_broker()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config['MAX_AGE']
+
+    subscription = broker.subscribe()
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            timeout = min(config['HEARTBEAT'], deadline - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield f'event: seats\ndata: {message}\n\n'
+    finally:
+        subscription.close()
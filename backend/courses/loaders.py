@@ -0,0 +1,66 @@
+"""
+应用层批量关联（无外键）
+
+模型之间只用普通int字段关联，以前视图里逐行 filter(id=...).first()，
+课程一多就是 N+1 查询。这里把关联改成批量加载：
+每张关联表一次 id__in 查询，人数统计一次 GROUP BY，
+并且在同一个加载器内缓存已加载的对象（identity map），重复的id不会再查库。
+"""
+from django.db.models import Count
+
+from students.models import Student
+from teachers.models import Teacher
+from . import sharding
+from .models import Course, Enrollment
+
+
+class Loader:
+    """批量加载器（一次组装用一个，如课程目录、学生课表的构建）"""
+
+    def __init__(self):
+        # identity map：{模型类: {id: 对象或None}}
+        self._objects = {}
+
+    def load(self, model, ids):
+        """按id批量加载对象，返回 {id: 对象}（不存在的id不会出现在结果里）"""
+        cache = self._objects.setdefault(model, {})
+        missing = {i for i in ids if i is not None and i not in cache}
+        if missing:
+            found = {obj.id: obj for obj in model.objects.filter(id__in=missing)}
+            for i in missing:
+                # 不存在的也记下来，避免同一请求里反复查询
+                cache[i] = found.get(i)
+        return {i: cache[i] for i in ids if cache.get(i) is not None}
+
+    def teachers(self, ids):
+        """批量加载教师"""
+        return self.load(Teacher, ids)
+
+    def students(self, ids):
+        """批量加载学生"""
+        return self.load(Student, ids)
+
+    def courses(self, ids):
+        """批量加载课程"""
+        return self.load(Course, ids)
+
+    def teacher_names(self, courses):
+        """课程列表对应的教师名 {teacher_id: username}"""
+        teachers = self.teachers({c.teacher_id for c in courses})
+        return {tid: t.username for tid, t in teachers.items()}
+
+
+def enrollment_counts(course_ids):
+    """每个分片一次GROUP BY统计每门课的已选人数 {course_id: count}"""
+    course_ids = list(course_ids)
+    if not course_ids:
+        return {}
+    counts = dict.fromkeys(course_ids, 0)
+    for shard, shard_course_ids in sharding.group(course_ids).items():
+        counts.update(Enrollment.objects.using(shard)
+                      .filter(course_id__in=shard_course_ids)
+                      .values('course_id')
+                      .annotate(n=Count('id'))
+                      .values_list('course_id', 'n'))
+    return counts
+
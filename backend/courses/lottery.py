@@ -0,0 +1,226 @@
+"""
+志愿抽签选课（可选模式）
+
+先到先得的选课让每次开放选课都变成一场抢座，是全年最大的负载尖峰。
+打开 LOTTERY['ENABLED'] 后，选课窗口内学生只提交按顺序排列的志愿
+（每次整体替换：一条DELETE + 一次bulk_create），选课接口拒绝实时选课；
+窗口结束后运行 python manage.py allocate_lottery 一次性分配所有座位。
+
+分配按志愿轮次进行：第 r 轮处理每个学生的第 r 个志愿，一门课的申请人数超过剩余座位时，
+本次已分到课程少的学生优先，同样多的按随机数排序（每轮重新抽签，同一个 seed 结果相同）。
+每轮只是几次数组排序：安装了 numpy 时用向量化实现，否则用等价的纯Python实现，结果完全一样。
+
+剩余座位按选课记录实际人数计算，中途失败后重新运行不会超卖；写完后按选课记录重算计数器。
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from . import events, schedules, seats, sharding, versions
+from .loaders import enrollment_counts
+from .models import Course, CoursePreference, Enrollment
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_PREFERENCES': 10,  # 每个学生最多提交的志愿数
+}
+
+# 写入选课记录时每个事务的行数
+CHUNK_SIZE = 5000
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOTTERY', {})}
+
+
+def enabled():
+    """是否处于志愿抽签模式"""
+    return bool(get_config()['ENABLED'])
+
+
+# ==================== 提交志愿 ====================
+
+def submit(student_id, course_ids):
+    """整体替换该学生的志愿（course_ids 按志愿顺序排列，已去重）"""
+    with transaction.atomic():
+        CoursePreference.objects.filter(student_id=student_id).delete()
+        CoursePreference.objects.bulk_create([
+            CoursePreference(student_id=student_id, course_id=course_id, rank=rank)
+            for rank, course_id in enumerate(course_ids)
+        ])
+
+
+def preferences(student_id):
+    """该学生的志愿 [course_id, ...]，按志愿顺序"""
+    return list(CoursePreference.objects.filter(student_id=student_id)
+                .order_by('rank').values_list('course_id', flat=True))
+
+
+# ==================== 分配 ====================
+
+def load(last_id):
+    """
+    读取 id <= last_id 的志愿和剩余座位
+    返回 (学生id列表, 课程id列表, 每个学生的志愿[课程下标...], 每门课的剩余座位)
+    已经选上的课程、已删除的课程从志愿里去掉，后面的志愿依次前移
+    """
+    capacities = dict(Course.objects.values_list('id', 'capacity'))
+    course_ids = sorted(capacities)
+    course_index = {course_id: i for i, course_id in enumerate(course_ids)}
+    counts = enrollment_counts(course_ids)
+    remaining = [max(0, capacities[c] - counts[c]) for c in course_ids]
+
+    student_ids = []
+    wanted = []
+    last = None
+    rows = (CoursePreference.objects.filter(id__lte=last_id).order_by('student_id', 'rank')
+            .values_list('student_id', 'course_id').iterator(chunk_size=CHUNK_SIZE))
+    for student_id, course_id in rows:
+        if student_id != last:
+            student_ids.append(student_id)
+            wanted.append([])
+            last = student_id
+        if course_id in course_index:
+            wanted[-1].append(course_id)
+
+    # 只读取提交了志愿的学生的选课记录，每批 CHUNK_SIZE 个学生，每个分片一次查询
+    existing = set()
+    for start in range(0, len(student_ids), CHUNK_SIZE):
+        chunk = student_ids[start:start + CHUNK_SIZE]
+        for shard_rows in sharding.scatter(lambda alias: list(
+            Enrollment.objects.using(alias).filter(student_id__in=chunk).values_list('student_id', 'course_id')
+        )).values():
+            existing.update(shard_rows)
+
+    prefs = [
+        [course_index[course_id] for course_id in course_list if (student_id, course_id) not in existing]
+        for student_id, course_list in zip(student_ids, wanted)
+    ]
+    return student_ids, course_ids, prefs, remaining
+
+
+def _draws(rng, n):
+    return [rng.random() for _ in range(n)]
+
+
+def _allocate_python(prefs, remaining, rng):
+    remaining = list(remaining)
+    got = [0] * len(prefs)
+    pairs = []
+    rounds = max(map(len, prefs), default=0)
+    for r in range(rounds):
+        draw = _draws(rng, len(prefs))
+        # 按 (课程, 已分到课程数, 随机数, 学生下标) 排序，每门课依次录取到满为止
+        applicants = sorted(
+            (p[r], got[i], draw[i], i) for i, p in enumerate(prefs) if r < len(p)
+        )
+        for course, _, _, i in applicants:
+            if remaining[course] > 0:
+                remaining[course] -= 1
+                got[i] += 1
+                pairs.append((i, course))
+    return pairs
+
+
+def _allocate_numpy(prefs, remaining, rng):
+    n = len(prefs)
+    rounds = max(map(len, prefs), default=0)
+    matrix = numpy.full((n, rounds), -1, dtype=numpy.int64)
+    lengths = numpy.fromiter(map(len, prefs), dtype=numpy.int64, count=n)
+    if rounds:
+        matrix[numpy.arange(rounds) < lengths[:, None]] = numpy.fromiter(
+            (c for p in prefs for c in p), dtype=numpy.int64, count=int(lengths.sum())
+        )
+
+    remaining = numpy.array(remaining, dtype=numpy.int64)
+    got = numpy.zeros(n, dtype=numpy.int64)
+    students, courses = [], []
+    for r in range(rounds):
+        draw = numpy.array(_draws(rng, n))
+        applicants = numpy.nonzero(matrix[:, r] >= 0)[0]
+        course = matrix[applicants, r]
+        # 和纯Python实现相同的顺序：课程、已分到课程数、随机数，最后按学生下标（lexsort是稳定排序）
+        order = numpy.lexsort((draw[applicants], got[applicants], course))
+        applicants, course = applicants[order], course[order]
+        # 每个申请人在本课程申请队列中的位置，排在剩余座位数以内的录取
+        position = numpy.arange(len(course)) - numpy.searchsorted(course, course)
+        admitted = position < remaining[course]
+        applicants, course = applicants[admitted], course[admitted]
+        remaining -= numpy.bincount(course, minlength=len(remaining))
+        got[applicants] += 1
+        students.append(applicants)
+        courses.append(course)
+    if not students:
+        return []
+    return list(zip(numpy.concatenate(students).tolist(), numpy.concatenate(courses).tolist()))
+
+
+def allocate(prefs, remaining, seed=None, use_numpy=None):
+    """按志愿分配座位，返回 [(学生下标, 课程下标)]"""
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    rng = random.Random(seed)
+    if use_numpy:
+        return _allocate_numpy(prefs, remaining, rng)
+    return _allocate_python(prefs, remaining, rng)
+
+
+def _write(pairs):
+    """分块写入选课记录，已存在的跳过"""
+    for start in range(0, len(pairs), CHUNK_SIZE):
+        chunk = pairs[start:start + CHUNK_SIZE]
+        shards = {}
+        for student_id, course_id in chunk:
+            shards.setdefault(sharding.shard_for(course_id), []).append(
+                Enrollment(student_id=student_id, course_id=course_id)
+            )
+        with sharding.atomic(*shards):
+            for shard, rows in shards.items():
+                Enrollment.objects.using(shard).bulk_create(rows, ignore_conflicts=True)
+        # 课表在学生下次打开“我的课程”时重建
+        student_ids = {student_id for student_id, _ in chunk}
+        schedules.invalidate(*student_ids)
+        versions.bump(*(versions.student(student_id) for student_id in student_ids))
+
+
+def run(seed=None, dry_run=False, keep=False):
+    """
+    读取志愿、分配、写入选课记录并重算计数器，最后清空志愿（keep=True 时保留）
+    返回统计 {'students', 'preferences', 'enrolled', 'satisfied_first', 'no_seat'}
+    """
+    # 只处理运行开始前提交的志愿
+    last_id = CoursePreference.objects.aggregate(m=Max('id'))['m'] or 0
+    student_ids, course_ids, prefs, remaining = load(last_id)
+    pairs = allocate(prefs, remaining, seed)
+
+    got = Counter(i for i, _ in pairs)
+    first = {(i, p[0]) for i, p in enumerate(prefs) if p}
+    stats = {
+        'students': len(student_ids),
+        'preferences': sum(map(len, prefs)),
+        'enrolled': len(pairs),
+        'satisfied_first': sum(1 for pair in pairs if pair in first),
+        'no_seat': sum(1 for i, p in enumerate(prefs) if p and not got[i]),
+    }
+    if dry_run:
+        return stats
+
+    enrollments = [(student_ids[i], course_ids[c]) for i, c in pairs]
+    _write(enrollments)
+    touched = {course_id for _, course_id in enrollments}
+    # 几千门课的计数器更新放在一个事务里提交
+    with transaction.atomic():
+        seats.recount(touched)
+    versions.bump(versions.SEATS)
+    events.seats_changed(*touched)
+    if not keep:
+        CoursePreference.objects.filter(id__lte=last_id).delete()
+    return stats
@@ -0,0 +1,28 @@
+"""
+志愿抽签：按学生提交的志愿一次性分配所有座位
+用法：python manage.py allocate_lottery [--seed 42] [--dry-run] [--keep]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses import lottery
+
+
+class Command(BaseCommand):
+    help = '按志愿分配座位，批量写入选课记录（志愿抽签模式，选课窗口结束后运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=None, help='抽签随机种子（相同种子结果相同）')
+        parser.add_argument('--dry-run', action='store_true', help='只计算分配结果，不写库')
+        parser.add_argument('--keep', action='store_true', help='分配后保留志愿（默认清空）')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stats = lottery.run(options['seed'], dry_run=options['dry_run'], keep=options['keep'])
+        prefix = '（试运行，未写库）' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{stats["students"]} 名学生、{stats["preferences"]} 个志愿，'
+            f'分配 {stats["enrolled"]} 个座位，{stats["satisfied_first"]} 人选上第一志愿，'
+            f'{stats["no_seat"]} 人一门也没选上，用时 {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,27 @@
+"""
+把座位分配器的待写日志写回数据库
+用法：python manage.py flush_seats [--loop] [--interval 0.5]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses import allocator
+
+
+class Command(BaseCommand):
+    help = '把座位分配器的待写日志批量写回 enrollments 表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续运行，按间隔写回')
+        parser.add_argument('--interval', type=float, default=0.5, help='写回间隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=None, help='每批写回的操作数')
+
+    def handle(self, *args, **options):
+        while True:
+            written = allocator.flush(options['batch_size'])
+            if written or not options['loop']:
+                self.stdout.write(f'已写回 {written} 条选课操作')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+"""
+分批清理已删除课程的选课记录和课程行
+用法：python manage.py purge_courses [--loop] [--interval 60] [--batch-size 500] [--sleep 0.05]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses import purge
+
+
+class Command(BaseCommand):
+    help = '分批删除已打删除标记的课程的选课记录，然后删除课程行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续运行，按间隔检查')
+        parser.add_argument('--interval', type=float, default=60, help='检查间隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=None, help='每批删除的选课记录数')
+        parser.add_argument('--sleep', type=float, default=None, help='批间最少休息（秒）')
+
+    def handle(self, *args, **options):
+        while True:
+            courses, removed = purge.purge_pending(options['batch_size'], options['sleep'])
+            if courses or not options['loop']:
+                self.stdout.write(f'已清理 {courses} 门课程，删除 {removed} 条选课记录')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+"""
+按选课记录重建学生课表（“我的课程”的物化结果）
+用法：python manage.py rebuild_schedules [学生ID ...] [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+
+from courses import schedules
+from courses.models import StudentSchedule
+from students.models import Student
+
+
+class Command(BaseCommand):
+    help = '按选课记录重建 student_schedules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('student_ids', nargs='*', type=int, help='只重建指定学生（默认全部）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批重建的学生数')
+
+    def handle(self, *args, **options):
+        student_ids = options['student_ids']
+        if not student_ids:
+            student_ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+            # 已删除学生的课表
+            StudentSchedule.objects.exclude(student_id__in=Student.objects.values('id')).delete()
+
+        batch_size = options['batch_size']
+        total = 0
+        for i in range(0, len(student_ids), batch_size):
+            total += schedules.rebuild(student_ids[i:i + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'已重建 {total} 个学生的课表'))
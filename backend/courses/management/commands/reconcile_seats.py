@@ -0,0 +1,18 @@
+"""
+座位分配器崩溃恢复：写回待写日志，重算计数器，再按数据库重建分配器状态
+用法：python manage.py reconcile_seats [课程ID ...]
+"""
+from django.core.management.base import BaseCommand
+
+from courses import allocator
+
+
+class Command(BaseCommand):
+    help = '按数据库对账并重建座位分配器状态（请在没有选课流量时运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='只对账指定课程（默认全部）')
+
+    def handle(self, *args, **options):
+        allocator.reconcile(options['course_ids'] or None)
+        self.stdout.write(self.style.SUCCESS('座位分配器已按数据库重建'))
@@ -0,0 +1,18 @@
+"""
+按选课记录重新计算课程的已选人数计数器
+用法：python manage.py recount_seats [课程ID ...]
+"""
+from django.core.management.base import BaseCommand
+
+from courses import seats
+
+
+class Command(BaseCommand):
+    help = '按选课记录重新计算 courses.enrolled_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='只修复指定课程（默认全部）')
+
+    def handle(self, *args, **options):
+        fixed = seats.recount(options['course_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'已修正 {fixed} 门课程的已选人数'))
@@ -0,0 +1,245 @@
+"""
+选课高峰压测：模拟大量学生同时抢少数几门热门课
+用法：python manage.py rush_bench [--students 200] [--concurrency 32] [--hot 3] [--capacity 20]
+                                  [--rounds 5] [--drop-ratio 0.3] [--seed 42] [--rate-limit]
+
+不需要启动服务：每个模拟学生一个 django.test.Client，在线程池里并发调用真实的URL路由。
+1. 登录阶段：所有学生登录
+2. 抢课阶段：每个学生先拉一次 /api/student/courses/，再对热门课反复选课/退课
+
+输出每个接口的吞吐、p50/p95/p99延迟、SQL条数（来自 backend.metrics 中间件），
+以及最关键的两项：超卖的座位数、重复的选课记录数，正确的实现两项都应为0。
+
+默认关闭限流（RATE_LIMIT）：所有模拟学生都来自同一个进程，不关的话测出来的主要是限流器。
+--rate-limit 保留配置里的限流，每个模拟学生用不同的 REMOTE_ADDR，按真实用户各自的桶计算。
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from backend import metrics, ratelimit
+from backend.hashing import hash_password
+from courses import allocator, sharding, versions
+from courses.models import Course, Enrollment
+from students.models import Student
+from teachers.models import Teacher
+
+PREFIX = 'rush'
+PASSWORD = 'password123'
+
+# 接口名 -> 对应的URL名（用来从 metrics 取SQL条数）
+URL_NAMES = {
+    'login': 'student-login',
+    'courses': 'student-courses',
+    'enroll': 'student-enroll',
+    'drop': 'student-drop',
+}
+
+
+def percentile(sorted_values, p):
+    """最近秩百分位"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """收集每个接口的延迟和状态码"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name, seconds, status):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][status] += 1
+
+
+class Command(BaseCommand):
+    help = '模拟选课高峰，报告延迟、吞吐、SQL条数、超卖和重复选课'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32, help='并发线程数')
+        parser.add_argument('--hot', type=int, default=3, help='热门课程数')
+        parser.add_argument('--capacity', type=int, default=20, help='每门热门课的容量')
+        parser.add_argument('--rounds', type=int, default=5, help='每个学生的选课/退课次数')
+        parser.add_argument('--drop-ratio', type=float, default=0.3, help='选课成功后立即退课的概率')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='保留配置里的限流（默认关闭，只测选课本身）')
+
+    def handle(self, *args, **options):
+        rate_limit = {**getattr(settings, 'RATE_LIMIT', {})}
+        if not options['rate_limit']:
+            rate_limit['ENABLED'] = False
+        # 中间件在每个 Client 第一次请求时读取配置，所有 Client 都在这里面创建
+        with override_settings(RATE_LIMIT=rate_limit):
+            ratelimit.reset_store()
+            self.stdout.write('限流：' + ('开启（每个学生一个IP）' if ratelimit.get_config()['ENABLED'] else '关闭'))
+            self._bench(options)
+
+    def _bench(self, options):
+        self.recorder = Recorder()
+        self.options = options
+        courses, students = self._setup(options)
+        course_ids = [c.id for c in courses]
+
+        before = metrics.snapshot()
+
+        # 登录阶段
+        started = time.perf_counter()
+        clients = self._run(options['concurrency'], self._login, list(enumerate(students)))
+        login_elapsed = time.perf_counter() - started
+
+        # 抢课阶段（所有学生同时开始）
+        rngs = [random.Random(options['seed'] * 100003 + s.id) for s in students]
+        started = time.perf_counter()
+        self._run(options['concurrency'], lambda args: self._rush(*args, course_ids),
+                  [(client, rng) for client, rng in zip(clients, rngs) if client])
+        rush_elapsed = time.perf_counter() - started
+
+        if allocator.enabled():
+            allocator.flush()
+
+        self._report(before, login_elapsed, rush_elapsed)
+        self._check(courses)
+
+    # ==================== 数据准备 ====================
+
+    def _setup(self, options):
+        """删除上一次压测的数据，重新创建热门课程和学生"""
+        old_courses = Course.all_objects.filter(name__startswith=f'{PREFIX}_')
+        for shard, course_ids in sharding.group(old_courses.values_list('id', flat=True)).items():
+            Enrollment.objects.using(shard).filter(course_id__in=course_ids).delete()
+        old_courses.delete()
+        Student.objects.filter(username__startswith=f'{PREFIX}_').delete()
+        Teacher.objects.filter(username__startswith=f'{PREFIX}_').delete()
+        if allocator.enabled():
+            allocator.reset_store()
+
+        password = hash_password(PASSWORD)
+        teacher = Teacher.objects.create(username=f'{PREFIX}_teacher', password=password,
+                                         email=f'{PREFIX}_teacher@example.com')
+        courses = [Course.objects.create(name=f'{PREFIX}_hot{i}', teacher_id=teacher.id,
+                                         capacity=options['capacity'])
+                   for i in range(options['hot'])]
+        Student.objects.bulk_create(
+            Student(username=f'{PREFIX}_s{i}', password=password, email=f'{PREFIX}_s{i}@example.com')
+            for i in range(options['students'])
+        )
+        students = list(Student.objects.filter(username__startswith=f'{PREFIX}_').order_by('id'))
+        versions.bump_catalog()
+        versions.bump_seats()
+        self.stdout.write(f'{len(students)} 个学生，{len(courses)} 门热门课，每门容量 {options["capacity"]}，'
+                          f'并发 {options["concurrency"]}')
+        return courses, students
+
+    # ==================== 模拟学生 ====================
+
+    def _run(self, concurrency, fn, items):
+        def task(item):
+            try:
+                return fn(item)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(task, items))
+
+    def _request(self, name, client, method, url, data=None):
+        start = time.perf_counter()
+        try:
+            if method == 'post':
+                response = client.post(url, json.dumps(data), content_type='application/json')
+            else:
+                response = client.get(url)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, type(e).__name__
+        self.recorder.add(name, time.perf_counter() - start, status)
+        return response
+
+    def _login(self, args):
+        i, student = args
+        # 每个学生一个IP，限流开启时不会所有学生共用 127.0.0.1 的桶
+        client = Client(REMOTE_ADDR=f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}')
+        response = self._request('login', client, 'post', '/api/student/login/',
+                                 {'username': student.username, 'password': PASSWORD})
+        return client if response is not None and response.status_code == 200 else None
+
+    def _rush(self, client, rng, course_ids):
+        self._request('courses', client, 'get', '/api/student/courses/')
+        for _ in range(self.options['rounds']):
+            course_id = rng.choice(course_ids)
+            response = self._request('enroll', client, 'post', '/api/student/enroll/',
+                                     {'course_id': course_id})
+            if response is not None and response.status_code in (201, 202) \
+                    and rng.random() < self.options['drop_ratio']:
+                self._request('drop', client, 'post', '/api/student/drop/', {'course_id': course_id})
+
+    # ==================== 报告 ====================
+
+    def _report(self, before, login_elapsed, rush_elapsed):
+        after = metrics.snapshot()
+        self.stdout.write('')
+        self.stdout.write(f'登录阶段 {login_elapsed:.2f}s，抢课阶段 {rush_elapsed:.2f}s')
+        self.stdout.write(f'{"接口":<8}{"请求":>7}{"吞吐/s":>9}{"p50ms":>9}{"p95ms":>9}{"p99ms":>9}'
+                          f'{"SQL/请求":>10}  状态码')
+        total_queries = 0
+        for name, url_name in URL_NAMES.items():
+            values = sorted(self.recorder.latencies.get(name, []))
+            if not values:
+                continue
+            elapsed = login_elapsed if name == 'login' else rush_elapsed
+            queries = after.get(url_name, [0] * metrics.ROW_SIZE)[metrics.SQL_COUNT] \
+                - before.get(url_name, [0] * metrics.ROW_SIZE)[metrics.SQL_COUNT]
+            total_queries += queries
+            statuses = ' '.join(f'{k}×{v}' for k, v in sorted(self.recorder.statuses[name].items(), key=str))
+            self.stdout.write(
+                f'{name:<8}{len(values):>7}{len(values) / elapsed:>9.1f}'
+                f'{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}'
+                f'{percentile(values, 99) * 1000:>9.1f}{queries / len(values):>10.1f}  {statuses}'
+            )
+        self.stdout.write(f'SQL合计 {total_queries} 条')
+        if 'backend.metrics.MetricsMiddleware' not in settings.MIDDLEWARE:
+            self.stdout.write('（未启用 MetricsMiddleware，SQL条数为0）')
+
+    def _check(self, courses):
+        """超卖、重复选课和计数器偏差"""
+        course_ids = [c.id for c in courses]
+        rows = {}
+        duplicates = 0
+        for shard, shard_course_ids in sharding.group(course_ids).items():
+            enrollments = Enrollment.objects.using(shard).filter(course_id__in=shard_course_ids)
+            rows.update(enrollments.values('course_id').annotate(n=Count('id')).values_list('course_id', 'n'))
+            duplicates += (enrollments.values('student_id', 'course_id')
+                           .annotate(n=Count('id')).filter(n__gt=1).count())
+
+        self.stdout.write('')
+        oversold = 0
+        drift = 0
+        for course in Course.objects.filter(id__in=course_ids).order_by('id'):
+            n = rows.get(course.id, 0)
+            oversold += max(0, n - course.capacity)
+            drift += abs(course.enrolled_count - n)
+            self.stdout.write(f'{course.name}: 选课记录 {n} / 容量 {course.capacity}，'
+                              f'计数器 {course.enrolled_count}')
+
+        summary = f'超卖座位 {oversold}，重复选课记录 {duplicates}，计数器偏差 {drift}'
+        if oversold or duplicates or drift:
+            self.stdout.write(self.style.ERROR(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -4,13 +4,28 @@
 from django.db import models
 
 
+class LiveCourseManager(models.Manager):
+    """只返回未删除的课程"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Course(models.Model):
     """课程模型 - 不用外键，用teacher_id"""
     name = models.CharField(max_length=200, verbose_name='课程名称')
     description = models.TextField(blank=True, verbose_name='课程描述')
     teacher_id = models.IntegerField(verbose_name='教师ID')  # 普通int，不用外键
     capacity = models.IntegerField(default=50, verbose_name='容量')
+    # 已选人数计数器，由 courses.seats 用条件UPDATE原子维护
+    enrolled_count = models.IntegerField(default=0, verbose_name='已选人数')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    # 删除标记：删除课程时先打标记，所有读接口立即看不到；选课记录由 courses.purge 在后台分批清理
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
+
+    # 默认只查未删除的课程；清理任务和数据工具用 all_objects
+    objects = LiveCourseManager()
+    all_objects = models.Manager()
 
     class Meta:
         db_table = 'courses'
@@ -31,10 +46,73 @@ class Enrollment(models.Model):
         db_table = 'enrollments'
         verbose_name = '选课记录'
         verbose_name_plural = '选课记录'
-        # 应用层保证唯一性，不在数据库层
+        # 唯一约束防止并发选课产生重复记录（不是外键）
+        constraints = [
+            models.UniqueConstraint(fields=['student_id', 'course_id'], name='uniq_student_course'),
+        ]
         indexes = [
-            models.Index(fields=['student_id', 'course_id']),
+            models.Index(fields=['course_id'], name='idx_course_id'),
         ]
 
     def __str__(self):
         return f'Student {self.student_id} - Course {self.course_id}'
+
+
+class CoursePreference(models.Model):
+    """选课志愿（志愿抽签模式，见 courses.lottery）- 不用外键"""
+    student_id = models.IntegerField(verbose_name='学生ID')  # 普通int
+    course_id = models.IntegerField(verbose_name='课程ID')   # 普通int
+    rank = models.PositiveSmallIntegerField(verbose_name='志愿顺序')  # 0 是第一志愿
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='提交时间')
+
+    class Meta:
+        db_table = 'course_preferences'
+        verbose_name = '选课志愿'
+        verbose_name_plural = '选课志愿'
+        constraints = [
+            models.UniqueConstraint(fields=['student_id', 'rank'], name='uniq_student_rank'),
+        ]
+
+    def __str__(self):
+        return f'Student {self.student_id} - Course {self.course_id} #{self.rank}'
+
+
+class WaitlistEntry(models.Model):
+    """候补队列（按id先后排队，见 courses.seats）- 不用外键"""
+    course_id = models.IntegerField(verbose_name='课程ID')   # 普通int
+    student_id = models.IntegerField(verbose_name='学生ID')  # 普通int
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='加入时间')
+
+    class Meta:
+        db_table = 'waitlist'
+        verbose_name = '候补'
+        verbose_name_plural = '候补'
+        constraints = [
+            models.UniqueConstraint(fields=['course_id', 'student_id'], name='uniq_waitlist_course_student'),
+        ]
+        indexes = [
+            # 取队首、计算排位都只扫这门课的一段索引
+            models.Index(fields=['course_id', 'id'], name='idx_waitlist_course'),
+            models.Index(fields=['student_id'], name='idx_waitlist_student'),
+        ]
+
+    def __str__(self):
+        return f'Student {self.student_id} - Course {self.course_id} (waitlist)'
+
+
+class StudentSchedule(models.Model):
+    """学生课表：“我的课程”接口的物化结果（见 courses.schedules）"""
+    student_id = models.IntegerField(primary_key=True, verbose_name='学生ID')  # 普通int
+    # 每次选课/退课加1，读取时重建课表用它判断期间有没有写入
+    generation = models.IntegerField(default=0, verbose_name='写入次数')
+    # 接口返回的JSON数组；NULL 表示待重建
+    courses = models.TextField(null=True, verbose_name='课表')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'student_schedules'
+        verbose_name = '学生课表'
+        verbose_name_plural = '学生课表'
+
+    def __str__(self):
+        return f'Schedule of student {self.student_id}'
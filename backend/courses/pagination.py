@@ -0,0 +1,81 @@
+"""
+列表接口的游标分页、过滤和字段裁剪
+
+分页用 id 做游标（keyset）：?after=<上一页最后一个id>&limit=<条数>，
+每页都是 WHERE id > after ORDER BY id LIMIT n，翻到多深都一样快。
+返回体里带 next_cursor，为 None 表示没有下一页。
+
+?fields=id,name,... 只返回指定字段，列表页可以不要 description 这种大字段。
+"""
+from django.conf import settings
+
+
+class ParamError(ValueError):
+    """查询参数不合法"""
+
+
+def _int_param(request, name, default):
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ParamError(f'参数 {name} 必须是整数')
+    if value < 0:
+        raise ParamError(f'参数 {name} 不能为负数')
+    return value
+
+
+def parse_page(request):
+    """解析游标分页参数，返回 (after, limit)"""
+    default_limit = getattr(settings, 'PAGE_DEFAULT_LIMIT', 100)
+    max_limit = getattr(settings, 'PAGE_MAX_LIMIT', 500)
+    after = _int_param(request, 'after', 0)
+    limit = _int_param(request, 'limit', default_limit)
+    return after, max(1, min(limit, max_limit))
+
+
+def parse_flag(request, name):
+    """解析布尔过滤参数（1/true/yes 为真）"""
+    return request.GET.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def parse_optional_int(request, name):
+    """解析可选的整数过滤参数，没传返回None"""
+    return _int_param(request, name, None)
+
+
+def parse_fields(request, allowed):
+    """解析 fields 参数，没传返回None（表示全部字段）"""
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ParamError(f'不支持的字段：{", ".join(unknown)}')
+    return fields
+
+
+def project(items, fields):
+    """按字段列表裁剪每一条数据"""
+    if fields is None:
+        return items
+    return [{f: item[f] for f in fields} for item in items]
+
+
+def paginate(items, limit):
+    """
+    items 是按id升序、最多 limit+1 条的列表（字典、模型对象，或第一列是id的 values_list 元组）
+    返回 (本页数据, next_cursor)
+    """
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        if isinstance(last, dict):
+            return items, last['id']
+        if isinstance(last, tuple):
+            return items, last[0]
+        return items, last.id
+    return items, None
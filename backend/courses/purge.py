@@ -0,0 +1,102 @@
+"""
+已删除课程的后台清理
+
+删除课程只在课程行上打 deleted_at 标记（一条UPDATE），接口立即返回；
+课程的选课记录在这里分批删除：每批按主键取一段 (id, student_id)，先把这批学生的课表标记为待重建，
+再 DELETE ... WHERE id IN (...)；每批都是独立的小事务，批与批之间休息，
+不长时间占用 enrollments 和 student_schedules 的锁、不压垮主库。
+选课记录删完后再删除课程行本身。
+
+- schedule(course_id)  删除事务提交后在后台线程里清理（COURSE_PURGE['THREAD']）
+- purge_pending()      清理所有打了标记的课程，python manage.py purge_courses 调用，
+                       用来兜底进程重启时没清理完的课程
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import schedules, sharding
+from .models import Course, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'THREAD': True,         # 删除后立即在后台线程清理
+    'BATCH_SIZE': 500,      # 每批删除的选课记录数
+    'SLEEP': 0.05,          # 批间最少休息（秒）；实际休息时间不少于这一批的执行时间
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'COURSE_PURGE', {})}
+
+
+def purge_course(course_id, batch_size=None, sleep=None):
+    """分批删除一门已删除课程的选课记录，最后删除课程行；返回删除的选课记录数"""
+    config = get_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    sleep = config['SLEEP'] if sleep is None else sleep
+
+    if not Course.all_objects.filter(id=course_id, deleted_at__isnull=False).exists():
+        return 0
+
+    shard = sharding.shard_for(course_id)
+    enrollments = sharding.for_course(course_id)
+    removed = 0
+    last_id = 0
+    while True:
+        started = time.monotonic()
+        batch = list(enrollments
+                     .filter(course_id=course_id, id__gt=last_id)
+                     .order_by('id')
+                     .values_list('id', 'student_id')[:batch_size])
+        if not batch:
+            break
+        ids = [enrollment_id for enrollment_id, _ in batch]
+        # 课表重建时已经看不到这门课（有删除标记），先标记还是先删除选课记录都不会读到它
+        schedules.invalidate_students([student_id for _, student_id in batch])
+        with transaction.atomic(using=shard):
+            removed += enrollments.filter(id__in=ids).delete()[0]
+        last_id = ids[-1]
+        if len(ids) < batch_size:
+            break
+        # 休息时间不少于这一批的执行时间：主库越忙，清理越慢
+        time.sleep(max(sleep, time.monotonic() - started))
+
+    # 候补队列只有排队的人，一条DELETE即可
+    WaitlistEntry.objects.using(shard).filter(course_id=course_id).delete()
+    Course.all_objects.filter(id=course_id, deleted_at__isnull=False).delete()
+    return removed
+
+
+def purge_pending(batch_size=None, sleep=None):
+    """清理所有已删除课程，返回 (课程数, 选课记录数)"""
+    course_ids = list(Course.all_objects.filter(deleted_at__isnull=False)
+                      .order_by('id').values_list('id', flat=True))
+    removed = 0
+    for course_id in course_ids:
+        removed += purge_course(course_id, batch_size, sleep)
+    return len(course_ids), removed
+
+
+def _run(course_id):
+    try:
+        purge_course(course_id)
+    except Exception:
+        # 没清理完的课程由 purge_courses 命令兜底
+        logger.exception('清理已删除课程 %s 失败', course_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(course_id):
+    """删除事务提交后在后台线程清理（关闭 THREAD 时只能靠 purge_courses 命令）"""
+    if not get_config()['THREAD']:
+        return
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run, args=(course_id,), daemon=True,
+                                 name=f'purge-course-{course_id}').start()
+    )
@@ -0,0 +1,195 @@
+"""
+学生课表（“我的课程”的物化结果）
+
+“我的课程”是访问量仅次于课程目录的接口，以前每次都要查选课记录、再按id批量查课程和教师。
+现在每个学生一行 student_schedules，courses 列直接存接口返回的JSON数组（课程名、描述、教师名、选课时间），
+读取时按主键查一次（读主库，见 get_json），原样拼进响应，不再反序列化：
+
+- 单门选课/退课（seats.enroll / seats.release）在同一个 default 事务里锁住这一行，增量改写JSON；
+  都在占座/还座的条件UPDATE之前执行，热门课程的行锁不会因为改课表而多持有一段时间
+- 批量选课/退课、候补转正、分配器写回、志愿抽签写入只把这一行标记为待重建（courses = NULL）
+- 删除课程后，后台清理删除选课记录时按批把这些学生标记为待重建（invalidate_students），
+  不在删除课程的请求里做；创建课程不影响任何课表
+- 读取时重建用 generation 做乐观锁：重建期间有选课/退课写过这一行就不保存，避免把旧数据写回去
+
+python manage.py rebuild_schedules 按选课记录重建所有课表（数据修复、上线时预热）。
+"""
+import json
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from backend.replicas import primary
+from backend.responses import dumps, format_datetime
+from teachers.models import Teacher
+from . import sharding, versions
+from .loaders import Loader
+from .models import Course, Enrollment, StudentSchedule
+
+
+def _build(student_id):
+    """按选课记录构建课表，返回 [行, ...]（和“我的课程”接口的格式相同）"""
+    enrollments = sharding.student_enrollments(student_id)
+    loader = Loader()
+    courses = loader.courses({course_id for _, course_id, _ in enrollments})
+    teacher_names = loader.teacher_names(courses.values())
+    return rows(enrollments, courses, teacher_names)
+
+
+def rows(enrollments, courses, teacher_names):
+    """组装课表行，enrollments 是 [(id, course_id, enrolled_at)]，跳过已删除的课程"""
+    data = []
+    for enrollment_id, course_id, enrolled_at in enrollments:
+        course = courses.get(course_id)
+        if not course:
+            continue
+        data.append(_row(enrollment_id, course.id, course.name, course.description,
+                         teacher_names.get(course.teacher_id, '未知'), enrolled_at))
+    return data
+
+
+def _row(enrollment_id, course_id, name, description, teacher, enrolled_at):
+    return {
+        'enrollment_id': enrollment_id,
+        'course_id': course_id,
+        'course_name': name,
+        'description': description,
+        'teacher': teacher,
+        'enrolled_at': format_datetime(enrolled_at),
+    }
+
+
+# ==================== 读取 ====================
+
+def get_json(student_id):
+    """
+    该学生课表的JSON数组（bytes）；课表有效时只查一次主键
+    读主库：ETag 是主库提交后换的学生版本号，副本上的旧课表一旦按新ETag返回，
+    客户端之后一直拿到304；重建结果也只能按主库的数据保存
+    """
+    with primary():
+        schedule = (StudentSchedule.objects.filter(student_id=student_id)
+                    .values_list('generation', 'courses').first())
+        if schedule is not None:
+            generation, courses = schedule
+            if courses is not None:
+                return courses.encode()
+        else:
+            generation = None
+
+        data = dumps(_build(student_id))
+    _store(student_id, generation, data.decode())
+    return data
+
+
+def _store(student_id, generation, courses):
+    """保存重建结果：行不存在时插入（已被并发的写入插入则放弃），存在时只在期间没有写入时更新"""
+    if generation is None:
+        StudentSchedule.objects.bulk_create([StudentSchedule(
+            student_id=student_id, courses=courses
+        )], ignore_conflicts=True)
+    else:
+        StudentSchedule.objects.filter(student_id=student_id, generation=generation).update(courses=courses)
+
+
+# ==================== 增量更新（在 default 事务中调用） ====================
+
+def _lock(student_id):
+    """锁住学生的课表行并返回解析后的课表；没有课表或待重建时标记为待重建、返回None"""
+    schedule = (StudentSchedule.objects.select_for_update().filter(student_id=student_id)
+                .values_list('courses').first())
+    if schedule is None or schedule[0] is None:
+        invalidate(student_id)
+        return None
+    return json.loads(schedule[0])
+
+
+def _save(student_id, courses):
+    StudentSchedule.objects.filter(student_id=student_id).update(
+        courses=dumps(courses).decode(), generation=F('generation') + 1
+    )
+
+
+def enrolled(student_id, enrollment):
+    """单门选课：把课程加到课表末尾（在占座的条件UPDATE之前调用，没占到座位时随事务回滚）"""
+    courses = _lock(student_id)
+    if courses is None:
+        return
+    course = (Course.objects.filter(id=enrollment.course_id)
+              .annotate(teacher=Subquery(Teacher.objects.filter(id=OuterRef('teacher_id')).values('username')[:1]))
+              .values_list('name', 'description', 'teacher').first())
+    if course is None:
+        invalidate(student_id)
+        return
+    name, description, teacher = course
+    courses.append(_row(enrollment.id, enrollment.course_id, name, description, teacher or '未知',
+                        enrollment.enrolled_at))
+    _save(student_id, courses)
+
+
+def dropped(student_id, course_id):
+    """单门退课后从课表里去掉这门课"""
+    courses = _lock(student_id)
+    if courses is not None:
+        _save(student_id, [row for row in courses if row['course_id'] != course_id])
+
+
+def invalidate(*student_ids):
+    """标记为待重建，下次读取时按选课记录重建（没有课表的学生插入一个待重建的行，让并发的重建放弃保存）"""
+    if not student_ids:
+        return
+    StudentSchedule.objects.bulk_create(
+        [StudentSchedule(student_id=student_id, courses=None) for student_id in student_ids],
+        ignore_conflicts=True
+    )
+    StudentSchedule.objects.filter(student_id__in=student_ids).update(
+        courses=None, generation=F('generation') + 1
+    )
+
+
+def invalidate_students(student_ids):
+    """
+    删除课程后由后台清理（courses.purge）按批调用，不在事务中：这批学生的课表标记为待重建，
+    并换他们的版本号（“我的课程”的ETag）。一条UPDATE，没有课表行的学生下次读取时才构建，
+    构建时已经看不到这门课，不用插入待重建的行
+    """
+    if not student_ids:
+        return
+    StudentSchedule.objects.filter(student_id__in=student_ids).update(
+        courses=None, generation=F('generation') + 1
+    )
+    versions.bump(*(versions.student(student_id) for student_id in student_ids))
+
+
+# ==================== 重建 ====================
+
+def rebuild(student_ids):
+    """按选课记录重建一批学生的课表，返回重建的行数"""
+    student_ids = list(student_ids)
+    if not student_ids:
+        return 0
+
+    enrollments = {student_id: [] for student_id in student_ids}
+    for shard_rows in sharding.scatter(lambda alias: list(
+        Enrollment.objects.using(alias).filter(student_id__in=student_ids)
+        .values_list('student_id', 'id', 'course_id', 'enrolled_at')
+    )).values():
+        for student_id, enrollment_id, course_id, enrolled_at in shard_rows:
+            enrollments[student_id].append((enrollment_id, course_id, enrolled_at))
+
+    loader = Loader()
+    courses = loader.courses({row[1] for student_rows in enrollments.values() for row in student_rows})
+    teacher_names = loader.teacher_names(courses.values())
+
+    schedules = []
+    for student_id, student_rows in enrollments.items():
+        student_rows.sort(key=lambda row: (row[2], row[1]))
+        schedules.append(StudentSchedule(
+            student_id=student_id,
+            courses=dumps(rows(student_rows, courses, teacher_names)).decode(),
+        ))
+
+    with transaction.atomic():
+        StudentSchedule.objects.filter(student_id__in=student_ids).delete()
+        StudentSchedule.objects.bulk_create(schedules)
+    return len(schedules)
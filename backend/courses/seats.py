@@ -0,0 +1,332 @@
+"""
+座位分配
+
+选课 = 插入选课记录 + 一条带条件的UPDATE：
+    UPDATE courses SET enrolled_count = enrolled_count + 1
+    WHERE id = ? AND enrolled_count < capacity
+两步在同一个事务里，UPDATE放在最后执行，课程行锁只在提交前的一瞬间持有，
+热门课程上的大量并发选课不会排成长队。重复选课由 (student_id, course_id)
+唯一约束拦截，课程满了UPDATE影响0行，整个事务回滚，不会超卖。
+
+选课记录分库（courses/sharding.py）时，选课记录和计数器不在同一个库，各开一个事务：
+选课时计数器先提交、选课记录后提交，退课时反过来；两次提交之间失败只会让计数器偏大。
+
+候补：课程已满时学生可以排进这门课的候补队列（waitlist 表，和选课记录在同一个分片）。
+退课时在同一个分片事务里删掉退课记录、取出队首插入选课记录，座位直接转给队首，
+计数器不变；队列为空时才归还座位。排位是 (course_id, id) 索引上的一次计数。
+"""
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import events, schedules, sharding, versions
+from .loaders import enrollment_counts
+from .models import Course, Enrollment, WaitlistEntry
+
+# 选课结果
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+FULL = 'full'
+NOT_FOUND = 'not_found'
+DROPPED = 'dropped'
+NOT_ENROLLED = 'not_enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_WAITLISTED = 'already_waitlisted'
+
+# 取队首时最多尝试的条数（并发退课可能同时取到同一个队首）
+PROMOTE_TRIES = 5
+
+
+def enroll(student_id, course_id):
+    """
+    为学生分配一个座位
+    返回 (结果, Enrollment或None)
+    """
+    shard = sharding.shard_for(course_id)
+    with sharding.atomic(shard, DEFAULT_DB_ALIAS):
+        try:
+            with transaction.atomic(using=shard):
+                enrollment = Enrollment.objects.using(shard).create(
+                    student_id=student_id,
+                    course_id=course_id
+                )
+        except IntegrityError:
+            return ALREADY_ENROLLED, None
+
+        # 课表行只属于这个学生，先改；热门课程的行锁留给最后的条件UPDATE
+        schedules.enrolled(student_id, enrollment)
+
+        # 条件UPDATE：有空位才占座，没有空位则回滚刚插入的记录（和课表的修改）
+        taken = Course.objects.filter(
+            id=course_id,
+            enrolled_count__lt=F('capacity')
+        ).update(enrolled_count=F('enrolled_count') + 1)
+
+        if not taken:
+            sharding.set_rollback(shard, DEFAULT_DB_ALIAS)
+            return FULL, None
+
+        versions.bump_seats(student_id)
+        events.seats_moved({course_id: 1})
+
+    return ENROLLED, enrollment
+
+
+def release(student_id, course_id):
+    """退课并归还座位，返回是否真的删除了选课记录"""
+    shard = sharding.shard_for(course_id)
+    with sharding.atomic(DEFAULT_DB_ALIAS, shard):
+        deleted, _ = Enrollment.objects.using(shard).filter(
+            student_id=student_id,
+            course_id=course_id
+        ).delete()
+
+        if deleted:
+            # 有人候补就把座位直接转给队首，否则归还座位
+            promoted = _promote_head(shard, course_id)
+            schedules.dropped(student_id, course_id)
+            if promoted is None:
+                Course.objects.filter(
+                    id=course_id,
+                    enrolled_count__gt=0
+                ).update(enrolled_count=F('enrolled_count') - 1)
+                versions.bump_seats(student_id)
+                events.seats_moved({course_id: -1})
+            else:
+                schedules.invalidate(promoted)
+                versions.bump_seats(student_id, promoted)
+
+    return bool(deleted)
+
+
+def _take_seats(course_ids):
+    """按课程id顺序逐个执行条件UPDATE（固定加锁顺序避免死锁），返回占到座位的课程"""
+    taken = []
+    for course_id in sorted(course_ids):
+        if Course.objects.filter(
+            id=course_id,
+            enrolled_count__lt=F('capacity')
+        ).update(enrolled_count=F('enrolled_count') + 1):
+            taken.append(course_id)
+    return taken
+
+
+def enroll_many(student_id, course_ids):
+    """
+    一次选多门课，一个事务
+    存在性、是否已选、是否已满用集合查询一次校验，选课记录一次 bulk_create
+    返回 {course_id: 结果}
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+
+    # 同一学生并发提交的两个批次可能撞上唯一约束，重新校验一次即可
+    for _ in range(2):
+        # 结果按提交顺序排列
+        results = dict.fromkeys(course_ids)
+        courses = {
+            cid: (capacity, enrolled)
+            for cid, capacity, enrolled in Course.objects
+            .filter(id__in=course_ids)
+            .values_list('id', 'capacity', 'enrolled_count')
+        }
+        groups = sharding.group(course_ids)
+        existing = set()
+        for shard, shard_course_ids in groups.items():
+            existing.update(Enrollment.objects.using(shard).filter(
+                student_id=student_id,
+                course_id__in=shard_course_ids
+            ).values_list('course_id', flat=True))
+
+        candidates = []
+        for course_id in course_ids:
+            if course_id not in courses:
+                results[course_id] = NOT_FOUND
+            elif course_id in existing:
+                results[course_id] = ALREADY_ENROLLED
+            elif courses[course_id][1] >= courses[course_id][0]:
+                results[course_id] = FULL
+            else:
+                candidates.append(course_id)
+
+        if not candidates:
+            return results
+
+        try:
+            with sharding.atomic(*sharding.group(candidates), DEFAULT_DB_ALIAS):
+                # 课表在占座之前标记，一门都没占到时随事务回滚
+                schedules.invalidate(student_id)
+                taken = _take_seats(candidates)
+                if not taken:
+                    sharding.set_rollback(*sharding.group(candidates), DEFAULT_DB_ALIAS)
+                for shard, shard_course_ids in sharding.group(taken).items():
+                    Enrollment.objects.using(shard).bulk_create([
+                        Enrollment(student_id=student_id, course_id=course_id)
+                        for course_id in shard_course_ids
+                    ])
+                if taken:
+                    versions.bump_seats(student_id)
+                    events.seats_moved(dict.fromkeys(taken, 1))
+        except IntegrityError:
+            continue
+
+        for course_id in candidates:
+            results[course_id] = ENROLLED if course_id in taken else FULL
+        return results
+
+    raise IntegrityError('批量选课与同一学生的其他请求冲突，请重试')
+
+
+def release_many(student_id, course_ids):
+    """一次退多门课，一条DELETE，返回 {course_id: 结果}"""
+    course_ids = list(dict.fromkeys(course_ids))
+
+    groups = sharding.group(course_ids)
+    with sharding.atomic(DEFAULT_DB_ALIAS, *groups):
+        enrolled = set()
+        for shard, shard_course_ids in groups.items():
+            found = set(Enrollment.objects.using(shard).select_for_update().filter(
+                student_id=student_id,
+                course_id__in=shard_course_ids
+            ).values_list('course_id', flat=True))
+            if found:
+                Enrollment.objects.using(shard).filter(
+                    student_id=student_id,
+                    course_id__in=found
+                ).delete()
+            enrolled |= found
+
+        if enrolled:
+            # 先转正候补、改课表，归还座位的计数器UPDATE放在最后
+            promoted, released = [], []
+            for course_id in sorted(enrolled):
+                head = _promote_head(sharding.shard_for(course_id), course_id)
+                if head is not None:
+                    promoted.append(head)
+                else:
+                    released.append(course_id)
+            schedules.invalidate(student_id, *promoted)
+            for course_id in released:
+                Course.objects.filter(
+                    id=course_id,
+                    enrolled_count__gt=0
+                ).update(enrolled_count=F('enrolled_count') - 1)
+            versions.bump_seats(student_id, *promoted)
+            if released:
+                events.seats_moved(dict.fromkeys(released, -1))
+
+    return {course_id: DROPPED if course_id in enrolled else NOT_ENROLLED for course_id in course_ids}
+
+
+# ==================== 候补 ====================
+
+def _promote_head(shard, course_id):
+    """
+    把候补队首转成选课记录（在分片事务中调用），返回被转正的学生id，队列为空返回None
+    并发退课可能取到同一个队首：DELETE 影响1行的才算拿到，否则试下一个
+    """
+    waitlist = WaitlistEntry.objects.using(shard)
+    heads = list(waitlist.filter(course_id=course_id).order_by('id')
+                 .values_list('id', 'student_id')[:PROMOTE_TRIES])
+    for entry_id, student_id in heads:
+        if not waitlist.filter(id=entry_id).delete()[0]:
+            continue
+        try:
+            with transaction.atomic(using=shard):
+                Enrollment.objects.using(shard).create(student_id=student_id, course_id=course_id)
+        except IntegrityError:
+            continue  # 已经选上了，候补记录删掉即可
+        return student_id
+    return None
+
+
+def join_waitlist(student_id, course_id):
+    """
+    加入候补队列（调用方已确认课程已满、学生未选这门课）
+    返回 (结果, 排位)：WAITLISTED / ALREADY_WAITLISTED，
+    入队时恰好空出座位、自己被直接转正时返回 (ENROLLED, None)
+    """
+    shard = sharding.shard_for(course_id)
+    try:
+        with transaction.atomic(using=shard):
+            WaitlistEntry.objects.using(shard).create(student_id=student_id, course_id=course_id)
+    except IntegrityError:
+        return ALREADY_WAITLISTED, waitlist_position(student_id, course_id)
+
+    # 判断已满和入队之间可能有人退课、而当时队列还是空的：有空位就把队首补进去
+    with sharding.atomic(shard, DEFAULT_DB_ALIAS):
+        taken = Course.objects.filter(
+            id=course_id,
+            enrolled_count__lt=F('capacity')
+        ).update(enrolled_count=F('enrolled_count') + 1)
+        if taken:
+            promoted = _promote_head(shard, course_id)
+            if promoted is None:
+                sharding.set_rollback(shard, DEFAULT_DB_ALIAS)
+            else:
+                # 这里课程行已经锁住，课表提交后再标记
+                transaction.on_commit(lambda: schedules.invalidate(promoted))
+                versions.bump_seats(promoted)
+                events.seats_moved({course_id: 1})
+
+    position = waitlist_position(student_id, course_id)
+    if position is None:
+        return ENROLLED, None
+    return WAITLISTED, position
+
+
+def leave_waitlist(student_id, course_id):
+    """退出候补队列，返回是否真的删除了记录"""
+    shard = sharding.shard_for(course_id)
+    deleted, _ = WaitlistEntry.objects.using(shard).filter(
+        student_id=student_id,
+        course_id=course_id
+    ).delete()
+    return bool(deleted)
+
+
+def _ahead():
+    """排在同一门课前面的人数（相关子查询，走 (course_id, id) 索引）"""
+    return Coalesce(Subquery(
+        WaitlistEntry.objects.filter(course_id=OuterRef('course_id'), id__lt=OuterRef('id'))
+        .order_by().values('course_id').annotate(n=Count('id')).values('n')
+    ), 0)
+
+
+def waitlist_position(student_id, course_id):
+    """该学生在这门课候补队列中的排位（从1开始），不在队列中返回None"""
+    ahead = (WaitlistEntry.objects.using(sharding.shard_for(course_id))
+             .filter(student_id=student_id, course_id=course_id)
+             .annotate(ahead=_ahead()).values_list('ahead', flat=True).first())
+    return None if ahead is None else ahead + 1
+
+
+def student_waitlist(student_id):
+    """该学生的所有候补 [(course_id, 排位)]，按加入时间排序，每个分片一次查询"""
+    rows = []
+    for shard_rows in sharding.scatter(lambda alias: list(
+        WaitlistEntry.objects.using(alias).filter(student_id=student_id)
+        .annotate(ahead=_ahead()).values_list('created_at', 'course_id', 'ahead')
+    )).values():
+        rows.extend(shard_rows)
+    rows.sort()
+    return [(course_id, ahead + 1) for _, course_id, ahead in rows]
+
+
+def recount(course_ids=None):
+    """按选课记录重新计算 enrolled_count（数据修复用），返回修正的课程数"""
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(id__in=list(course_ids))
+    current = dict(courses.values_list('id', 'enrolled_count'))
+    counts = enrollment_counts(current)
+
+    fixed = []
+    for course_id, n in counts.items():
+        if current[course_id] != n:
+            Course.objects.filter(id=course_id).update(enrolled_count=n)
+            fixed.append(course_id)
+
+    if fixed:
+        versions.bump_seats()
+        events.seats_changed(*fixed)
+    return len(fixed)
@@ -0,0 +1,125 @@
+"""
+选课记录分库
+
+enrollments 是数据量最大、写入最多的表。ENROLLMENT_SHARDS['DATABASES'] 配置多个库后，
+选课记录按 course_id % 分片数 分到各库（没有外键，课程表、学生表仍然只在 default）：
+
+- 按课程的读写（选课、退课、名单、导出、清理）只访问一个分片：for_course(course_id)
+- 按学生的查询（我的课程、已选课程ID）要查所有分片：scatter()，配置 WORKERS 时用线程池并行
+- 选课/退课同时写分片上的选课记录和 default 上的座位计数器：atomic() 在涉及的每个库上各开一个事务，
+  调用方安排提交顺序，保证两库之间失败时计数器只会偏大（少卖，recount_seats 修复），不会超卖
+
+未配置时只有一个分片（别名为 None，由数据库路由决定读主库还是只读副本），所有查询和不分库时完全一样。
+分片数确定后不能随意修改：选课记录需要按新的分片数重新分布。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import copy_context
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import Enrollment
+
+DEFAULTS = {
+    'DATABASES': [],    # 分片库别名，空表示不分库
+    'WORKERS': 4,       # 跨分片查询的线程数，0表示在当前线程依次查询
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ENROLLMENT_SHARDS', {})}
+
+
+def aliases():
+    """所有分片的库别名"""
+    return get_config()['DATABASES'] or [None]
+
+
+def shard_for(course_id):
+    """课程的选课记录所在的库"""
+    shards = aliases()
+    return shards[int(course_id) % len(shards)]
+
+
+def for_course(course_id):
+    """课程所在分片上的选课记录"""
+    return Enrollment.objects.using(shard_for(course_id))
+
+
+def group(course_ids):
+    """按分片分组 {库别名: [course_id, ...]}，组内保持原顺序"""
+    groups = {}
+    for course_id in course_ids:
+        groups.setdefault(shard_for(course_id), []).append(course_id)
+    return groups
+
+
+@contextmanager
+def atomic(*shards):
+    """在每个库上各开一个事务（同一个库只开一次），按开启的相反顺序提交"""
+    with ExitStack() as stack:
+        for alias in dict.fromkeys(alias or DEFAULT_DB_ALIAS for alias in shards):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def set_rollback(*shards):
+    """atomic() 结束时回滚所有库"""
+    for alias in set(alias or DEFAULT_DB_ALIAS for alias in shards):
+        transaction.set_rollback(True, using=alias)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(get_config()['WORKERS'], thread_name_prefix='shard')
+    return _executor
+
+
+def _run(func, alias):
+    try:
+        return func(alias)
+    finally:
+        # 和请求结束时一样按 CONN_MAX_AGE 关闭线程池里的连接
+        connections[alias or DEFAULT_DB_ALIAS].close_if_unusable_or_obsolete()
+
+
+def scatter(func, shards=None):
+    """
+    在每个分片上执行 func(库别名)，返回 {库别名: 结果}
+    多个分片且配置了 WORKERS 时并行执行；contextvar 随任务传递，SQL照样记到当前请求的统计上
+    """
+    shards = aliases() if shards is None else list(shards)
+    if len(shards) == 1 or not get_config()['WORKERS']:
+        return {alias: func(alias) for alias in shards}
+    executor = _get_executor()
+    futures = {alias: executor.submit(copy_context().run, _run, func, alias) for alias in shards}
+    return {alias: future.result() for alias, future in futures.items()}
+
+
+# ==================== 按学生的查询 ====================
+
+def student_course_ids(student_id):
+    """该学生已选课程ID集合"""
+    results = scatter(lambda alias: list(
+        Enrollment.objects.using(alias).filter(student_id=student_id).values_list('course_id', flat=True)
+    ))
+    return {course_id for rows in results.values() for course_id in rows}
+
+
+def student_enrollments(student_id):
+    """该学生的选课记录 [(id, course_id, enrolled_at)]；分库时按选课时间合并"""
+    results = scatter(lambda alias: list(
+        Enrollment.objects.using(alias).filter(student_id=student_id)
+        .values_list('id', 'course_id', 'enrolled_at')
+    ))
+    if len(results) == 1:
+        return next(iter(results.values()))
+    return sorted((row for rows in results.values() for row in rows), key=lambda row: (row[2], row[1]))
@@ -0,0 +1,102 @@
+"""
+数据版本号
+
+写操作提交后换版本号，读接口用版本号做缓存键和ETag，不需要查库就能知道数据有没有变：
+
+- catalog          课程增删
+- seats            任意课程的已选人数变化
+- student:<id>     某个学生的选课记录变化
+
+版本号必须所有进程共用一份：一个进程换了版本号，其他进程才会丢掉旧缓存、不再返回旧的304。
+多进程/多机部署时 CACHES['default'] 必须是共享缓存（Redis/Memcached），见 check_shared_cache()。
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+CATALOG = 'catalog'
+SEATS = 'seats'
+
+# 只在本进程内有效的缓存后端
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def student(student_id):
+    return f'student:{student_id}'
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def _new_version():
+    # 用毫秒时间戳做初始版本，缓存被清空后也不会和旧版本号撞上
+    return int(time.time() * 1000)
+
+
+def _bump_now(name):
+    try:
+        cache.incr(_key(name))
+    except ValueError:
+        cache.set(_key(name), _new_version(), None)
+
+
+def bump(*names):
+    """换版本号（在事务中调用时，提交后才生效）"""
+    def do_bump():
+        for name in names:
+            _bump_now(name)
+    transaction.on_commit(do_bump)
+
+
+def bump_catalog():
+    """课程增删后调用"""
+    bump(CATALOG)
+
+
+def bump_seats(*student_ids):
+    """选课/退课后调用，同时换掉相关学生的版本号"""
+    bump(SEATS, *(student(i) for i in student_ids))
+
+
+def get(*names):
+    """读取一组版本号，返回与 names 对应的元组"""
+    keys = [_key(name) for name in names]
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _new_version(), None)
+            version = cache.get(key)
+        result.append(version)
+    return tuple(result)
+
+
+def etag(*parts):
+    """把版本号和查询参数等拼成一个ETag值"""
+    return hashlib.md5(':'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def multi_process():
+    """是否多进程（WEB_CONCURRENCY > 1）或多机（MULTI_HOST）部署"""
+    return getattr(settings, 'WEB_CONCURRENCY', 1) > 1 or getattr(settings, 'MULTI_HOST', False)
+
+
+def check_shared_cache():
+    """多进程或多机部署时，版本号所在的缓存不能是进程内缓存"""
+    if not multi_process():
+        return
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"多进程部署时 CACHES['default'] 不能使用 {backend}：各进程的数据版本号互不可见，"
+            "会返回过期的课程目录和304。请改用 Redis/Memcached 等共享缓存"
+        )
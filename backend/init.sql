@@ -7,6 +7,9 @@ CREATE DATABASE IF NOT EXISTS `course_system` DEFAULT CHARACTER SET utf8mb4 COLL
 USE `course_system`;
 
 -- 删除旧表（如果存在）
+DROP TABLE IF EXISTS `student_schedules`;
+DROP TABLE IF EXISTS `waitlist`;
+DROP TABLE IF EXISTS `course_preferences`;
 DROP TABLE IF EXISTS `enrollments`;
 DROP TABLE IF EXISTS `courses`;
 DROP TABLE IF EXISTS `students`;
@@ -41,7 +44,9 @@ CREATE TABLE `courses` (
   `description` TEXT COMMENT '课程描述',
   `teacher_id` INT NOT NULL COMMENT '教师ID（应用层关联）',
   `capacity` INT NOT NULL DEFAULT 50 COMMENT '容量',
+  `enrolled_count` INT NOT NULL DEFAULT 0 COMMENT '已选人数（选课/退课时原子维护）',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `deleted_at` DATETIME NULL DEFAULT NULL COMMENT '删除时间（删除标记，选课记录由后台分批清理）',
   INDEX `idx_teacher_id` (`teacher_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='课程表';
 
@@ -51,9 +56,39 @@ CREATE TABLE `enrollments` (
   `student_id` INT NOT NULL COMMENT '学生ID（应用层关联）',
   `course_id` INT NOT NULL COMMENT '课程ID（应用层关联）',
   `enrolled_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '选课时间',
-  INDEX `idx_student_course` (`student_id`, `course_id`)
+  UNIQUE KEY `uniq_student_course` (`student_id`, `course_id`),
+  INDEX `idx_course_id` (`course_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='选课记录表';
 
+-- 选课志愿表（志愿抽签模式）
+CREATE TABLE `course_preferences` (
+  `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `student_id` INT NOT NULL COMMENT '学生ID（应用层关联）',
+  `course_id` INT NOT NULL COMMENT '课程ID（应用层关联）',
+  `rank` SMALLINT UNSIGNED NOT NULL COMMENT '志愿顺序（0是第一志愿）',
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '提交时间',
+  UNIQUE KEY `uniq_student_rank` (`student_id`, `rank`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='选课志愿表';
+
+-- 候补队列表（选课记录分库时和 enrollments 一起建在每个分片上）
+CREATE TABLE `waitlist` (
+  `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `course_id` INT NOT NULL COMMENT '课程ID（应用层关联）',
+  `student_id` INT NOT NULL COMMENT '学生ID（应用层关联）',
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '加入时间',
+  UNIQUE KEY `uniq_waitlist_course_student` (`course_id`, `student_id`),
+  INDEX `idx_waitlist_course` (`course_id`, `id`),
+  INDEX `idx_waitlist_student` (`student_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='候补队列表';
+
+-- 学生课表（“我的课程”的物化结果，建在 default 库；可随时用 python manage.py rebuild_schedules 重建）
+CREATE TABLE `student_schedules` (
+  `student_id` INT PRIMARY KEY COMMENT '学生ID（应用层关联）',
+  `generation` INT NOT NULL DEFAULT 0 COMMENT '每次写入加1，重建时做乐观锁',
+  `courses` LONGTEXT NULL COMMENT '课表JSON数组，NULL表示待重建',
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='学生课表';
+
 -- 插入测试数据（密码都是: password123，已经用Django的make_password加密）
 -- 测试学生
 INSERT INTO `students` (`username`, `password`, `email`) VALUES
@@ -66,10 +101,10 @@ INSERT INTO `teachers` (`username`, `password`, `email`) VALUES
 ('teacher2', 'pbkdf2_sha256$600000$3DvDze07fSuTR0mYC66SEl$z7GkjWsZd31NQ3OZ3Ju1V0CVBCLHzXnKUcuyu6jiR+E=', 'teacher2@test.com');
 
 -- 测试课程
-INSERT INTO `courses` (`name`, `description`, `teacher_id`, `capacity`) VALUES
-('Python编程', 'Python基础到进阶', 1, 30),
-('Web开发', 'Django框架实战', 1, 40),
-('数据库设计', 'MySQL从入门到精通', 2, 25);
+INSERT INTO `courses` (`name`, `description`, `teacher_id`, `capacity`, `enrolled_count`) VALUES
+('Python编程', 'Python基础到进阶', 1, 30, 2),
+('Web开发', 'Django框架实战', 1, 40, 1),
+('数据库设计', 'MySQL从入门到精通', 2, 25, 0);
 
 -- 测试选课记录
 INSERT INTO `enrollments` (`student_id`, `course_id`) VALUES
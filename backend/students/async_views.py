@@ -0,0 +1,76 @@
+"""
+学生相关只读API的异步版本（ASGI部署时使用，见 settings.ASYNC_READ_VIEWS）
+
+和 views.py 中的同步视图返回完全相同的数据。Django 4.2 的异步ORM和 sync_to_async
+都在每个请求自己的一个线程里依次执行，查询不会并发；这里把一个请求的同步部分合成一次
+sync_to_async 调用，只切换一次线程。
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+
+from backend.auth import get_identity, login_required
+from backend.http import require_http_methods, cache_control, condition
+from courses import catalog, schedules
+from courses.pagination import (
+    ParamError, parse_page, parse_flag, parse_optional_int, parse_fields
+)
+from teachers.models import Teacher
+from .models import Student
+from .views import available_courses_body, catalog_etag, my_courses_etag, schedule_response
+
+
+@require_http_methods(["GET"])
+@login_required('student')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
+async def available_courses(request):
+    """查看可选课程"""
+    try:
+        after, limit = parse_page(request)
+        teacher_id = parse_optional_int(request, 'teacher_id')
+        fields = parse_fields(request, catalog.FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    body = await sync_to_async(available_courses_body)(
+        request.user_id, after, limit, teacher_id,
+        parse_flag(request, 'has_seats'), parse_flag(request, 'not_enrolled'), fields
+    )
+    return HttpResponse(body, content_type='application/json')
+
+
+@require_http_methods(["GET"])
+@login_required('student')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=my_courses_etag)
+async def my_courses(request):
+    """查看我的课程"""
+    return schedule_response(await sync_to_async(schedules.get_json)(request.user_id))
+
+
+@require_http_methods(["GET"])
+async def current_user(request):
+    """获取当前登录用户信息"""
+    user_id, user_role = await sync_to_async(get_identity)(request)
+
+    if not user_id or not user_role:
+        return JsonResponse({'error': '未登录'}, status=401)
+
+    if user_role == 'student':
+        user = await Student.objects.filter(id=user_id).afirst()
+    elif user_role == 'teacher':
+        user = await Teacher.objects.filter(id=user_id).afirst()
+    else:
+        return JsonResponse({'error': '无效的角色'}, status=400)
+
+    if not user:
+        return JsonResponse({'error': '用户不存在'}, status=404)
+
+    return JsonResponse({
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user_role
+        }
+    })
@@ -4,6 +4,7 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from backend.auth import get_identity
 from .models import Student
 from teachers.models import Teacher
 
@@ -19,8 +20,7 @@ def logout(request):
 @require_http_methods(["GET"])
 def current_user(request):
     """获取当前登录用户信息"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
+    user_id, user_role = get_identity(request)
 
     if not user_id or not user_role:
         return JsonResponse({'error': '未登录'}, status=401)
@@ -1,8 +1,13 @@
 """
 学生相关URL配置
 """
+from django.conf import settings
 from django.urls import path
-from . import views, auth_views
+from . import views, auth_views, async_views
+
+# 只读接口在ASGI部署时换成异步版本
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
+read_auth_views = async_views if settings.ASYNC_READ_VIEWS else auth_views
 
 urlpatterns = [
     # 学生注册登录
@@ -10,12 +15,18 @@ urlpatterns = [
     path('api/student/login/', views.student_login, name='student-login'),
 
     # 学生功能
-    path('api/student/courses/', views.available_courses, name='student-courses'),
-    path('api/student/my-courses/', views.my_courses, name='student-my-courses'),
+    path('api/student/courses/', read_views.available_courses, name='student-courses'),
+    path('api/student/my-courses/', read_views.my_courses, name='student-my-courses'),
     path('api/student/enroll/', views.enroll_course, name='student-enroll'),
     path('api/student/drop/', views.drop_course, name='student-drop'),
+    path('api/student/enroll/batch/', views.enroll_batch, name='student-enroll-batch'),
+    path('api/student/drop/batch/', views.drop_batch, name='student-drop-batch'),
+    path('api/student/waitlist/', views.waitlist, name='student-waitlist'),
+    path('api/student/waitlist/leave/', views.leave_waitlist, name='student-waitlist-leave'),
+    path('api/student/preferences/', views.preferences, name='student-preferences'),
+    path('api/student/seats/stream/', views.seat_stream, name='student-seat-stream'),
 
     # 通用认证
     path('api/logout/', auth_views.logout, name='logout'),
-    path('api/current-user/', auth_views.current_user, name='current-user'),
+    path('api/current-user/', read_auth_views.current_user, name='current-user'),
 ]
@@ -2,16 +2,33 @@
 学生相关API
 """
 import json
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods, condition
+from django.utils import timezone
+from backend.auth import login_required
+from backend.idempotency import idempotent
+from backend.replicas import primary
+from backend.hashing import HashPoolBusy
 from .models import Student
-from courses.models import Course, Enrollment
-from teachers.models import Teacher
+from courses.models import Course
+from courses import seats, allocator, catalog, events, lottery, schedules, sharding, versions
+from courses.pagination import (
+    ParamError, parse_page, parse_flag, parse_optional_int, parse_fields
+)
 
 
 # ==================== 认证相关 ====================
 
+def _busy(error):
+    """密码哈希进程池排队已满，让客户端稍后重试"""
+    response = JsonResponse({'error': str(error)}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def student_register(request):
@@ -47,6 +64,8 @@ def student_register(request):
             }
         }, status=201)
 
+    except HashPoolBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -63,6 +82,15 @@ def student_login(request):
         student = Student.objects.filter(username=username).first()
 
         if student and student.check_password(password):
+            # 工作因子调整过的话，趁登录时按新因子重新哈希
+            # 进程池忙时跳过，下次登录再做
+            if student.password_needs_rehash():
+                try:
+                    student.set_password(password)
+                    student.save(update_fields=['password'])
+                except HashPoolBusy:
+                    pass
+
             # 保存session
             request.session['user_id'] = student.id
             request.session['user_role'] = 'student'
@@ -79,120 +107,150 @@ def student_login(request):
         else:
             return JsonResponse({'error': '用户名或密码错误'}, status=401)
 
+    except HashPoolBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
 # ==================== 学生功能 ====================
 
+# 列表接口的ETag只由版本号和查询参数决定，客户端带 If-None-Match 刷新时
+# 数据没变就直接返回304，不查询课程和选课表
+
+def catalog_etag(request):
+    """可选课程：课程目录、已选人数、该学生选课记录三个版本"""
+    return versions.etag(
+        *versions.get(versions.CATALOG, versions.SEATS, versions.student(request.user_id)),
+        request.GET.urlencode()
+    )
+
+
+def my_courses_etag(request):
+    """我的课程：该学生的版本（选课、退课、所选课程被删除时换）"""
+    return versions.etag(
+        *versions.get(versions.student(request.user_id)),
+        request.GET.urlencode()
+    )
+
+
 @require_http_methods(["GET"])
+@login_required('student')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
 def available_courses(request):
     """查看可选课程"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'student':
-        return JsonResponse({'error': '请先登录'}, status=401)
-
-    # 获取所有课程
-    courses = Course.objects.all()
-
-    # 获取该学生已选课程ID列表
-    enrolled_ids = list(Enrollment.objects.filter(
-        student_id=user_id
-    ).values_list('course_id', flat=True))
-
-    data = []
-    for c in courses:
-        # 应用层关联：查找教师信息
-        teacher = Teacher.objects.filter(id=c.teacher_id).first()
-        teacher_name = teacher.username if teacher else '未知'
-
-        # 计算已选人数
-        enrolled_count = Enrollment.objects.filter(course_id=c.id).count()
-
-        data.append({
-            'id': c.id,
-            'name': c.name,
-            'description': c.description,
-            'teacher': teacher_name,
-            'capacity': c.capacity,
-            'enrolled': enrolled_count,
-            'is_full': enrolled_count >= c.capacity,
-            'is_enrolled': c.id in enrolled_ids
-        })
+    user_id = request.user_id
 
-    return JsonResponse({'courses': data})
+    # 分页、过滤、字段裁剪参数
+    try:
+        after, limit = parse_page(request)
+        teacher_id = parse_optional_int(request, 'teacher_id')
+        fields = parse_fields(request, catalog.FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return HttpResponse(available_courses_body(
+        user_id, after, limit, teacher_id,
+        parse_flag(request, 'has_seats'), parse_flag(request, 'not_enrolled'), fields
+    ), content_type='application/json')
+
+
+def available_courses_body(user_id, after, limit, teacher_id, has_seats, not_enrolled, fields):
+    """可选课程的响应体（同步/异步视图共用）"""
+    # 课程目录（课程、教师、已选人数）对所有学生相同，从缓存读取
+    entries = catalog.get_catalog()
+
+    # 获取该学生已选课程ID集合（分库时查询所有分片）
+    # 读主库：ETag 里的学生版本号在主库提交后就换了，副本上的旧选课记录会按新ETag缓存在客户端
+    with primary():
+        enrolled_ids = sharding.student_course_ids(user_id)
+
+    rows, next_cursor = catalog.query(
+        entries, enrolled_ids,
+        after=after,
+        limit=limit,
+        teacher_id=teacher_id,
+        has_seats=has_seats,
+        not_enrolled=not_enrolled
+    )
+    return catalog.render(entries, rows, next_cursor, fields)
 
 
 @require_http_methods(["GET"])
+@login_required('student')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=my_courses_etag)
 def my_courses(request):
     """查看我的课程"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
+    # 物化的课表（courses.schedules）：按主键查一次，JSON原样拼进响应
+    return schedule_response(schedules.get_json(request.user_id))
 
-    if not user_id or user_role != 'student':
-        return JsonResponse({'error': '请先登录'}, status=401)
 
-    # 获取选课记录
-    enrollments = Enrollment.objects.filter(student_id=user_id)
+def schedule_response(courses):
+    """课表JSON数组拼成响应（同步/异步视图共用）"""
+    return HttpResponse(b'{"courses":' + courses + b'}', content_type='application/json')
 
-    data = []
-    for e in enrollments:
-        # 应用层关联：查找课程信息
-        course = Course.objects.filter(id=e.course_id).first()
-        if not course:
-            continue
-
-        # 应用层关联：查找教师信息
-        teacher = Teacher.objects.filter(id=course.teacher_id).first()
-        teacher_name = teacher.username if teacher else '未知'
-
-        data.append({
-            'enrollment_id': e.id,
-            'course_id': course.id,
-            'course_name': course.name,
-            'description': course.description,
-            'teacher': teacher_name,
-            'enrolled_at': e.enrolled_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
 
-    return JsonResponse({'courses': data})
+# 志愿抽签模式下选课接口的提示
+LOTTERY_MESSAGE = '当前为志愿抽签选课，请提交志愿'
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@login_required('student')
+@idempotent
 def enroll_course(request):
     """选课"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'student':
-        return JsonResponse({'error': '请先登录'}, status=401)
+    user_id = request.user_id
+    if lottery.enabled():
+        return JsonResponse({'error': LOTTERY_MESSAGE}, status=400)
 
     try:
         data = json.loads(request.body)
         course_id = data.get('course_id')
+        # 课程已满时是否排进候补队列（只在默认的数据库占座模式下支持）
+        waitlist = data.get('waitlist') is True
 
         # 检查课程是否存在
         course = Course.objects.filter(id=course_id).first()
         if not course:
             return JsonResponse({'error': '课程不存在'}, status=404)
 
-        # 检查是否已选过
-        if Enrollment.objects.filter(student_id=user_id, course_id=course_id).exists():
-            return JsonResponse({'error': '您已经选过这门课了'}, status=400)
-
-        # 检查是否已满
-        enrolled_count = Enrollment.objects.filter(course_id=course_id).count()
-        if enrolled_count >= course.capacity:
-            return JsonResponse({'error': '课程已满'}, status=400)
+        # 分配器模式：在内存/Redis中原子占座，选课记录稍后批量写回
+        if allocator.enabled():
+            result = allocator.enroll(user_id, course.id)
+            if result == allocator.ALREADY_ENROLLED:
+                return JsonResponse({'error': '您已经选过这门课了'}, status=400)
+            if result == allocator.FULL:
+                return JsonResponse({'error': '课程已满'}, status=400)
 
-        # 创建选课记录
-        enrollment = Enrollment.objects.create(
-            student_id=user_id,
-            course_id=course_id
-        )
+            return JsonResponse({
+                'message': '选课成功',
+                'enrollment': {
+                    'id': None,  # 尚未写回数据库
+                    'course_name': course.name,
+                    'enrolled_at': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+            }, status=202)
+
+        # 先看一眼计数器，已满时不开事务（最终以条件UPDATE为准）：
+        # 已选过的仍提示已选，否则直接拒绝或排候补
+        if course.enrolled_count >= course.capacity:
+            if sharding.for_course(course.id).filter(student_id=user_id, course_id=course.id).exists():
+                return JsonResponse({'error': '您已经选过这门课了'}, status=400)
+            if not waitlist:
+                return JsonResponse({'error': '课程已满'}, status=400)
+            return _join_waitlist(user_id, course)
+
+        # 原子占座：插入选课记录 + 条件UPDATE计数器
+        result, enrollment = seats.enroll(user_id, course.id)
+        if result == seats.ALREADY_ENROLLED:
+            return JsonResponse({'error': '您已经选过这门课了'}, status=400)
+        if result == seats.FULL:
+            if not waitlist:
+                return JsonResponse({'error': '课程已满'}, status=400)
+            return _join_waitlist(user_id, course)
 
         return JsonResponse({
             'message': '选课成功',
@@ -207,37 +265,260 @@ def enroll_course(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _join_waitlist(user_id, course):
+    """课程已满：排进候补队列，有人退课时自动转正"""
+    result, position = seats.join_waitlist(user_id, course.id)
+    if result == seats.ALREADY_WAITLISTED:
+        return JsonResponse({'error': '您已经在候补队列中', 'position': position}, status=400)
+    if result == seats.ENROLLED:
+        # 入队时恰好空出座位，已直接转正
+        enrollment = sharding.for_course(course.id).filter(student_id=user_id, course_id=course.id).first()
+        return JsonResponse({
+            'message': '选课成功',
+            'enrollment': {
+                'id': enrollment.id,
+                'course_name': course.name,
+                'enrolled_at': enrollment.enrolled_at.strftime('%Y-%m-%d %H:%M:%S')
+            }
+        }, status=201)
+
+    return JsonResponse({
+        'message': '课程已满，已加入候补队列',
+        'waitlist': {'course_id': course.id, 'course_name': course.name, 'position': position}
+    }, status=202)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@login_required('student')
+@idempotent
 def drop_course(request):
     """退课"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'student':
-        return JsonResponse({'error': '请先登录'}, status=401)
+    user_id = request.user_id
 
     try:
-        data = json.loads(request.body)
-        course_id = data.get('course_id')
-
-        # 查找选课记录
-        enrollment = Enrollment.objects.filter(
-            student_id=user_id,
-            course_id=course_id
-        ).first()
+        course_id = _parse_course_id(request)
+        if course_id is None:
+            return JsonResponse({'error': '未找到选课记录'}, status=404)
 
-        if not enrollment:
+        # 删除选课记录并归还座位
+        release = allocator.release if allocator.enabled() else seats.release
+        if not release(user_id, course_id):
             return JsonResponse({'error': '未找到选课记录'}, status=404)
 
-        # 删除选课记录
         course = Course.objects.filter(id=course_id).first()
         course_name = course.name if course else '未知课程'
-        enrollment.delete()
 
         return JsonResponse({
             'message': f'已退选课程：{course_name}'
         })
 
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _parse_course_id(request):
+    """
+    解析单门课程接口的 course_id：没有时返回None，不是整数时抛出 ParamError
+    退课/退出候补要先按 course_id 找分片，不能把请求里的任意值交给 sharding.shard_for
+    """
+    course_id = json.loads(request.body).get('course_id')
+    if course_id is None:
+        return None
+    if isinstance(course_id, str) and course_id.isdigit():
+        course_id = int(course_id)
+    if not isinstance(course_id, int) or isinstance(course_id, bool):
+        raise ParamError('course_id 必须是整数')
+    return course_id
+
+
+# ==================== 候补 ====================
+
+@require_http_methods(["GET"])
+@login_required('student')
+def waitlist(request):
+    """查看我的候补及排位"""
+    user_id = request.user_id
+
+    try:
+        entries = seats.student_waitlist(user_id)
+        names = dict(Course.objects.filter(id__in=[course_id for course_id, _ in entries])
+                     .values_list('id', 'name'))
+        return JsonResponse({'waitlist': [{
+            'course_id': course_id,
+            'course_name': names[course_id],
+            'position': position
+        } for course_id, position in entries if course_id in names]})
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required('student')
+def leave_waitlist(request):
+    """退出候补队列"""
+    user_id = request.user_id
+
+    try:
+        course_id = _parse_course_id(request)
+        if course_id is None or not seats.leave_waitlist(user_id, course_id):
+            return JsonResponse({'error': '未找到候补记录'}, status=404)
+        return JsonResponse({'message': '已退出候补队列'})
+
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# ==================== 批量选课/退课 ====================
+
+# 一次最多提交的课程数
+BATCH_LIMIT = 20
+
+BATCH_MESSAGES = {
+    seats.ENROLLED: '选课成功',
+    seats.ALREADY_ENROLLED: '您已经选过这门课了',
+    seats.FULL: '课程已满',
+    seats.NOT_FOUND: '课程不存在',
+    seats.DROPPED: '退课成功',
+    seats.NOT_ENROLLED: '未找到选课记录',
+}
+
+
+def _parse_course_ids(request, limit=BATCH_LIMIT):
+    """解析批量接口的 course_ids 列表"""
+    course_ids = json.loads(request.body).get('course_ids')
+    if not isinstance(course_ids, list) or not course_ids:
+        raise ParamError('course_ids 必须是非空列表')
+    if len(course_ids) > limit:
+        raise ParamError(f'一次最多提交 {limit} 门课程')
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in course_ids):
+        raise ParamError('course_ids 只能包含整数')
+    return course_ids
+
+
+def _batch_response(results, success):
+    """按提交顺序返回每门课的结果"""
+    return JsonResponse({
+        'results': [{
+            'course_id': course_id,
+            'status': result,
+            'message': BATCH_MESSAGES[result]
+        } for course_id, result in results.items()],
+        'succeeded': sum(1 for r in results.values() if r == success)
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required('student')
+@idempotent
+def enroll_batch(request):
+    """批量选课：一次请求、一个事务选多门课"""
+    user_id = request.user_id
+    if lottery.enabled():
+        return JsonResponse({'error': LOTTERY_MESSAGE}, status=400)
+
+    try:
+        course_ids = _parse_course_ids(request)
+
+        if allocator.enabled():
+            existing = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+            results = {
+                course_id: allocator.enroll(user_id, course_id) if course_id in existing else seats.NOT_FOUND
+                for course_id in dict.fromkeys(course_ids)
+            }
+        else:
+            results = seats.enroll_many(user_id, course_ids)
+
+        return _batch_response(results, seats.ENROLLED)
+
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required('student')
+@idempotent
+def drop_batch(request):
+    """批量退课"""
+    user_id = request.user_id
+
+    try:
+        course_ids = _parse_course_ids(request)
+
+        if allocator.enabled():
+            results = {
+                course_id: seats.DROPPED if allocator.release(user_id, course_id) else seats.NOT_ENROLLED
+                for course_id in dict.fromkeys(course_ids)
+            }
+        else:
+            results = seats.release_many(user_id, course_ids)
+
+        return _batch_response(results, seats.DROPPED)
+
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# ==================== 志愿抽签 ====================
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@login_required('student')
+def preferences(request):
+    """查看/提交选课志愿（POST 按志愿顺序提交 course_ids，整体替换之前的志愿）"""
+    user_id = request.user_id
+
+    try:
+        if request.method == 'GET':
+            return JsonResponse({'course_ids': lottery.preferences(user_id), 'open': lottery.enabled()})
+
+        if not lottery.enabled():
+            return JsonResponse({'error': '当前不是志愿选课阶段'}, status=400)
+
+        course_ids = list(dict.fromkeys(
+            _parse_course_ids(request, limit=lottery.get_config()['MAX_PREFERENCES'])
+        ))
+        existing = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        missing = [course_id for course_id in course_ids if course_id not in existing]
+        if missing:
+            return JsonResponse({'error': '课程不存在', 'course_ids': missing}, status=404)
+
+        lottery.submit(user_id, course_ids)
+        return JsonResponse({'message': '志愿已提交', 'course_ids': course_ids})
+
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# ==================== 实时座位推送 ====================
+
+@login_required('student')
+async def seat_stream(request):
+    """
+    实时座位推送（Server-Sent Events，长连接，需要ASGI部署）
+    WSGI下 StreamingHttpResponse 会先把整个异步迭代器读完再发送，连接要占住worker直到 MAX_AGE；
+    这时直接返回404，前端不再连接，改为操作后重新拉取课程列表
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': '实时推送需要ASGI部署'}, status=404)
+
+    response = StreamingHttpResponse(events.sse_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 关闭nginx缓冲
+    return response
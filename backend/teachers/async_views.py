@@ -0,0 +1,63 @@
+"""
+教师相关只读API的异步版本（ASGI部署时使用，见 settings.ASYNC_READ_VIEWS）
+
+异步ORM的查询在请求自己的线程里依次执行，不会并发。
+"""
+from django.http import JsonResponse
+
+from backend.auth import login_required
+from backend.http import require_http_methods
+from backend.responses import FastJsonResponse
+from courses.models import Course
+from courses.pagination import ParamError, parse_page, parse_flag, parse_fields, project, paginate
+from .views import (
+    COURSE_FIELDS, STUDENT_FIELDS, course_page_query, course_rows,
+    roster_page_query, roster_students_query, course_students_payload
+)
+
+
+@require_http_methods(["GET"])
+@login_required('teacher')
+async def my_courses(request):
+    """查看我的课程"""
+    try:
+        after, limit = parse_page(request)
+        fields = parse_fields(request, COURSE_FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    skip_description = fields is not None and 'description' not in fields
+    query = course_page_query(request.user_id, after, limit, parse_flag(request, 'has_seats'), skip_description)
+    courses, next_cursor = paginate([row async for row in query], limit)
+
+    data = course_rows(courses)
+    return FastJsonResponse({'courses': project(data, fields), 'next_cursor': next_cursor})
+
+
+async def _list(query):
+    return [obj async for obj in query]
+
+
+@require_http_methods(["GET"])
+@login_required('teacher')
+async def course_students(request, course_id):
+    """查看课程的选课学生"""
+    try:
+        after, limit = parse_page(request)
+        fields = parse_fields(request, STUDENT_FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        # 先校验课程归属，课程不属于该教师时不查选课记录
+        course = await Course.objects.filter(id=course_id, teacher_id=request.user_id).afirst()
+        if not course:
+            return JsonResponse({'error': '课程不存在或您不是该课程的教师'}, status=404)
+
+        enrollments, next_cursor = paginate(await _list(roster_page_query(course_id, after, limit)), limit)
+        students = await _list(roster_students_query(enrollments))
+
+        return FastJsonResponse(course_students_payload(course, enrollments, students, fields, next_cursor))
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
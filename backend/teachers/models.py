@@ -2,7 +2,8 @@
 教师数据模型
 """
 from django.db import models
-import bcrypt
+
+from backend import hashing
 
 
 class Teacher(models.Model):
@@ -21,10 +22,13 @@ class Teacher(models.Model):
         return self.username
 
     def set_password(self, raw_password):
-        """设置密码"""
-        hashed = bcrypt.hashpw(raw_password.encode('utf-8'), bcrypt.gensalt())
-        self.password = hashed.decode('utf-8')
+        """设置密码（在哈希进程池中计算）"""
+        self.password = hashing.hash_password(raw_password)
 
     def check_password(self, raw_password):
-        """验证密码"""
-        return bcrypt.checkpw(raw_password.encode('utf-8'), self.password.encode('utf-8'))
+        """验证密码（在哈希进程池中计算）"""
+        return hashing.check_password(raw_password, self.password)
+
+    def password_needs_rehash(self):
+        """密码的bcrypt工作因子是否与当前配置不同"""
+        return hashing.needs_rehash(self.password)
@@ -1,8 +1,12 @@
 """
 教师相关URL配置
 """
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# 只读接口在ASGI部署时换成异步版本
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
     # 教师注册登录
@@ -10,8 +14,9 @@ urlpatterns = [
     path('api/teacher/login/', views.teacher_login, name='teacher-login'),
 
     # 教师功能
-    path('api/teacher/courses/', views.my_courses, name='teacher-courses'),
+    path('api/teacher/courses/', read_views.my_courses, name='teacher-courses'),
     path('api/teacher/courses/create/', views.create_course, name='teacher-create-course'),
     path('api/teacher/courses/<int:course_id>/delete/', views.delete_course, name='teacher-delete-course'),
-    path('api/teacher/courses/<int:course_id>/students/', views.course_students, name='teacher-course-students'),
+    path('api/teacher/courses/<int:course_id>/students/', read_views.course_students, name='teacher-course-students'),
+    path('api/teacher/courses/<int:course_id>/students/export/', views.export_course_students, name='teacher-course-students-export'),
 ]
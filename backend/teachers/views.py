@@ -2,16 +2,37 @@
 教师相关API
 """
 import json
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import F, Value
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from backend.auth import login_required
+from backend.idempotency import idempotent
+from backend.hashing import HashPoolBusy
+from backend.responses import FastJsonResponse
 from .models import Teacher
-from courses.models import Course, Enrollment
 from students.models import Student
+from . import exports
+from courses.models import Course
+from courses import allocator, events, purge, sharding, versions
+from courses.pagination import ParamError, parse_page, parse_flag, parse_fields, project, paginate
+
+# 支持 fields= 裁剪的字段
+COURSE_FIELDS = ('id', 'name', 'description', 'capacity', 'enrolled', 'is_full', 'created_at')
+STUDENT_FIELDS = ('id', 'username', 'email', 'enrolled_at')
 
 
 # ==================== 认证相关 ====================
 
+def _busy(error):
+    """密码哈希进程池排队已满，让客户端稍后重试"""
+    response = JsonResponse({'error': str(error)}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def teacher_register(request):
@@ -47,6 +68,8 @@ def teacher_register(request):
             }
         }, status=201)
 
+    except HashPoolBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -63,6 +86,15 @@ def teacher_login(request):
         teacher = Teacher.objects.filter(username=username).first()
 
         if teacher and teacher.check_password(password):
+            # 工作因子调整过的话，趁登录时按新因子重新哈希
+            # 进程池忙时跳过，下次登录再做
+            if teacher.password_needs_rehash():
+                try:
+                    teacher.set_password(password)
+                    teacher.save(update_fields=['password'])
+                except HashPoolBusy:
+                    pass
+
             # 保存session
             request.session['user_id'] = teacher.id
             request.session['user_role'] = 'teacher'
@@ -79,6 +111,8 @@ def teacher_login(request):
         else:
             return JsonResponse({'error': '用户名或密码错误'}, status=401)
 
+    except HashPoolBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -86,44 +120,64 @@ def teacher_login(request):
 # ==================== 教师功能 ====================
 
 @require_http_methods(["GET"])
+@login_required('teacher')
 def my_courses(request):
     """查看我的课程"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'teacher':
-        return JsonResponse({'error': '请先登录'}, status=401)
-
-    # 应用层关联：查找该教师的所有课程
-    courses = Course.objects.filter(teacher_id=user_id)
+    user_id = request.user_id
 
+    # 分页、过滤、字段裁剪参数
+    try:
+        after, limit = parse_page(request)
+        fields = parse_fields(request, COURSE_FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # 不需要描述时不从数据库读取这个大字段
+    skip_description = fields is not None and 'description' not in fields
+    courses = course_page_query(user_id, after, limit, parse_flag(request, 'has_seats'), skip_description)
+    courses, next_cursor = paginate(list(courses), limit)
+
+    data = course_rows(courses)
+    return FastJsonResponse({'courses': project(data, fields), 'next_cursor': next_cursor})
+
+
+def course_page_query(user_id, after, limit, has_seats, skip_description):
+    """
+    该教师的一页课程（按id游标分页，多取一条判断是否有下一页）
+    返回 (id, name, description, capacity, enrolled_count, created_at) 元组
+    """
+    # 应用层关联：查找该教师的课程
+    courses = Course.objects.filter(teacher_id=user_id, id__gt=after).order_by('id')
+    if has_seats:
+        courses = courses.filter(enrolled_count__lt=F('capacity'))
+    # 不需要描述时不从数据库读取这个大字段
+    description = Value('') if skip_description else 'description'
+    return courses.values_list('id', 'name', description, 'capacity', 'enrolled_count', 'created_at')[:limit + 1]
+
+
+def course_rows(courses):
+    """组装课程列表（同步/异步视图共用），created_at 由 FastJsonResponse 格式化"""
     data = []
-    for c in courses:
-        # 计算已选人数
-        enrolled_count = Enrollment.objects.filter(course_id=c.id).count()
-
+    for course_id, name, description, capacity, enrolled_count, created_at in courses:
         data.append({
-            'id': c.id,
-            'name': c.name,
-            'description': c.description,
-            'capacity': c.capacity,
+            'id': course_id,
+            'name': name,
+            'description': description,
+            'capacity': capacity,
             'enrolled': enrolled_count,
-            'is_full': enrolled_count >= c.capacity,
-            'created_at': c.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'is_full': enrolled_count >= capacity,
+            'created_at': created_at
         })
-
-    return JsonResponse({'courses': data})
+    return data
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@login_required('teacher')
+@idempotent
 def create_course(request):
     """创建课程"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'teacher':
-        return JsonResponse({'error': '请先登录'}, status=401)
+    user_id = request.user_id
 
     try:
         data = json.loads(request.body)
@@ -141,6 +195,8 @@ def create_course(request):
             teacher_id=user_id,  # 应用层关联
             capacity=capacity
         )
+        versions.bump_catalog()
+        events.seats_changed(course.id)
 
         return JsonResponse({
             'message': '课程创建成功',
@@ -158,28 +214,32 @@ def create_course(request):
 
 @csrf_exempt
 @require_http_methods(["DELETE"])
+@login_required('teacher')
 def delete_course(request, course_id):
     """删除课程"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
-
-    if not user_id or user_role != 'teacher':
-        return JsonResponse({'error': '请先登录'}, status=401)
+    user_id = request.user_id
 
     try:
-        # 应用层验证：检查课程是否属于该教师
-        course = Course.objects.filter(id=course_id, teacher_id=user_id).first()
+        with transaction.atomic():
+            # 应用层验证：检查课程是否属于该教师
+            # 锁住课程行，删除期间并发的选课会在条件UPDATE上等待，随后因课程不存在而回滚
+            course = Course.objects.select_for_update().filter(id=course_id, teacher_id=user_id).first()
 
-        if not course:
-            return JsonResponse({'error': '课程不存在或您不是该课程的教师'}, status=404)
+            if not course:
+                return JsonResponse({'error': '课程不存在或您不是该课程的教师'}, status=404)
 
-        course_name = course.name
+            course_name = course.name
 
-        # 删除相关选课记录
-        Enrollment.objects.filter(course_id=course_id).delete()
+            # 只打删除标记，所有读接口立即看不到这门课；
+            # 选课记录可能有几万条，提交后由 courses.purge 在后台分批删除，
+            # 同时把这些学生的课表标记为待重建
+            Course.objects.filter(id=course_id).update(deleted_at=timezone.now())
+            versions.bump_catalog()
+            events.seats_changed(course_id)
+            purge.schedule(course_id)
 
-        # 删除课程
-        course.delete()
+        if allocator.enabled():
+            allocator.forget(course_id)
 
         return JsonResponse({
             'message': f'已删除课程：{course_name}'
@@ -190,13 +250,16 @@ def delete_course(request, course_id):
 
 
 @require_http_methods(["GET"])
+@login_required('teacher')
 def course_students(request, course_id):
     """查看课程的选课学生"""
-    user_id = request.session.get('user_id')
-    user_role = request.session.get('user_role')
+    user_id = request.user_id
 
-    if not user_id or user_role != 'teacher':
-        return JsonResponse({'error': '请先登录'}, status=401)
+    try:
+        after, limit = parse_page(request)
+        fields = parse_fields(request, STUDENT_FIELDS)
+    except ParamError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     try:
         # 应用层验证：检查课程是否属于该教师
@@ -205,29 +268,75 @@ def course_students(request, course_id):
         if not course:
             return JsonResponse({'error': '课程不存在或您不是该课程的教师'}, status=404)
 
-        # 获取选课记录
-        enrollments = Enrollment.objects.filter(course_id=course_id)
-
-        students = []
-        for e in enrollments:
-            # 应用层关联：查找学生信息
-            student = Student.objects.filter(id=e.student_id).first()
-            if student:
-                students.append({
-                    'id': student.id,
-                    'username': student.username,
-                    'email': student.email,
-                    'enrolled_at': e.enrolled_at.strftime('%Y-%m-%d %H:%M:%S')
-                })
+        # 获取选课记录（按选课记录id游标分页）
+        enrollments, next_cursor = paginate(list(roster_page_query(course_id, after, limit)), limit)
 
-        return JsonResponse({
-            'course': {
-                'id': course.id,
-                'name': course.name
-            },
-            'students': students,
-            'total': len(students)
-        })
+        # 应用层关联：批量查找学生信息
+        students = list(roster_students_query(enrollments))
+
+        return FastJsonResponse(course_students_payload(course, enrollments, students, fields, next_cursor))
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+def roster_page_query(course_id, after, limit):
+    """一页选课记录 (id, student_id, enrolled_at)，多取一条判断是否有下一页"""
+    return (sharding.for_course(course_id)
+            .filter(course_id=course_id, id__gt=after)
+            .order_by('id')
+            .values_list('id', 'student_id', 'enrolled_at')[:limit + 1])
+
+
+def roster_students_query(enrollments):
+    """这一页选课记录对应的学生 (id, username, email)"""
+    return Student.objects.filter(
+        id__in={student_id for _, student_id, _ in enrollments}
+    ).values_list('id', 'username', 'email')
+
+
+def course_students_payload(course, enrollments, students, fields, next_cursor):
+    """组装选课学生列表（同步/异步视图共用），enrolled_at 由 FastJsonResponse 格式化"""
+    student_map = {row[0]: row for row in students}
+    students = []
+    for _, student_id, enrolled_at in enrollments:
+        student = student_map.get(student_id)
+        if student:
+            students.append({
+                'id': student_id,
+                'username': student[1],
+                'email': student[2],
+                'enrolled_at': enrolled_at
+            })
+
+    return {
+        'course': {
+            'id': course.id,
+            'name': course.name
+        },
+        'students': project(students, fields),
+        'total': course.enrolled_count,
+        'next_cursor': next_cursor
+    }
+
+
+@require_http_methods(["GET"])
+@login_required('teacher')
+def export_course_students(request, course_id):
+    """流式导出课程的选课学生名单（?format=ndjson|csv）"""
+    user_id = request.user_id
+
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in exports.FORMATS:
+        return JsonResponse({'error': '不支持的导出格式'}, status=400)
+
+    # 应用层验证：检查课程是否属于该教师
+    if not Course.objects.filter(id=course_id, teacher_id=user_id).exists():
+        return JsonResponse({'error': '课程不存在或您不是该课程的教师'}, status=404)
+
+    rows = exports.iter_roster(course_id)
+    stream = exports.stream_csv(rows) if export_format == 'csv' else exports.stream_ndjson(rows)
+
+    response = StreamingHttpResponse(stream, content_type=exports.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="course-{course_id}-students.{export_format}"'
+    return response
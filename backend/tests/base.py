@@ -0,0 +1,66 @@
+"""
+测试公共部分：账号、登录、发送JSON请求
+
+所有账号共用一个测试密码，哈希只算一次。
+"""
+import json
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from backend.hashing import hash_password
+from students.models import Student
+from teachers.models import Teacher
+
+PASSWORD = 'secret'
+
+_password_hash = None
+
+
+def password_hash():
+    """PASSWORD 的哈希（只计算一次）"""
+    global _password_hash
+    if _password_hash is None:
+        _password_hash = hash_password(PASSWORD)
+    return _password_hash
+
+
+def create_teacher(username='t'):
+    return Teacher.objects.create(username=username, password=password_hash(), email=f'{username}@example.com')
+
+
+def create_student(username='s'):
+    return Student.objects.create(username=username, password=password_hash(), email=f'{username}@example.com')
+
+
+def create_students(count, prefix='s'):
+    """批量创建 <prefix>0 ... <prefix>{count-1}"""
+    return Student.objects.bulk_create(
+        Student(username=f'{prefix}{i}', password=password_hash(), email=f'{prefix}{i}@example.com')
+        for i in range(count)
+    )
+
+
+def clear_caches():
+    for alias in ('default', 'sessions'):
+        caches[alias].clear()
+
+
+def post_json(client, url, data, **extra):
+    return client.post(url, json.dumps(data), content_type='application/json', **extra)
+
+
+class ApiTestCase(TestCase):
+    """每个用例前清空缓存（版本号、目录缓存、session）；login() 返回已登录的客户端"""
+
+    def setUp(self):
+        clear_caches()
+
+    def login(self, role, username, client=None):
+        client = client or self.client_class()
+        response = post_json(client, f'/api/{role}/login/', {'username': username, 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return client
+
+    def post_json(self, client, url, data, **extra):
+        return post_json(client, url, data, **extra)
@@ -0,0 +1,203 @@
+"""
+座位分配器：内存存储上的选课/退课/写回/对账，并发选课不超卖，写回在后台线程进行
+"""
+import threading
+from unittest import mock, skipIf
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from courses import allocator
+from courses.allocator import MemorySeatStore
+from courses.models import Course, Enrollment
+from .base import ApiTestCase, create_student, create_teacher
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+SEAT_ALLOCATOR = {'ENABLED': True, 'BACKEND': 'memory', 'FLUSH_BATCH': 500, 'FLUSH_THREAD': False}
+
+
+class MemorySeatStoreTests(SimpleTestCase):
+
+    def test_enroll_and_release(self):
+        store = MemorySeatStore()
+        self.assertEqual(store.enroll(1, 10), allocator.NOT_LOADED)
+        store.load(10, 1, [2])
+        self.assertEqual(store.enroll(2, 10), allocator.ALREADY_ENROLLED)
+        self.assertEqual(store.enroll(1, 10), allocator.ENROLLED)
+        self.assertEqual(store.enroll(3, 10), allocator.FULL)
+        # 已选的学生在课程满了之后仍然是“已选”
+        self.assertEqual(store.enroll(1, 10), allocator.ALREADY_ENROLLED)
+
+        self.assertTrue(store.release(1, 10))
+        self.assertFalse(store.release(1, 10))
+        self.assertEqual(store.enroll(3, 10), allocator.ENROLLED)
+        self.assertEqual(store.pending(), 3)
+
+        # 已加载的课程不会被覆盖，除非 replace=True
+        store.load(10, 99, [])
+        self.assertEqual(store.enroll(4, 10), allocator.FULL)
+
+    def test_claim_replays_inflight(self):
+        store = MemorySeatStore()
+        store.load(10, 5, [])
+        for student_id in (1, 2, 3):
+            store.enroll(student_id, 10)
+        self.assertEqual(len(store.claim(2)), 2)
+        # 没有 ack（写回中途崩溃）：下次认领时重放上次的两条
+        self.assertEqual([op[1] for op in store.claim(2)], [1, 2, 3])
+        store.ack()
+        self.assertEqual(store.claim(2), [])
+
+    def test_flush_lock(self):
+        store = MemorySeatStore()
+        token = store.acquire_flush(60)
+        self.assertIsNotNone(token)
+        self.assertIsNone(store.acquire_flush(60))
+        store.release_flush(token)
+        self.assertIsNotNone(store.acquire_flush(60))
+
+    def test_concurrent_enroll_no_oversell(self):
+        store = MemorySeatStore()
+        store.load(10, 5, [])
+        barrier = threading.Barrier(40)
+        results = []
+
+        def run(student_id):
+            barrier.wait()
+            results.append(store.enroll(student_id, 10))
+
+        # 20个学生、每人两个请求同时选5个座位
+        threads = [threading.Thread(target=run, args=(i % 20,)) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(allocator.ENROLLED), 5)
+        ops = store.claim(100)
+        self.assertEqual(len(ops), 5)
+        self.assertEqual(len({student_id for _, student_id, _ in ops}), 5)
+
+
+class SharedStoreCheckTests(SimpleTestCase):
+
+    @override_settings(SEAT_ALLOCATOR=SEAT_ALLOCATOR, WEB_CONCURRENCY=4)
+    def test_memory_store_with_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            allocator.check_shared_store()
+
+    @override_settings(SEAT_ALLOCATOR=SEAT_ALLOCATOR, WEB_CONCURRENCY=1, MULTI_HOST=True)
+    def test_memory_store_multi_host(self):
+        with self.assertRaises(ImproperlyConfigured):
+            allocator.check_shared_store()
+
+    @override_settings(SEAT_ALLOCATOR=SEAT_ALLOCATOR, WEB_CONCURRENCY=1, MULTI_HOST=False)
+    def test_single_process(self):
+        allocator.check_shared_store()
+
+    @override_settings(WEB_CONCURRENCY=4)
+    def test_redis_or_disabled(self):
+        with override_settings(SEAT_ALLOCATOR={**SEAT_ALLOCATOR, 'BACKEND': 'redis'}):
+            allocator.check_shared_store()
+        with override_settings(SEAT_ALLOCATOR={**SEAT_ALLOCATOR, 'ENABLED': False}):
+            allocator.check_shared_store()
+
+
+@override_settings(SEAT_ALLOCATOR=SEAT_ALLOCATOR)
+class AllocatorFlowTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.student = create_student()
+        cls.course = Course.objects.create(name='hot', teacher_id=teacher.id, capacity=2)
+        # 已有一条选课记录：预加载时剩余1个座位
+        Enrollment.objects.create(student_id=999, course_id=cls.course.id)
+        Course.objects.filter(id=cls.course.id).update(enrolled_count=1)
+
+    def setUp(self):
+        super().setUp()
+        self.store = MemorySeatStore()
+        allocator.reset_store(self.store)
+        self.addCleanup(allocator.reset_store)
+
+    def _count(self):
+        return Course.objects.get(id=self.course.id).enrolled_count
+
+    def test_enroll_flush_release(self):
+        client = self.login('student', 's')
+        response = self.post_json(client, '/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(allocator.enroll(1000, self.course.id), allocator.FULL)
+        # 写回之前数据库不变
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+        self.assertEqual(allocator.flush(), 1)
+        self.assertTrue(Enrollment.objects.filter(student_id=self.student.id, course_id=self.course.id).exists())
+        self.assertEqual(self._count(), 2)
+
+        response = self.post_json(client, '/api/student/drop/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(allocator.flush(), 1)
+        self.assertFalse(Enrollment.objects.filter(student_id=self.student.id).exists())
+        self.assertEqual(self._count(), 1)
+
+    def test_flush_skips_when_locked(self):
+        allocator.enroll(self.student.id, self.course.id)
+        token = self.store.acquire_flush(60)
+        self.assertEqual(allocator.flush(), 0)
+        self.store.release_flush(token)
+        self.assertEqual(allocator.flush(), 1)
+
+    def test_reconcile(self):
+        allocator.enroll(self.student.id, self.course.id)
+        # 存储状态和数据库不一致（比如Redis被清空后手工加载错了）
+        self.store.load(self.course.id, 50, [], replace=True)
+        Course.objects.filter(id=self.course.id).update(enrolled_count=0)
+
+        allocator.reconcile()
+        self.assertEqual(self._count(), 2)
+        self.assertEqual(allocator.enroll(1000, self.course.id), allocator.FULL)
+        self.assertEqual(allocator.enroll(self.student.id, self.course.id), allocator.ALREADY_ENROLLED)
+
+    @override_settings(SEAT_ALLOCATOR={**SEAT_ALLOCATOR, 'FLUSH_BATCH': 1, 'FLUSH_THREAD': True})
+    def test_flush_in_background(self):
+        flushed = threading.Event()
+        threads = []
+
+        def fake_flush():
+            threads.append(threading.current_thread().name)
+            flushed.set()
+
+        # 日志积压到 FLUSH_BATCH：请求线程只唤醒后台线程，不自己写库
+        with mock.patch.object(allocator, 'flush', side_effect=fake_flush):
+            with self.assertNumQueries(2):
+                self.assertEqual(allocator.enroll(self.student.id, self.course.id), allocator.ENROLLED)
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(threads, ['seat-flush'])
+        self.assertEqual(self.store.pending(), 1)
+
+
+@skipIf(fakeredis is None, 'fakeredis 未安装')
+class RedisFlushLockTests(SimpleTestCase):
+
+    def test_release_only_own_lock(self):
+        store = allocator.RedisSeatStore(fakeredis.FakeRedis(), prefix='test-seats')
+        token = store.acquire_flush(60)
+        self.assertIsNotNone(token)
+        self.assertIsNone(store.acquire_flush(60))
+
+        # 锁过期后被其他进程拿走：旧令牌既不能续期也不能删掉别人的锁
+        store.client.delete('test-seats:flush_lock')
+        other = store.acquire_flush(60)
+        self.assertFalse(store.extend_flush(token, 60))
+        store.release_flush(token)
+        self.assertIsNone(store.acquire_flush(60))
+
+        self.assertTrue(store.extend_flush(other, 60))
+        store.release_flush(other)
+        self.assertIsNotNone(store.acquire_flush(60))
@@ -0,0 +1,82 @@
+"""
+异步只读接口（ASYNC_READ_VIEWS）：经过完整的中间件和URL路由，返回和同步版本完全相同的数据、ETag和错误
+"""
+from django.test import override_settings
+from django.urls import include, path
+
+from courses import seats
+from courses.models import Course
+from students import async_views as student_views
+from teachers import async_views as teacher_views
+from .base import ApiTestCase, create_student, create_teacher
+
+# 和 ASYNC_READ_VIEWS=True 时相同的路由：只读接口换成异步版本，其余照旧
+urlpatterns = [
+    path('api/student/courses/', student_views.available_courses, name='student-courses'),
+    path('api/student/my-courses/', student_views.my_courses, name='student-my-courses'),
+    path('api/current-user/', student_views.current_user, name='current-user'),
+    path('api/teacher/courses/', teacher_views.my_courses, name='teacher-courses'),
+    path('api/teacher/courses/<int:course_id>/students/', teacher_views.course_students,
+         name='teacher-course-students'),
+    path('', include('backend.urls')),
+]
+
+URLS = [
+    ('student', '/api/student/courses/'),
+    ('student', '/api/student/courses/?limit=2&has_seats=1&fields=id,enrolled,is_full,is_enrolled'),
+    ('student', '/api/student/courses/?not_enrolled=1&after=1'),
+    ('student', '/api/student/courses/?fields=nope'),
+    ('student', '/api/student/my-courses/'),
+    ('student', '/api/current-user/'),
+    ('teacher', '/api/teacher/courses/?has_seats=1'),
+    ('teacher', '/api/teacher/courses/{course}/students/?limit=1'),
+    ('teacher', '/api/teacher/courses/{other}/students/'),
+]
+
+
+class AsyncReadViewTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        other_teacher = create_teacher('t2')
+        cls.courses = [Course.objects.create(name=f'c{i}', teacher_id=cls.teacher.id, capacity=2) for i in range(4)]
+        cls.other = Course.objects.create(name='other', teacher_id=other_teacher.id, capacity=2)
+        cls.student = create_student()
+        for course in cls.courses[:2]:
+            seats.enroll(cls.student.id, course.id)
+        seats.enroll(create_student('s2').id, cls.courses[0].id)
+
+    def setUp(self):
+        super().setUp()
+        self.clients = {'student': self.login('student', 's'), 'teacher': self.login('teacher', 't')}
+
+    def _get(self, role, url, **extra):
+        url = url.format(course=self.courses[0].id, other=self.other.id)
+        return self.clients[role].get(url, **extra)
+
+    def test_same_as_sync(self):
+        expected = [self._get(role, url) for role, url in URLS]
+        with override_settings(ROOT_URLCONF=__name__):
+            for (role, url), sync in zip(URLS, expected):
+                with self.subTest(url=url):
+                    response = self._get(role, url)
+                    self.assertEqual(response.status_code, sync.status_code)
+                    self.assertEqual(response.content, sync.content)
+                    self.assertEqual(response.get('ETag'), sync.get('ETag'))
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_routes_to_async_views(self):
+        response = self._get('student', '/api/student/courses/')
+        self.assertIs(response.resolver_match.func, student_views.available_courses)
+        self.assertEqual([c['is_enrolled'] for c in response.json()['courses']], [True, True, False, False, False])
+
+        # 数据没变：304
+        response = self._get('student', '/api/student/courses/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self._get('student', '/api/student/my-courses/')
+        self.assertIs(response.resolver_match.func, student_views.my_courses)
+        self.assertEqual([c['course_id'] for c in response.json()['courses']], [c.id for c in self.courses[:2]])
+
+        self.assertEqual(self.client.get('/api/student/courses/').status_code, 401)
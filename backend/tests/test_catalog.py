@@ -0,0 +1,64 @@
+"""
+课程目录缓存：拼接的JSON片段和逐字段编码一致，fields 裁剪，选课后只更新那一门课的人数，
+has_seats 过滤掉已满课程后仍能取满一页
+"""
+import json
+
+from courses import catalog, seats
+from courses.models import Course
+from .base import ApiTestCase, create_student, create_teacher
+
+URL = '/api/student/courses/'
+
+
+class CatalogTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.courses = [
+            Course.objects.create(name=f'课程{i}', description='"引号"\n', teacher_id=teacher.id, capacity=2)
+            for i in range(6)
+        ]
+        cls.student = create_student()
+
+    def setUp(self):
+        super().setUp()
+        self.student_client = self.login('student', 's')
+
+    def test_render_matches_json(self):
+        seats.enroll(self.student.id, self.courses[0].id)
+        body = self.student_client.get(URL + '?limit=4').content
+        data = json.loads(body)
+        self.assertEqual(data['next_cursor'], self.courses[3].id)
+        self.assertEqual(data['courses'][0], {
+            'id': self.courses[0].id, 'name': '课程0', 'description': '"引号"\n', 'teacher': 't',
+            'capacity': 2, 'enrolled': 1, 'is_full': False, 'is_enrolled': True,
+        })
+        # 和直接编码整个字典的输出逐字节相同
+        self.assertEqual(body, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+        data = self.student_client.get(URL + '?fields=id,enrolled,is_enrolled&limit=1').json()
+        self.assertEqual(data['courses'], [{'id': self.courses[0].id, 'enrolled': 1, 'is_enrolled': True}])
+
+    def test_seat_change_updates_one_course(self):
+        self.student_client.get(URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            seats.enroll(create_student('s2').id, self.courses[1].id)
+
+        # 目录条目和其他课程的人数都还在缓存里，只查该学生的已选课程
+        with self.assertNumQueries(1):
+            data = self.student_client.get(URL).json()
+        self.assertEqual([c['enrolled'] for c in data['courses']], [0, 1, 0, 0, 0, 0])
+
+    def test_has_seats_fills_page(self):
+        for course in self.courses[:3]:
+            Course.objects.filter(id=course.id).update(enrolled_count=2)
+        data = self.student_client.get(URL + '?has_seats=1&limit=2').json()
+        self.assertEqual([c['id'] for c in data['courses']], [c.id for c in self.courses[3:5]])
+        self.assertEqual(data['next_cursor'], self.courses[4].id)
+
+        entries = catalog.get_catalog()
+        rows, next_cursor = catalog.query(entries, set(), after=self.courses[4].id, limit=2, has_seats=True)
+        self.assertEqual([entries[1][j] for j, _, _ in rows], [self.courses[5].id])
+        self.assertIsNone(next_cursor)
@@ -0,0 +1,77 @@
+"""
+删除课程：打删除标记后所有读接口立即看不到，选课记录由 courses.purge 分批清理
+"""
+from django.core.management import call_command
+
+from courses import purge
+from courses.models import Course, Enrollment
+from .base import ApiTestCase, create_students, create_teacher
+
+
+class CoursePurgeTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        cls.course = Course.objects.create(name='big', teacher_id=cls.teacher.id, capacity=100)
+        cls.other = Course.objects.create(name='other', teacher_id=cls.teacher.id, capacity=100)
+        students = create_students(25)
+        cls.student = students[0]
+        Enrollment.objects.bulk_create(Enrollment(student_id=s.id, course_id=cls.course.id) for s in students)
+        Enrollment.objects.create(student_id=cls.student.id, course_id=cls.other.id)
+
+    def setUp(self):
+        super().setUp()
+        self.teacher_client = self.login('teacher', 't')
+        self.student_client = self.login('student', 's0')
+
+    def _delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.teacher_client.delete(f'/api/teacher/courses/{self.course.id}/delete/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_tombstoned_course_disappears(self):
+        self._delete()
+
+        # 选课记录还在，但课程已经从所有读接口消失
+        self.assertEqual(Enrollment.objects.filter(course_id=self.course.id).count(), 25)
+        self.assertTrue(Course.all_objects.filter(id=self.course.id, deleted_at__isnull=False).exists())
+
+        catalog = self.student_client.get('/api/student/courses/').json()['courses']
+        self.assertEqual([c['id'] for c in catalog], [self.other.id])
+        teacher = self.teacher_client.get('/api/teacher/courses/').json()['courses']
+        self.assertEqual([c['id'] for c in teacher], [self.other.id])
+        roster = self.teacher_client.get(f'/api/teacher/courses/{self.course.id}/students/')
+        self.assertEqual(roster.status_code, 404)
+
+        # 不能再选，也不能重复删除
+        response = self.post_json(self.student_client, '/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 404)
+        response = self.teacher_client.delete(f'/api/teacher/courses/{self.course.id}/delete/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_purge_in_batches(self):
+        self._delete()
+
+        self.student_client.get('/api/student/my-courses/')
+        with self.assertNumQueries(1 + 3 * 5 + 2):
+            # 存在性检查；25条每批10条：3批（查id、标记课表、SAVEPOINT、DELETE、RELEASE）；最后删除候补和课程行
+            removed = purge.purge_course(self.course.id, batch_size=10, sleep=0)
+        self.assertEqual(removed, 25)
+        # 课表在清理时标记为待重建，重新读取时已经没有这门课
+        mine = self.student_client.get('/api/student/my-courses/').json()['courses']
+        self.assertEqual([c['course_id'] for c in mine], [self.other.id])
+        self.assertFalse(Enrollment.objects.filter(course_id=self.course.id).exists())
+        self.assertFalse(Course.all_objects.filter(id=self.course.id).exists())
+        # 其他课程不受影响
+        self.assertEqual(Enrollment.objects.filter(course_id=self.other.id).count(), 1)
+
+    def test_purge_command(self):
+        self._delete()
+        call_command('purge_courses', batch_size=7, sleep=0, stdout=open('/dev/null', 'w'))
+        self.assertFalse(Enrollment.objects.filter(course_id=self.course.id).exists())
+        self.assertFalse(Course.all_objects.filter(id=self.course.id).exists())
+
+    def test_live_course_is_not_purged(self):
+        self.assertEqual(purge.purge_course(self.other.id, sleep=0), 0)
+        self.assertTrue(Course.objects.filter(id=self.other.id).exists())
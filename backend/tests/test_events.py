@@ -0,0 +1,85 @@
+"""
+座位变化推送：SSE连接订阅后收到选课/退课的人数变化；目录已缓存时推送的人数来自缓存，不查库
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.test import override_settings
+
+from courses import events, seats
+from courses.models import Course
+from .base import ApiTestCase, create_student, create_teacher
+
+
+@override_settings(SEAT_EVENTS={'HEARTBEAT': 1, 'MAX_AGE': 5})
+class SeatStreamTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.course = Course.objects.create(name='c', teacher_id=teacher.id, capacity=1)
+        cls.student = create_student()
+
+    def setUp(self):
+        super().setUp()
+        events.reset_broker(events.InProcessBroker())
+        self.addCleanup(events.reset_broker)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.stream = events.sse_stream()
+        # 第一条输出之后已经订阅上了
+        self.assertEqual(self._next(), 'retry: 3000\n\n')
+        self.addCleanup(lambda: self.loop.run_until_complete(self.stream.aclose()))
+
+    def _next(self):
+        return self.loop.run_until_complete(self.stream.__anext__())
+
+    def _event(self):
+        chunk = self._next()
+        self.assertTrue(chunk.startswith('event: seats\ndata: '), chunk)
+        return json.loads(chunk.split('data: ', 1)[1])
+
+    def test_enroll_and_drop(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seats.enroll(self.student.id, self.course.id)
+        self.assertEqual(self._event(), {'course_id': self.course.id, 'enrolled': 1, 'capacity': 1, 'is_full': True})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            seats.release(self.student.id, self.course.id)
+        self.assertEqual(self._event()['enrolled'], 0)
+
+    def test_cached_counts_not_queried(self):
+        self.login('student', 's').get('/api/student/courses/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            seats.enroll(self.student.id, self.course.id)
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self._event()['enrolled'], 1)
+
+        # 人数缓存里也跟着变了
+        course = self.login('student', 's').get('/api/student/courses/').json()['courses'][0]
+        self.assertEqual((course['enrolled'], course['is_full']), (1, True))
+
+
+class SeatStreamViewTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_student()
+
+    def test_wsgi_not_available(self):
+        # WSGI会把整个流读完才发送：立即返回404，不建立长连接
+        response = self.login('student', 's').get('/api/student/seats/stream/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.streaming)
+
+    async def test_asgi_stream(self):
+        self.async_client.cookies = (await sync_to_async(self.login)('student', 's')).cookies
+        response = await self.async_client.get('/api/student/seats/stream/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        await stream.aclose()
@@ -0,0 +1,109 @@
+"""
+密码哈希：工作因子解析、调整 BCRYPT_ROUNDS 后登录时重新哈希、进程池排队已满时返回503
+"""
+import threading
+from concurrent.futures import Future
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from backend import hashing
+from students.models import Student
+from teachers.models import Teacher
+from .base import PASSWORD, ApiTestCase, create_student, create_teacher, password_hash
+
+
+class InlinePool:
+    """在当前线程里执行的“进程池”，只用来走 _submit 的排队逻辑"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class NeedsRehashTests(SimpleTestCase):
+
+    @override_settings(BCRYPT_ROUNDS=12)
+    def test_cost_parsing(self):
+        self.assertFalse(hashing.needs_rehash('$2b$12$' + 'a' * 53))
+        self.assertTrue(hashing.needs_rehash('$2b$10$' + 'a' * 53))
+        self.assertTrue(hashing.needs_rehash('$2b$4$' + 'a' * 53))
+        # 不是bcrypt格式：重新哈希
+        for hashed in ('', 'plain', '$2b$xx$abc', None):
+            with self.subTest(hashed=hashed):
+                self.assertTrue(hashing.needs_rehash(hashed))
+
+    def test_current_rounds(self):
+        self.assertFalse(hashing.needs_rehash(password_hash()))
+        with override_settings(BCRYPT_ROUNDS=5):
+            self.assertTrue(hashing.needs_rehash(password_hash()))
+
+
+class RehashOnLoginTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        cls.teacher = create_teacher()
+
+    @override_settings(BCRYPT_ROUNDS=5)
+    def test_rehash(self):
+        for role, model, user in (('student', Student, self.student), ('teacher', Teacher, self.teacher)):
+            with self.subTest(role=role):
+                self.login(role, user.username)
+                hashed = model.objects.get(id=user.id).password
+                self.assertTrue(hashed.startswith('$2b$05$'), hashed)
+                # 新哈希照常能登录，不再重新哈希
+                with mock.patch.object(hashing, '_hash', wraps=hashing._hash) as rehash:
+                    self.login(role, user.username)
+                rehash.assert_not_called()
+
+    def test_wrong_password_not_rehashed(self):
+        with override_settings(BCRYPT_ROUNDS=5):
+            response = self.post_json(self.client, '/api/student/login/', {'username': 's', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Student.objects.get(id=self.student.id).password, password_hash())
+
+
+@override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_TIMEOUT=0)
+class HashPoolBusyTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        create_teacher()
+
+    def _pool(self, slots):
+        self.slots = threading.BoundedSemaphore(slots)
+        patcher = mock.patch.object(hashing, '_get_pool', return_value=(InlinePool(), self.slots))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_busy_returns_503(self):
+        self._pool(1)
+        self.slots.acquire()  # 另一个请求占着唯一的名额
+        requests = (
+            ('/api/student/login/', {'username': 's', 'password': PASSWORD}),
+            ('/api/teacher/login/', {'username': 't', 'password': PASSWORD}),
+            ('/api/student/register/', {'username': 'new', 'password': PASSWORD, 'email': 'new@example.com'}),
+        )
+        for url, data in requests:
+            with self.subTest(url=url):
+                response = self.post_json(self.client, url, data)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Student.objects.filter(username='new').exists())
+
+        # 名额空出来后照常登录，用完归还名额
+        self.slots.release()
+        self.login('student', 's')
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+    @override_settings(BCRYPT_ROUNDS=5)
+    def test_rehash_skipped_when_busy(self):
+        self._pool(1)
+        # 校验通过后进程池正好被占满：跳过重新哈希，登录照常成功，下次登录再做
+        with mock.patch.object(hashing, 'hash_password', side_effect=hashing.HashPoolBusy('busy')):
+            self.login('student', 's')
+        self.assertEqual(Student.objects.get(id=self.student.id).password, password_hash())
@@ -0,0 +1,117 @@
+"""
+幂等键：重发返回保存的响应且不查库、并发重发合并到同一次执行、换请求体拒绝
+"""
+import threading
+from unittest import mock
+
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.client import Client
+
+from courses.models import Course, Enrollment
+from .base import PASSWORD, ApiTestCase, clear_caches, create_student, create_teacher, post_json
+
+
+class IdempotencyTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        cls.student = create_student()
+        cls.course = Course.objects.create(name='c', teacher_id=cls.teacher.id, capacity=5)
+
+    def _post(self, client, url, data, key):
+        return self.post_json(client, url, data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_enroll(self):
+        client = self.login('student', 's')
+        first = self._post(client, '/api/student/enroll/', {'course_id': self.course.id}, 'k1')
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(0):
+            again = self._post(client, '/api/student/enroll/', {'course_id': self.course.id}, 'k1')
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+
+        # 新的键是新的请求
+        response = self._post(client, '/api/student/enroll/', {'course_id': self.course.id}, 'k2')
+        self.assertEqual(response.json()['error'], '您已经选过这门课了')
+        # 同一个键换请求体
+        response = self._post(client, '/api/student/enroll/', {'course_id': 0}, 'k1')
+        self.assertEqual(response.status_code, 422)
+
+    def test_create_course_once(self):
+        client = self.login('teacher', 't')
+        for _ in range(3):
+            response = self._post(client, '/api/teacher/courses/create/', {'name': 'new'}, 'create-1')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Course.objects.filter(name='new').count(), 1)
+
+    def test_keys_are_per_user(self):
+        other = create_student('s2')
+        for username in ('s', other.username):
+            client = self.login('student', username)
+            response = self._post(client, '/api/student/enroll/', {'course_id': self.course.id}, 'same')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Enrollment.objects.count(), 2)
+
+    def test_server_error_not_saved(self):
+        client = self.login('student', 's')
+        with mock.patch('students.views.seats.release', side_effect=RuntimeError('boom')):
+            response = self._post(client, '/api/student/drop/', {'course_id': self.course.id}, 'drop')
+        self.assertEqual(response.status_code, 500)
+
+        # 5xx 不保存，同一个键重试会真正执行
+        Enrollment.objects.create(student_id=self.student.id, course_id=self.course.id)
+        response = self._post(client, '/api/student/drop/', {'course_id': self.course.id}, 'drop')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Enrollment.objects.exists())
+
+
+class ConcurrentRetryTests(TransactionTestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.teacher = create_teacher()
+
+    def test_coalesce_in_flight(self):
+        client = Client()
+        post_json(client, '/api/teacher/login/', {'username': 't', 'password': PASSWORD})
+        cookies = client.cookies
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_bump(*args):
+            # 第一个请求占位、建好课程之后卡住，让重发请求在它执行期间到达
+            started.set()
+            release.wait(5)
+
+        results = []
+
+        def send():
+            retry = Client()
+            retry.cookies = cookies
+            try:
+                results.append(post_json(retry, '/api/teacher/courses/create/', {'name': 'dup'},
+                                         HTTP_IDEMPOTENCY_KEY='same'))
+            finally:
+                connections.close_all()
+
+        with mock.patch('teachers.views.versions.bump_catalog', side_effect=slow_bump) as bump:
+            first = threading.Thread(target=send)
+            first.start()
+            self.assertTrue(started.wait(5))
+            second = threading.Thread(target=send)
+            second.start()
+            second.join(0.2)
+            self.assertTrue(second.is_alive())  # 在等第一个请求
+            release.set()
+            first.join()
+            second.join()
+        self.assertEqual(bump.call_count, 1)
+
+        self.assertEqual([r.status_code for r in results], [201, 201])
+        self.assertEqual(results[0].content, results[1].content)
+        self.assertEqual(Course.objects.filter(name='dup').count(), 1)
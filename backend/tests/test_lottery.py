@@ -0,0 +1,118 @@
+"""
+志愿抽签：分配规则、numpy与纯Python实现一致、端到端写入选课记录
+"""
+import random
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from courses import lottery
+from courses.models import Course, CoursePreference, Enrollment
+from .base import ApiTestCase, create_students, create_teacher
+
+
+class AllocateTests(SimpleTestCase):
+
+    def _random_case(self, n_students=500, n_courses=40, per_student=6):
+        rng = random.Random(7)
+        prefs = [rng.sample(range(n_courses), rng.randint(0, per_student)) for _ in range(n_students)]
+        remaining = [rng.randint(0, 30) for _ in range(n_courses)]
+        return prefs, remaining
+
+    def _check(self, prefs, remaining, pairs):
+        self.assertEqual(len(pairs), len(set(pairs)))
+        for i, course in pairs:
+            self.assertIn(course, prefs[i])
+        taken = [0] * len(remaining)
+        for _, course in pairs:
+            taken[course] += 1
+        self.assertTrue(all(t <= r for t, r in zip(taken, remaining)))
+
+    def test_capacity_and_preferences(self):
+        prefs, remaining = self._random_case()
+        self._check(prefs, remaining, lottery.allocate(prefs, remaining, seed=1, use_numpy=False))
+
+    @skipIf(lottery.numpy is None, 'numpy 未安装')
+    def test_numpy_matches_python(self):
+        prefs, remaining = self._random_case()
+        fast = lottery.allocate(prefs, remaining, seed=3, use_numpy=True)
+        slow = lottery.allocate(prefs, remaining, seed=3, use_numpy=False)
+        self.assertEqual(sorted(fast), sorted(slow))
+        self._check(prefs, remaining, fast)
+
+    def test_fewer_courses_first(self):
+        # 两人志愿相同，每门课1个座位：第一轮没抽中的人第二轮优先
+        for seed in range(10):
+            pairs = lottery.allocate([[0, 1], [0, 1]], [1, 1], seed=seed, use_numpy=False)
+            self.assertEqual(sorted(i for i, _ in pairs), [0, 1])
+
+    def test_same_seed_same_result(self):
+        prefs, remaining = self._random_case()
+        self.assertEqual(lottery.allocate(prefs, remaining, seed=5),
+                         lottery.allocate(prefs, remaining, seed=5))
+
+
+@override_settings(LOTTERY={'ENABLED': True, 'MAX_PREFERENCES': 3})
+class LotteryFlowTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.courses = [Course.objects.create(name=f'c{i}', teacher_id=teacher.id, capacity=2) for i in range(3)]
+        cls.students = create_students(4)
+
+    def test_submit_and_allocate(self):
+        hot, second, third = (c.id for c in self.courses)
+        for student in self.students:
+            client = self.login('student', student.username)
+            response = self.post_json(client, '/api/student/preferences/', {'course_ids': [hot, second, hot]})
+            self.assertEqual(response.json()['course_ids'], [hot, second])
+            # 抽签模式下不能实时选课
+            response = self.post_json(client, '/api/student/enroll/', {'course_id': third})
+            self.assertEqual(response.status_code, 400)
+
+        response = self.post_json(self.login('student', self.students[0].username), '/api/student/preferences/',
+                              {'course_ids': [hot, second, third, 999]})
+        self.assertEqual(response.status_code, 400)
+
+        call_command('allocate_lottery', seed=1, stdout=open('/dev/null', 'w'))
+
+        # 4人抢2个座位的热门课：没抽中的2人第二轮优先拿到第二志愿
+        self.assertEqual(Enrollment.objects.filter(course_id=hot).count(), 2)
+        self.assertEqual(Enrollment.objects.filter(course_id=second).count(), 2)
+        self.assertEqual(Enrollment.objects.values('student_id').distinct().count(), 4)
+        self.assertEqual([c.enrolled_count for c in Course.objects.order_by('id')], [2, 2, 0])
+        self.assertFalse(CoursePreference.objects.exists())
+
+    def test_dry_run_and_existing_enrollment(self):
+        hot = self.courses[0].id
+        Enrollment.objects.create(student_id=self.students[0].id, course_id=hot)
+        for student in self.students:
+            lottery.submit(student.id, [hot])
+
+        stats = lottery.run(seed=1, dry_run=True)
+        # 已选上的志愿去掉；剩余1个座位
+        self.assertEqual(stats['preferences'], 3)
+        self.assertEqual(stats['enrolled'], 1)
+        self.assertEqual(Enrollment.objects.count(), 1)
+        self.assertEqual(CoursePreference.objects.count(), 4)
+
+    def test_load_reads_only_applicants_enrollments(self):
+        hot, second = self.courses[0].id, self.courses[1].id
+        applicant, outsider = self.students[0].id, self.students[1].id
+        Enrollment.objects.create(student_id=applicant, course_id=hot)
+        Enrollment.objects.create(student_id=outsider, course_id=second)
+        lottery.submit(applicant, [hot, second])
+
+        with CaptureQueriesContext(connection) as queries:
+            student_ids, course_ids, prefs, remaining = lottery.load(CoursePreference.objects.latest('id').id)
+        self.assertEqual(student_ids, [applicant])
+        self.assertEqual(prefs, [[course_ids.index(second)]])
+        self.assertEqual(remaining, [1, 1, 2])
+        # 选课记录只按提交了志愿的学生读取，不扫全表
+        enrollment_reads = [q['sql'] for q in queries if 'FROM "enrollments"' in q['sql'] and 'student_id' in q['sql']]
+        self.assertEqual(len(enrollment_reads), 1)
+        self.assertIn(f'"student_id" IN ({applicant})', enrollment_reads[0])
@@ -0,0 +1,119 @@
+"""
+接口统计：按线程分片的计数汇总、多进程快照合并、Prometheus文本格式，/api/metrics 只对允许的地址或令牌开放
+"""
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from backend import metrics
+from .base import ApiTestCase
+
+URL = '/api/metrics'
+
+
+def _stats(sql_count=0, sql_time=0.0, hash_count=0, hash_time=0.0):
+    stats = metrics.RequestStats()
+    stats.sql_count, stats.sql_time = sql_count, sql_time
+    stats.hash_count, stats.hash_time = hash_count, hash_time
+    return stats
+
+
+class CounterTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(metrics._shards, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_thread_shards_summed(self):
+        barrier = threading.Barrier(4)
+
+        def run():
+            barrier.wait()
+            for _ in range(100):
+                metrics.record('student-courses', 0.02, _stats(sql_count=2, sql_time=0.001))
+            metrics.record('student-login', 0.3, _stats(hash_count=1, hash_time=0.25))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 每个线程只写自己的分片
+        self.assertEqual(len(metrics._shards), 4)
+        for shard in metrics._shards.values():
+            self.assertEqual(shard['student-courses'][metrics.COUNT], 100)
+
+        totals = metrics.snapshot()
+        courses = totals['student-courses']
+        self.assertEqual(courses[metrics.COUNT], 400)
+        self.assertEqual(courses[metrics.SQL_COUNT], 800)
+        self.assertAlmostEqual(courses[metrics.SQL_TIME], 0.4)
+        self.assertEqual(courses[6 + metrics.BUCKETS.index(0.025)], 400)
+        login = totals['student-login']
+        self.assertEqual((login[metrics.COUNT], login[metrics.HASH_COUNT]), (4, 4))
+        self.assertEqual(login[6 + metrics.BUCKETS.index(0.5)], 4)
+
+    def test_collect_merges_other_processes(self):
+        metrics.record('student-courses', 20, _stats(sql_count=1))
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={'DIR': directory}):
+            other = [0] * metrics.ROW_SIZE
+            other[metrics.COUNT], other[metrics.SQL_COUNT] = 2, 5
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump({'student-courses': other}, f)
+            # 本进程自己的旧快照不重复计算，坏文件跳过
+            with open(os.path.join(directory, f'{os.getpid()}.json'), 'w') as f:
+                json.dump({'student-courses': other}, f)
+            with open(os.path.join(directory, '2.json'), 'w') as f:
+                f.write('{')
+
+            row = metrics.collect()['student-courses']
+        self.assertEqual((row[metrics.COUNT], row[metrics.SQL_COUNT]), (3, 6))
+        # 超出最大桶
+        self.assertEqual(row[-1], 1)
+
+    def test_render(self):
+        metrics.record('a"b', 0.007, _stats(sql_count=3, sql_time=0.0015))
+        metrics.record('a"b', 0.2, _stats())
+        lines = metrics.render(metrics.snapshot()).splitlines()
+
+        self.assertIn('# TYPE course_request_duration_seconds histogram', lines)
+        self.assertIn('course_request_duration_seconds_bucket{view="a\\"b",le="0.005"} 0', lines)
+        self.assertIn('course_request_duration_seconds_bucket{view="a\\"b",le="0.01"} 1', lines)
+        self.assertIn('course_request_duration_seconds_bucket{view="a\\"b",le="0.25"} 2', lines)
+        self.assertIn('course_request_duration_seconds_bucket{view="a\\"b",le="+Inf"} 2', lines)
+        self.assertIn('course_request_duration_seconds_sum{view="a\\"b"} 0.207000', lines)
+        self.assertIn('course_request_duration_seconds_count{view="a\\"b"} 2', lines)
+        self.assertIn('# TYPE course_sql_queries_total counter', lines)
+        self.assertIn('course_sql_queries_total{view="a\\"b"} 3', lines)
+        self.assertIn('course_sql_seconds_total{view="a\\"b"} 0.001500', lines)
+        self.assertIn('course_password_hash_total{view="a\\"b"} 0', lines)
+
+
+class MetricsViewTests(ApiTestCase):
+
+    def test_local_only(self):
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE course_request_duration_seconds histogram', response.content.decode())
+
+        self.assertEqual(self.client.get(URL, REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    @override_settings(METRICS={'ALLOWED_IPS': ['10.0.0.0/8'], 'TOKEN': 'secret'})
+    def test_allowed_ips_and_token(self):
+        self.assertEqual(self.client.get(URL, REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get(URL).status_code, 403)
+        self.assertEqual(self.client.get(URL, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(URL, REMOTE_ADDR='203.0.113.5', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_scrape_does_not_write_snapshot(self):
+        # 直接调用视图，排除中间件按间隔写快照的影响
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={'DIR': directory}):
+            self.assertEqual(metrics.metrics_view(RequestFactory().get(URL)).status_code, 200)
+            self.assertEqual(os.listdir(directory), [])
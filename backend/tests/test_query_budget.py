@@ -0,0 +1,298 @@
+"""
+接口查询次数预算
+
+每个接口的SQL条数必须是固定值，和课程/学生/选课记录的数量无关。
+同一组用例分别在 10 / 100 / 1000 门课程的数据上运行，预算相同；
+哪个接口退化成逐行查询（N+1），在大数据集上就会超出预算。
+
+同时记录每个接口的耗时，运行结束后打印；设置环境变量
+QUERY_BUDGET_BASELINE=<文件> 时把耗时写成JSON，用来和改动前对比。
+
+    python manage.py test --settings=backend.test_settings
+"""
+import json
+import os
+import sys
+import time
+
+from django.test import override_settings
+
+from courses import schedules, seats
+from courses.models import Course, Enrollment
+from teachers.models import Teacher
+from .base import PASSWORD, ApiTestCase, create_students, password_hash
+
+# 每个接口允许的SQL条数（URL名 -> 条数）
+BUDGETS = {
+    'student-register': 3,
+    'student-login': 1,
+    'student-courses': 4,
+    'student-courses-warm': 1,
+    'student-courses-304': 0,
+    'student-my-courses': 1,           # 物化的课表，按主键查一次
+    'student-my-courses-rebuild': 5,   # 待重建：重建（选课记录、课程、教师）并保存
+    'student-my-courses-304': 0,
+    'student-enroll': 10,        # 锁课表行、查课程和教师名、写回课表；推送的人数来自缓存
+    'student-drop': 8,           # 取候补队首的SELECT；锁课表行、写回课表
+    'student-enroll-batch': 10,  # 每门课一条带条件的UPDATE，批次固定为 BATCH 门；课表标记待重建
+    'student-drop-batch': 12,    # 每门课一条取候补队首的SELECT；课表标记待重建
+    'student-enroll-waitlist': 9,
+    'student-waitlist': 2,
+    'student-waitlist-leave': 1,
+    'student-preferences': 5,
+    'student-preferences-get': 1,
+    'student-seat-stream': 0,
+    'logout': 0,
+    'current-user': 1,
+    'teacher-register': 3,
+    'teacher-login': 1,
+    'teacher-courses': 1,
+    'teacher-create-course': 2,
+    'teacher-delete-course': 5,        # 只打删除标记；选课记录和课表由后台清理按批处理
+    'teacher-course-students': 3,
+    'teacher-course-students-export': 3,
+}
+
+# {数据规模: {接口: 耗时毫秒}}
+timings = {}
+
+
+def tearDownModule():
+    if not timings:
+        return
+    names = sorted({name for row in timings.values() for name in row})
+    sizes = sorted(timings)
+    sys.stderr.write('\n耗时（毫秒）\n')
+    sys.stderr.write(f'{"接口":<36}' + ''.join(f'{size:>10}' for size in sizes) + '\n')
+    for name in names:
+        cells = ''.join(f'{timings[size].get(name, float("nan")):>10.2f}' for size in sizes)
+        sys.stderr.write(f'{name:<36}{cells}\n')
+
+    path = os.environ.get('QUERY_BUDGET_BASELINE')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+
+
+class QueryBudgetMixin:
+    """
+    造数据：SIZE 门课程分给 SIZE/10 个教师，SIZE 个学生；
+    所有学生都选了第一门课（名单有 SIZE 人），登录的学生选了 SIZE/10 门课（至少 BATCH 门）
+    """
+    SIZE = None
+    # 批量选课/退课每次的课程数（批量接口的查询数随批次大小增长，但有 BATCH_LIMIT 上限）
+    BATCH = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        size = cls.SIZE
+        password = password_hash()
+
+        teachers = Teacher.objects.bulk_create(
+            Teacher(username=f'teacher{i}', password=password, email=f'teacher{i}@example.com')
+            for i in range(max(1, size // 10))
+        )
+        courses = Course.objects.bulk_create(
+            Course(name=f'course{i}', description='x' * 200,
+                   teacher_id=teachers[i % len(teachers)].id, capacity=size * 2)
+            for i in range(size)
+        )
+        students = create_students(size, prefix='student')
+
+        enrollments = [Enrollment(student_id=s.id, course_id=courses[0].id) for s in students]
+        enrollments += [Enrollment(student_id=students[0].id, course_id=c.id)
+                        for c in courses[1:cls._mine()]]
+        Enrollment.objects.bulk_create(enrollments)
+        seats.recount()
+        schedules.rebuild(s.id for s in students)
+
+        cls.teacher = teachers[0]
+        cls.student = students[0]
+        cls.hot_course = courses[0]
+        # 登录学生没选的课程
+        cls.other_courses = courses[cls._mine():]
+
+    @classmethod
+    def _mine(cls):
+        return max(cls.BATCH + 1, cls.SIZE // 10)
+
+    def setUp(self):
+        super().setUp()
+        self.student_client = self.login('student', self.student.username)
+        self.teacher_client = self.login('teacher', self.teacher.username)
+
+    def _call(self, name, request, status=200):
+        """在预算内执行请求，并记录耗时"""
+        # 提交后的回调（推送座位变化）也算在预算里
+        with self.assertNumQueries(BUDGETS[name]):
+            with self.captureOnCommitCallbacks(execute=True):
+                start = time.perf_counter()
+                response = request()
+                body = b''.join(response) if response.streaming else response.content
+            elapsed = (time.perf_counter() - start) * 1000
+        self.assertEqual(response.status_code, status, body[:200])
+        timings.setdefault(self.SIZE, {})[name] = elapsed
+        return response
+
+    # ==================== 学生 ====================
+
+    def test_student_register(self):
+        self._call('student-register', lambda: self.post_json(
+            self.client, '/api/student/register/',
+            {'username': 'newcomer', 'password': PASSWORD, 'email': 'newcomer@example.com'}
+        ), status=201)
+
+    def test_student_login(self):
+        self._call('student-login', lambda: self.post_json(
+            self.client, '/api/student/login/',
+            {'username': self.student.username, 'password': PASSWORD}
+        ))
+
+    def test_available_courses(self):
+        url = '/api/student/courses/'
+        response = self._call('student-courses', lambda: self.student_client.get(url))
+        self.assertEqual(len(response.json()['courses']), min(self.SIZE, 100))
+
+        # 目录已缓存：只查该学生的已选课程
+        self._call('student-courses-warm', lambda: self.student_client.get(url + '?limit=50'))
+
+        # 数据没变：304，不查库
+        etag = response['ETag']
+        self._call('student-courses-304', lambda: self.student_client.get(url, HTTP_IF_NONE_MATCH=etag),
+                   status=304)
+
+    def test_my_courses(self):
+        url = '/api/student/my-courses/'
+        # 课表待重建（比如批量选课之后）：按选课记录重建一次并保存
+        schedules.invalidate(self.student.id)
+        response = self._call('student-my-courses-rebuild', lambda: self.student_client.get(url))
+        self.assertEqual(len(response.json()['courses']), self._mine())
+
+        # 之后按主键查一次
+        response = self._call('student-my-courses', lambda: self.student_client.get(url))
+        self.assertEqual(len(response.json()['courses']), self._mine())
+
+        etag = response['ETag']
+        self._call('student-my-courses-304', lambda: self.student_client.get(url, HTTP_IF_NONE_MATCH=etag),
+                   status=304)
+
+    def _warm_catalog(self):
+        """学生先看过课程列表：目录里的人数已缓存，选课/退课后推送的人数不用再查库"""
+        self.student_client.get('/api/student/courses/?limit=500')
+
+    def test_enroll(self):
+        course = self.other_courses[0]
+        self._warm_catalog()
+        self._call('student-enroll', lambda: self.post_json(
+            self.student_client, '/api/student/enroll/', {'course_id': course.id}
+        ), status=201)
+        self.assertEqual(Course.objects.get(id=course.id).enrolled_count, 1)
+
+    def test_drop(self):
+        self._warm_catalog()
+        self._call('student-drop', lambda: self.post_json(
+            self.student_client, '/api/student/drop/', {'course_id': self.hot_course.id}
+        ))
+
+    def test_enroll_batch(self):
+        course_ids = [c.id for c in self.other_courses[:self.BATCH]]
+        self._warm_catalog()
+        response = self._call('student-enroll-batch', lambda: self.post_json(
+            self.student_client, '/api/student/enroll/batch/', {'course_ids': course_ids}
+        ))
+        self.assertEqual(len(response.json()['results']), len(course_ids))
+
+    def test_drop_batch(self):
+        course_ids = list(Enrollment.objects.filter(
+            student_id=self.student.id).values_list('course_id', flat=True)[:self.BATCH])
+        self._warm_catalog()
+        self._call('student-drop-batch', lambda: self.post_json(
+            self.student_client, '/api/student/drop/batch/', {'course_ids': course_ids}
+        ))
+
+    def test_waitlist(self):
+        course = self.other_courses[0]
+        Course.objects.filter(id=course.id).update(capacity=0)
+        response = self._call('student-enroll-waitlist', lambda: self.post_json(
+            self.student_client, '/api/student/enroll/', {'course_id': course.id, 'waitlist': True}
+        ), status=202)
+        self.assertEqual(response.json()['waitlist']['position'], 1)
+
+        response = self._call('student-waitlist', lambda: self.student_client.get('/api/student/waitlist/'))
+        self.assertEqual(response.json()['waitlist'][0]['course_id'], course.id)
+        self._call('student-waitlist-leave', lambda: self.post_json(
+            self.student_client, '/api/student/waitlist/leave/', {'course_id': course.id}
+        ))
+
+    @override_settings(LOTTERY={'ENABLED': True})
+    def test_preferences(self):
+        course_ids = [c.id for c in self.other_courses[:self.BATCH]]
+        self._call('student-preferences', lambda: self.post_json(
+            self.student_client, '/api/student/preferences/', {'course_ids': course_ids}
+        ))
+        response = self._call('student-preferences-get',
+                              lambda: self.student_client.get('/api/student/preferences/'))
+        self.assertEqual(response.json()['course_ids'], course_ids)
+
+    def test_seat_stream(self):
+        # 测试客户端走WSGI：不建立长连接，直接返回404
+        self._call('student-seat-stream', lambda: self.student_client.get('/api/student/seats/stream/'),
+                   status=404)
+
+    def test_logout(self):
+        self._call('logout', lambda: self.student_client.post('/api/logout/'))
+
+    def test_current_user(self):
+        self._call('current-user', lambda: self.student_client.get('/api/current-user/'))
+
+    # ==================== 教师 ====================
+
+    def test_teacher_register(self):
+        self._call('teacher-register', lambda: self.post_json(
+            self.client, '/api/teacher/register/',
+            {'username': 'newteacher', 'password': PASSWORD, 'email': 'newteacher@example.com'}
+        ), status=201)
+
+    def test_teacher_login(self):
+        self._call('teacher-login', lambda: self.post_json(
+            self.client, '/api/teacher/login/',
+            {'username': self.teacher.username, 'password': PASSWORD}
+        ))
+
+    def test_teacher_courses(self):
+        self._call('teacher-courses', lambda: self.teacher_client.get('/api/teacher/courses/'))
+
+    def test_create_course(self):
+        self._call('teacher-create-course', lambda: self.post_json(
+            self.teacher_client, '/api/teacher/courses/create/', {'name': 'new course', 'capacity': 30}
+        ), status=201)
+
+    def test_delete_course(self):
+        # 第一门课有 SIZE 个学生；只打删除标记，选课记录由后台分批清理（见 test_course_purge）
+        self._call('teacher-delete-course', lambda: self.teacher_client.delete(
+            f'/api/teacher/courses/{self.hot_course.id}/delete/'
+        ))
+        self.assertFalse(Course.objects.filter(id=self.hot_course.id).exists())
+
+    def test_course_students(self):
+        response = self._call('teacher-course-students', lambda: self.teacher_client.get(
+            f'/api/teacher/courses/{self.hot_course.id}/students/'
+        ))
+        self.assertEqual(response.json()['total'], self.SIZE)
+
+    def test_export_course_students(self):
+        self._call('teacher-course-students-export', lambda: self.teacher_client.get(
+            f'/api/teacher/courses/{self.hot_course.id}/students/export/'
+        ))
+
+
+class SmallCatalogTests(QueryBudgetMixin, ApiTestCase):
+    SIZE = 10
+
+
+class MediumCatalogTests(QueryBudgetMixin, ApiTestCase):
+    SIZE = 100
+
+
+class LargeCatalogTests(QueryBudgetMixin, ApiTestCase):
+    SIZE = 1000
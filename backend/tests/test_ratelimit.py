@@ -0,0 +1,96 @@
+"""
+写接口限流和过载保护：令牌桶、429/503 在查询数据库之前返回
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from backend import metrics, ratelimit
+from courses.models import Course
+from .base import ApiTestCase, create_student
+
+RATE_LIMIT = {
+    'ENABLED': True,
+    'IP_FACTOR': 2,
+    'RULES': {
+        'student-enroll': (0.1, 2),
+        'student-login': (0.1, 3),
+    },
+    'SHED': {'VIEWS': ['student-enroll'], 'LATENCY': 0.1, 'RETRY_AFTER': 3},
+}
+
+
+class BucketTests(SimpleTestCase):
+
+    def test_memory_bucket(self):
+        store = ratelimit.MemoryBucketStore()
+        bucket = [('k', 2, 3)]
+        self.assertEqual([store.take(bucket, now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.take(bucket, now=0), 0.5)
+        # 每秒补充2个
+        self.assertEqual(store.take(bucket, now=0.5), 0)
+        self.assertGreater(store.take(bucket, now=0.5), 0)
+
+    def test_all_or_nothing(self):
+        store = ratelimit.MemoryBucketStore()
+        store.take([('a', 1, 1)], now=0)
+        # a 空了：b 也不扣令牌
+        self.assertGreater(store.take([('a', 1, 1), ('b', 1, 1)], now=0), 0)
+        self.assertEqual(store.take([('b', 1, 1)], now=0), 0)
+
+    def test_latency_decays(self):
+        ewma = metrics.LatencyEWMA(window=1)
+        ewma.observe(1.0, now=10)
+        ewma.observe(1.0, now=12)
+        self.assertGreater(ewma.get(now=12), 0.8)
+        self.assertLess(ewma.get(now=20), 0.01)
+
+
+@override_settings(RATE_LIMIT=RATE_LIMIT)
+class RateLimitMiddlewareTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student()
+        cls.course = Course.objects.create(name='c', teacher_id=1, capacity=10)
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.reset_store(ratelimit.MemoryBucketStore())
+        self.addCleanup(ratelimit.reset_store)
+        self.login('student', 's', self.client)
+
+    def _post(self, url, data):
+        return self.post_json(self.client, url, data)
+
+    def test_user_bucket(self):
+        statuses = [self._post('/api/student/enroll/', {'course_id': 0}).status_code for _ in range(2)]
+        self.assertEqual(statuses, [404, 404])
+
+        with self.assertNumQueries(0):
+            response = self._post('/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+
+        # 读接口、没有规则的写接口不受影响
+        self.assertEqual(self.client.get('/api/student/my-courses/').status_code, 200)
+        self.assertEqual(self._post('/api/student/drop/', {'course_id': self.course.id}).status_code, 404)
+
+    def test_ip_bucket(self):
+        # 未登录的请求只有IP的桶：容量 3 * IP_FACTOR，setUp 里已经登录过一次
+        client = self.client_class()
+        statuses = [self.post_json(client, '/api/student/login/', {'username': 's', 'password': 'x'}).status_code
+                    for _ in range(6)]
+        self.assertEqual(statuses, [401] * 5 + [429])
+
+    def test_shed_when_db_slow(self):
+        with mock.patch.object(metrics, 'db_latency', return_value=0.5):
+            with self.assertNumQueries(0):
+                response = self._post('/api/student/enroll/', {'course_id': self.course.id})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '3')
+            # 退课释放座位，不拒绝
+            self.assertEqual(self._post('/api/student/drop/', {'course_id': self.course.id}).status_code, 404)
+
+        response = self._post('/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 201)
@@ -0,0 +1,102 @@
+"""
+只读副本路由：两个SQLite库分别充当主库和副本，副本上放一份“复制延迟”的旧数据，
+检查GET请求读副本、写请求和写后固定窗口内读主库，带ETag的“我的课程”始终读主库
+"""
+import time
+from unittest import mock
+
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from courses import versions
+from courses.models import Course, Enrollment, StudentSchedule
+from .base import ApiTestCase, create_student, create_teacher
+
+COOKIE = 'pin_primary'
+
+
+@override_settings(READ_REPLICAS={'DATABASES': ['replica'], 'PIN_SECONDS': 5, 'COOKIE': COOKIE})
+class ReplicaRoutingTests(ApiTestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        cls.student = create_student()
+        cls.course = Course.objects.create(name='math', teacher_id=cls.teacher.id, capacity=10)
+        # 副本：同样的账号和课程，但还没有任何选课记录
+        for obj in (cls.teacher, cls.student, cls.course):
+            obj.save(using='replica', force_insert=True)
+
+    def setUp(self):
+        super().setUp()
+        self.login('student', 's', self.client)
+        self.teacher_client = self.login('teacher', 't')
+        # 登录是写请求，同样会固定到主库；先去掉，从“很久没写过”开始
+        for client in (self.client, self.teacher_client):
+            self.assertIn(COOKIE, client.cookies)
+            del client.cookies[COOKIE]
+
+    def _teacher_course_ids(self):
+        response = self.teacher_client.get('/api/teacher/courses/')
+        self.assertEqual(response.status_code, 200)
+        return [c['id'] for c in response.json()['courses']]
+
+    def _create_course(self):
+        response = self.post_json(self.teacher_client, '/api/teacher/courses/create/', {'name': 'physics'})
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_reads_go_to_replica(self):
+        # 新课程只在主库上，副本还没复制过来
+        Course.objects.create(name='physics', teacher_id=self.teacher.id, capacity=10)
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(self._teacher_course_ids(), [self.course.id])
+        self.assertFalse([q for q in queries if q['sql'].lstrip().upper().startswith('SELECT')])
+
+    def test_my_courses_read_from_primary(self):
+        # 候补转正、删除课程等由别人触发的写入：学生自己没有固定到主库，版本号已经换了
+        Enrollment.objects.create(student_id=self.student.id, course_id=self.course.id)
+        versions.bump_seats(self.student.id)
+        response = self.client.get('/api/student/my-courses/')
+        self.assertEqual([c['course_id'] for c in response.json()['courses']], [self.course.id])
+        # 按新ETag返回的是主库上的数据，重建结果也按主库保存
+        self.assertEqual(StudentSchedule.objects.using('replica').count(), 0)
+        self.assertIn(str(self.course.id), StudentSchedule.objects.get(student_id=self.student.id).courses)
+
+        response = self.client.get('/api/student/courses/')
+        self.assertTrue(response.json()['courses'][0]['is_enrolled'])
+
+    def test_write_pins_client_to_primary(self):
+        response = self._create_course()
+        self.assertIn(COOKIE, response.cookies)
+        new_id = response.json()['course']['id']
+        self.assertEqual(self._teacher_course_ids(), [self.course.id, new_id])
+
+        # 固定窗口过去后回到副本（副本上仍是旧数据）
+        with mock.patch('backend.replicas.time.time', return_value=time.time() + 10):
+            self.assertEqual(self._teacher_course_ids(), [self.course.id])
+
+    def test_pin_cookie_not_rounded_up(self):
+        # 到期时间四舍五入到毫秒会比 now + PIN_SECONDS 多一点，被当成伪造的时间戳
+        with mock.patch('backend.replicas.time.time', return_value=1000.0006):
+            self._create_course()
+            self.assertEqual(len(self._teacher_course_ids()), 2)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.post_json(self.client, '/api/student/enroll/', {'course_id': 0})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(COOKIE, response.cookies)
+
+    def test_forged_pin_is_ignored(self):
+        Course.objects.create(name='physics', teacher_id=self.teacher.id, capacity=10)
+        self.teacher_client.cookies[COOKIE] = str(time.time() + 3600)
+        self.assertEqual(self._teacher_course_ids(), [self.course.id])
+
+    def test_catalog_cache_built_from_primary(self):
+        # 新课程只在主库上；目录缓存重建时读主库，不会把副本上的旧目录缓存到新版本下
+        new = Course.objects.create(name='physics', teacher_id=self.teacher.id, capacity=10)
+        versions.bump_catalog()
+        response = self.client.get('/api/student/courses/')
+        self.assertEqual([c['id'] for c in response.json()['courses']], [self.course.id, new.id])
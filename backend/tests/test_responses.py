@@ -0,0 +1,39 @@
+"""
+FastJsonResponse：orjson 和标准库两条路径输出一致，datetime 按原来的格式输出
+"""
+import datetime
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from backend import responses
+from backend.responses import FastJsonResponse
+
+
+class FastJsonResponseTests(SimpleTestCase):
+    data = {
+        'courses': [
+            {'id': 1, 'name': '高等数学', 'is_full': False,
+             'created_at': datetime.datetime(2024, 9, 1, 8, 30, 5, 123456, tzinfo=datetime.timezone.utc)},
+            {'id': 2, 'name': 'Python', 'is_full': True,
+             'created_at': datetime.datetime(2024, 9, 2, 18, 0, 0)},
+        ],
+        'next_cursor': None,
+    }
+
+    def test_datetime_format(self):
+        response = FastJsonResponse(self.data)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        body = json.loads(response.content)
+        self.assertEqual(body['courses'][0]['created_at'], '2024-09-01 08:30:05')
+        self.assertEqual(body['courses'][1]['created_at'], '2024-09-02 18:00:00')
+
+    def test_stdlib_fallback_matches(self):
+        fast = FastJsonResponse(self.data).content
+        with mock.patch.object(responses, 'orjson', None):
+            fallback = FastJsonResponse(self.data).content
+        self.assertEqual(json.loads(fast), json.loads(fallback))
+
+    def test_status(self):
+        self.assertEqual(FastJsonResponse({'error': 'x'}, status=404).status_code, 404)
@@ -0,0 +1,108 @@
+"""
+学生课表（“我的课程”的物化结果）：单门选课/退课增量更新、批量写入标记待重建、
+删除课程后后台清理只重建选了这门课的学生、重建期间有写入时不保存
+"""
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from courses import purge, schedules, seats, versions
+from courses.models import Course, Enrollment, StudentSchedule
+from .base import ApiTestCase, create_student, create_teacher
+
+
+class ScheduleTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.courses = [Course.objects.create(name=f'c{i}', teacher_id=teacher.id, capacity=5) for i in range(3)]
+        cls.student = create_student()
+
+    def _course_ids(self):
+        return [row['course_id'] for row in json.loads(schedules.get_json(self.student.id))]
+
+    def _stored(self):
+        return StudentSchedule.objects.get(student_id=self.student.id)
+
+    def test_incremental(self):
+        self.assertEqual(self._course_ids(), [])
+        for course in self.courses[:2]:
+            seats.enroll(self.student.id, course.id)
+        seats.release(self.student.id, self.courses[0].id)
+
+        # 增量更新过的课表有效，只查一次
+        with self.assertNumQueries(1):
+            rows = json.loads(schedules.get_json(self.student.id))
+        self.assertEqual([row['course_id'] for row in rows], [self.courses[1].id])
+        self.assertEqual(rows[0]['teacher'], 't')
+        self.assertEqual(self._stored().generation, 3)
+
+    def test_seat_update_last(self):
+        self.assertEqual(self._course_ids(), [])
+        with CaptureQueriesContext(connection) as queries:
+            seats.enroll(self.student.id, self.courses[0].id)
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        # 热门课程的行锁从条件UPDATE开始持有到提交，课表在它之前改完
+        self.assertTrue(statements[-1].startswith('UPDATE "courses"'), statements[-1])
+
+        # 没占到座位：课表的修改随事务回滚
+        Course.objects.filter(id=self.courses[1].id).update(capacity=0)
+        generation = self._stored().generation
+        self.assertEqual(seats.enroll(self.student.id, self.courses[1].id)[0], seats.FULL)
+        self.assertEqual(self._stored().generation, generation)
+        self.assertEqual(self._course_ids(), [self.courses[0].id])
+
+    def test_batch_invalidates(self):
+        self.assertEqual(self._course_ids(), [])
+        seats.enroll_many(self.student.id, [c.id for c in self.courses])
+        self.assertIsNone(self._stored().courses)
+        self.assertEqual(sorted(self._course_ids()), sorted(c.id for c in self.courses))
+        self.assertIsNotNone(self._stored().courses)
+
+    def test_course_delete_rebuilds_affected(self):
+        other = create_student('s2')
+        seats.enroll(self.student.id, self.courses[0].id)
+        seats.enroll(self.student.id, self.courses[1].id)
+        seats.enroll(other.id, self.courses[1].id)
+        self.assertEqual(len(self._course_ids()), 2)
+        schedules.get_json(other.id)
+
+        # 创建课程换了目录版本号，但课表仍然有效
+        with self.captureOnCommitCallbacks(execute=True):
+            versions.bump_catalog()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self._course_ids()), 2)
+
+        # 删除课程：后台清理只把选了这门课的学生标记为重建，换了他的版本号
+        etag = versions.get(versions.student(self.student.id))
+        Course.objects.filter(id=self.courses[0].id).update(deleted_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            purge.purge_course(self.courses[0].id, sleep=0)
+        self.assertNotEqual(versions.get(versions.student(self.student.id)), etag)
+        self.assertEqual(self._course_ids(), [self.courses[1].id])
+        self.assertIsNotNone(StudentSchedule.objects.get(student_id=other.id).courses)
+
+    def test_stale_rebuild_not_saved(self):
+        Enrollment.objects.create(student_id=self.student.id, course_id=self.courses[0].id)
+        schedules.invalidate(self.student.id)
+        generation = self._stored().generation
+
+        # 重建期间有一次选课写过这一行：重建结果不保存，以那次写入为准
+        schedules._store(self.student.id, generation - 1, '[]')
+        self.assertIsNone(self._stored().courses)
+        schedules._store(self.student.id, generation, '[]')
+        self.assertEqual(self._stored().courses, '[]')
+
+    def test_rebuild_command(self):
+        Enrollment.objects.create(student_id=self.student.id, course_id=self.courses[2].id)
+        StudentSchedule.objects.create(student_id=self.student.id + 100, courses='[]')
+
+        call_command('rebuild_schedules', stdout=StringIO())
+        self.assertEqual(list(StudentSchedule.objects.values_list('student_id', flat=True)), [self.student.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(self._course_ids(), [self.courses[2].id])
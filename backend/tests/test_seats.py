@@ -0,0 +1,106 @@
+"""
+占座：并发选课不超卖、同一学生同一门课只有一条选课记录；已选过的学生在课程满时仍提示已选
+"""
+import threading
+import time
+
+from django.db import OperationalError, connections
+from django.test import TransactionTestCase
+
+from courses import seats
+from courses.models import Course, Enrollment
+from .base import ApiTestCase, clear_caches, create_student, create_teacher
+
+
+def _retry(fn, *args):
+    """SQLite 同一时刻只允许一个写事务，表被锁时整个事务已回滚，重试即可（MySQL 上是行锁等待）"""
+    for _ in range(200):
+        try:
+            return fn(*args)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            time.sleep(0.001)
+    raise AssertionError('写事务一直拿不到锁')
+
+
+class ConcurrentEnrollTests(TransactionTestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    def _race(self, course, student_ids):
+        """所有线程同时开始选同一门课，返回各自的结果"""
+        barrier = threading.Barrier(len(student_ids))
+        results = []
+
+        def run(student_id):
+            try:
+                barrier.wait()
+                results.append(_retry(seats.enroll, student_id, course.id)[0])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(student_id,)) for student_id in student_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _check(self, course):
+        course.refresh_from_db()
+        pairs = list(Enrollment.objects.values_list('student_id', 'course_id'))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertLessEqual(course.enrolled_count, course.capacity)
+        self.assertEqual(course.enrolled_count, len(pairs))
+
+    def test_no_oversell(self):
+        course = Course.objects.create(name='hot', teacher_id=1, capacity=5)
+        # 15个学生、每人两个请求同时选课
+        results = self._race(course, [i % 15 + 1 for i in range(30)])
+
+        self.assertEqual(results.count(seats.ENROLLED), 5)
+        self.assertEqual(len(results), 30)
+        self._check(course)
+
+    def test_duplicate_requests(self):
+        course = Course.objects.create(name='big', teacher_id=1, capacity=100)
+        results = self._race(course, [1] * 10)
+
+        self.assertEqual(results.count(seats.ENROLLED), 1)
+        self.assertEqual(results.count(seats.ALREADY_ENROLLED), 9)
+        self._check(course)
+
+
+class EnrollViewTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.student = create_student()
+        cls.course = Course.objects.create(name='c', teacher_id=teacher.id, capacity=1)
+
+    def test_already_enrolled_before_full(self):
+        seats.enroll(self.student.id, self.course.id)
+        client = self.login('student', 's')
+        response = self.post_json(client, '/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], '您已经选过这门课了')
+
+        other = self.login('student', create_student('s2').username)
+        response = self.post_json(other, '/api/student/enroll/', {'course_id': self.course.id})
+        self.assertEqual(response.json()['error'], '课程已满')
+
+    def test_drop_invalid_course_id(self):
+        client = self.login('student', 's')
+        for url, missing in (('/api/student/drop/', '未找到选课记录'), ('/api/student/waitlist/leave/', '未找到候补记录')):
+            with self.subTest(url=url):
+                response = self.post_json(client, url, {})
+                self.assertEqual((response.status_code, response.json()['error']), (404, missing))
+                for course_id in ('x', 1.5, True, [1]):
+                    self.assertEqual(self.post_json(client, url, {'course_id': course_id}).status_code, 400)
+        # 数字字符串照常处理
+        seats.enroll(self.student.id, self.course.id)
+        response = self.post_json(client, '/api/student/drop/', {'course_id': str(self.course.id)})
+        self.assertEqual(response.status_code, 200)
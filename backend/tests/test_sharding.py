@@ -0,0 +1,119 @@
+"""
+选课记录分库：两个SQLite库充当分片，课程、学生仍在 default
+"""
+import threading
+from contextvars import ContextVar
+
+from django.test import SimpleTestCase, override_settings
+
+from courses import purge, seats, sharding
+from courses.models import Course, Enrollment
+from .base import ApiTestCase, create_student, create_teacher
+
+SHARDS = {'DATABASES': ['shard0', 'shard1'], 'WORKERS': 0}
+
+
+@override_settings(ENROLLMENT_SHARDS=SHARDS)
+class ShardedEnrollmentTests(ApiTestCase):
+    databases = {'default', 'shard0', 'shard1'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        cls.student = create_student()
+        cls.courses = [Course.objects.create(name=f'c{i}', teacher_id=cls.teacher.id, capacity=5)
+                       for i in range(4)]
+        cls.course_ids = [c.id for c in cls.courses]
+
+    def setUp(self):
+        super().setUp()
+        self.login('student', 's', self.client)
+
+    def _rows(self, alias):
+        return sorted(Enrollment.objects.using(alias).values_list('course_id', flat=True))
+
+    def _counts(self):
+        return list(Course.objects.filter(id__in=self.course_ids).order_by('id')
+                    .values_list('enrolled_count', flat=True))
+
+    def test_enroll_routes_by_course(self):
+        for course_id in self.course_ids:
+            response = self.post_json(self.client, '/api/student/enroll/', {'course_id': course_id})
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self._rows('shard0'), [c for c in self.course_ids if c % 2 == 0])
+        self.assertEqual(self._rows('shard1'), [c for c in self.course_ids if c % 2 == 1])
+        self.assertEqual(self._rows('default'), [])
+        self.assertEqual(self._counts(), [1, 1, 1, 1])
+
+        # 按学生的查询合并所有分片
+        mine = self.client.get('/api/student/my-courses/').json()['courses']
+        self.assertEqual(sorted(c['course_id'] for c in mine), self.course_ids)
+        catalog = self.client.get('/api/student/courses/').json()['courses']
+        self.assertTrue(all(c['is_enrolled'] for c in catalog))
+
+    def test_duplicate_and_full(self):
+        course = self.courses[0]
+        self.assertEqual(seats.enroll(self.student.id, course.id)[0], seats.ENROLLED)
+        self.assertEqual(seats.enroll(self.student.id, course.id)[0], seats.ALREADY_ENROLLED)
+
+        full = self.courses[1]
+        Course.objects.filter(id=full.id).update(enrolled_count=full.capacity)
+        self.assertEqual(seats.enroll(self.student.id, full.id)[0], seats.FULL)
+        # 分片上插入的记录随计数器一起回滚
+        self.assertFalse(sharding.for_course(full.id).filter(course_id=full.id).exists())
+        self.assertEqual(self._counts()[:2], [1, full.capacity])
+
+    def test_drop(self):
+        course_id = self.course_ids[1]
+        seats.enroll(self.student.id, course_id)
+        response = self.post_json(self.client, '/api/student/drop/', {'course_id': course_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._rows(sharding.shard_for(course_id)), [])
+        self.assertEqual(self._counts()[1], 0)
+
+    def test_batch_across_shards(self):
+        response = self.post_json(self.client, '/api/student/enroll/batch/', {'course_ids': self.course_ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self._rows('shard0')) + len(self._rows('shard1')), 4)
+        self.assertEqual(self._counts(), [1, 1, 1, 1])
+
+        response = self.post_json(self.client, '/api/student/drop/batch/', {'course_ids': self.course_ids[:3]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._rows('shard0') + self._rows('shard1'), self.course_ids[3:])
+        self.assertEqual(self._counts(), [0, 0, 0, 1])
+
+    def test_recount_roster_and_purge(self):
+        course = self.courses[2]
+        seats.enroll(self.student.id, course.id)
+        Course.objects.filter(id=course.id).update(enrolled_count=0)
+        self.assertEqual(seats.recount(), 1)
+        self.assertEqual(self._counts()[2], 1)
+
+        teacher = self.login('teacher', 't')
+        roster = teacher.get(f'/api/teacher/courses/{course.id}/students/').json()['students']
+        self.assertEqual([s['id'] for s in roster], [self.student.id])
+
+        Course.objects.filter(id=course.id).update(deleted_at='2024-01-01 00:00:00')
+        self.assertEqual(purge.purge_course(course.id, sleep=0), 1)
+        self.assertEqual(self._rows(sharding.shard_for(course.id)), [])
+
+
+class ScatterTests(SimpleTestCase):
+    marker = ContextVar('marker', default=None)
+
+    @override_settings(ENROLLMENT_SHARDS={'DATABASES': ['shard0', 'shard1'], 'WORKERS': 2})
+    def test_parallel_with_context(self):
+        token = self.marker.set('request')
+        try:
+            results = sharding.scatter(lambda alias: (threading.current_thread().name, self.marker.get()))
+        finally:
+            self.marker.reset(token)
+        self.assertEqual(set(results), {'shard0', 'shard1'})
+        for thread_name, marker in results.values():
+            self.assertTrue(thread_name.startswith('shard'))
+            self.assertEqual(marker, 'request')
+
+    def test_unsharded(self):
+        self.assertEqual(sharding.aliases(), [None])
+        self.assertEqual(sharding.group([3, 1, 2]), {None: [3, 1, 2]})
@@ -0,0 +1,31 @@
+"""
+数据版本号：多进程部署时必须放在共享缓存里
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from courses import versions
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+REDIS = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES=LOCMEM)
+    def test_local_cache_with_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            versions.check_shared_cache()
+
+    @override_settings(WEB_CONCURRENCY=1, MULTI_HOST=True, CACHES=LOCMEM)
+    def test_local_cache_multi_host(self):
+        with self.assertRaises(ImproperlyConfigured):
+            versions.check_shared_cache()
+
+    @override_settings(WEB_CONCURRENCY=1, MULTI_HOST=False, CACHES=LOCMEM)
+    def test_single_process(self):
+        versions.check_shared_cache()
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES=REDIS)
+    def test_shared_cache(self):
+        versions.check_shared_cache()
@@ -0,0 +1,101 @@
+"""
+候补队列：排位、退课自动转正（座位直接转给队首，计数器不变）、退出候补
+"""
+from django.test import TestCase, override_settings
+
+from courses import seats, sharding
+from courses.models import Course, Enrollment, WaitlistEntry
+from .base import ApiTestCase, create_students, create_teacher
+
+
+class WaitlistTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = create_teacher()
+        cls.course = Course.objects.create(name='hot', teacher_id=teacher.id, capacity=1)
+        cls.students = create_students(3)
+
+    def setUp(self):
+        super().setUp()
+        self.clients = [self.login('student', student.username) for student in self.students]
+
+    def _enroll(self, i, waitlist=True):
+        return self.post_json(self.clients[i], '/api/student/enroll/',
+                              {'course_id': self.course.id, 'waitlist': waitlist})
+
+    def _count(self):
+        return Course.objects.get(id=self.course.id).enrolled_count
+
+    def test_queue_and_promotion(self):
+        self.assertEqual(self._enroll(0).status_code, 201)
+        self.assertEqual(self._enroll(1, waitlist=False).json()['error'], '课程已满')
+
+        response = self._enroll(1)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['waitlist']['position'], 1)
+        self.assertEqual(self._enroll(2).json()['waitlist']['position'], 2)
+
+        response = self._enroll(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['position'], 1)
+        self.assertEqual(self._enroll(0).json()['error'], '您已经选过这门课了')
+
+        # 退课：队首转正，座位数不变，后面的人排位前移
+        self.post_json(self.clients[0], '/api/student/drop/', {'course_id': self.course.id})
+        self.assertEqual(list(Enrollment.objects.values_list('student_id', flat=True)), [self.students[1].id])
+        self.assertEqual(self._count(), 1)
+        waitlist = self.clients[2].get('/api/student/waitlist/').json()['waitlist']
+        self.assertEqual(waitlist, [{'course_id': self.course.id, 'course_name': 'hot', 'position': 1}])
+        mine = self.clients[1].get('/api/student/my-courses/').json()['courses']
+        self.assertEqual([c['course_id'] for c in mine], [self.course.id])
+
+        # 批量退课同样转正
+        self.post_json(self.clients[1], '/api/student/drop/batch/', {'course_ids': [self.course.id]})
+        self.assertEqual(list(Enrollment.objects.values_list('student_id', flat=True)), [self.students[2].id])
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+        # 队列为空时才归还座位
+        self.post_json(self.clients[2], '/api/student/drop/', {'course_id': self.course.id})
+        self.assertEqual(self._count(), 0)
+
+    def test_leave(self):
+        seats.enroll(self.students[0].id, self.course.id)
+        self._enroll(1)
+        url = '/api/student/waitlist/leave/'
+        self.assertEqual(self.post_json(self.clients[1], url, {'course_id': self.course.id}).status_code, 200)
+        self.assertEqual(self.post_json(self.clients[1], url, {'course_id': self.course.id}).status_code, 404)
+
+        seats.release(self.students[0].id, self.course.id)
+        self.assertEqual(self._count(), 0)
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_seat_freed_while_joining(self):
+        # 判断已满之后、入队之前座位空了出来：入队后直接转正
+        self.assertEqual(seats.join_waitlist(self.students[0].id, self.course.id), (seats.ENROLLED, None))
+        self.assertEqual(self._count(), 1)
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+
+@override_settings(ENROLLMENT_SHARDS={'DATABASES': ['shard0', 'shard1'], 'WORKERS': 0})
+class ShardedWaitlistTests(TestCase):
+    databases = {'default', 'shard0', 'shard1'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.courses = [Course.objects.create(name=f'c{i}', teacher_id=1, capacity=1) for i in range(2)]
+
+    def test_promotion_on_shard(self):
+        for course in self.courses:
+            seats.enroll(1, course.id)
+            self.assertEqual(seats.join_waitlist(2, course.id), (seats.WAITLISTED, 1))
+            self.assertEqual(seats.join_waitlist(3, course.id), (seats.WAITLISTED, 2))
+        self.assertEqual([c for c, _ in seats.student_waitlist(3)], [c.id for c in self.courses])
+
+        seats.release_many(1, [c.id for c in self.courses])
+        for course in self.courses:
+            shard = sharding.shard_for(course.id)
+            self.assertEqual(list(Enrollment.objects.using(shard).filter(course_id=course.id)
+                                  .values_list('student_id', flat=True)), [2])
+        self.assertEqual(seats.student_waitlist(3), [(c.id, 1) for c in self.courses])
+        self.assertEqual(set(Course.objects.values_list('enrolled_count', flat=True)), {1})